@@ -0,0 +1,81 @@
+"""
+Benchmark of the compression of large request bodies, e.g. the filelist of a
+PUT: the size of the body sent, and the time taken to build and compress it,
+for no compression, gzip and (if the zstandard library is installed) zstd.
+The time to send the body over a link of **--bandwidth** MB/s is estimated
+from its size.
+
+    python benchmarks/bench_compression.py --files 1000000 --bandwidth 10
+
+"""
+
+import os
+import time
+import argparse
+
+os.environ.setdefault("USER", "benchmark")
+
+from jdma_client import jdma_lib
+
+
+def filelist(n_files):
+    """A filelist with paths typical of a group workspace"""
+    return [
+        "/gws/nopw/j04/project/data/run{:03d}/year{:04d}/"
+        "variable_{:02d}_{:08d}.nc".format(i % 100, 1950 + i % 70, i % 40, i)
+        for i in range(n_files)
+    ]
+
+
+def build_body(files):
+    data = {"name" : "benchmark", "request_type" : "PUT",
+            "workspace" : "workspace", "filelist" : files,
+            "label" : "benchmark", "storage" : "elastictape",
+            "credentials" : {}}
+    return jdma_lib._json_body(data)
+
+
+def body_size(body):
+    if isinstance(body, bytes):
+        return len(body)
+    body.seek(0, os.SEEK_END)
+    size = body.tell()
+    body.close()
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--files", type=int, default=1000000)
+    parser.add_argument("--bandwidth", type=float, default=10.0,
+                        help="link bandwidth, in MB/s, to estimate the time "
+                             "to send the body")
+    args = parser.parse_args()
+
+    files = filelist(args.files)
+    compressions = [None, "gzip"]
+    if jdma_lib.zstandard is not None:
+        compressions.append("zstd")
+    print("{:>6} {:>12} {:>7} {:>10} {:>10} {:>10}".format(
+        "codec", "bytes", "ratio", "build s", "send s", "total s"
+    ))
+    raw_size = None
+    for compression in compressions:
+        start = time.perf_counter()
+        body = build_body(files)
+        body, headers = jdma_lib._compress_body(
+            body, compression, jdma_lib.COMPRESS_THRESHOLD
+        )
+        size = body_size(body)
+        elapsed = time.perf_counter() - start
+        if raw_size is None:
+            raw_size = size
+        send = size / (args.bandwidth * 1024 * 1024)
+        print("{:>6} {:>12} {:>7.2f} {:>10.2f} {:>10.2f} {:>10.2f}".format(
+            str(compression), size, raw_size / size, elapsed, send,
+            elapsed + send
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Benchmark of the latency of the calls to the JDMA HTTP API, against a local
+stub server, comparing:
+
+  - ``requests.get`` : a new connection for every call, as the module level
+    functions of jdma_lib made before they shared a pooled session
+  - ``no keep-alive`` : a JdmaClient with **keep_alive=False**
+  - ``pooled`` : a JdmaClient with a pooled, keep-alive session, as used by
+    the module level functions of jdma_lib
+
+With **--tls** the stub server uses HTTPS, with a self signed certificate
+made by the ``openssl`` command, so the cost of the TLS handshake, which
+dominates against a remote server, is included.
+
+    python benchmarks/bench_latency.py --calls 1000 --tls
+
+"""
+
+import os
+import ssl
+import json
+import time
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ.setdefault("USER", "benchmark")
+
+import urllib3
+import requests
+
+from jdma_client.jdma_lib import JdmaClient
+
+REQUEST = json.dumps({
+    "request_id" : 1, "user" : "benchmark", "request_type" : 0,
+    "migration_id" : 1, "workspace" : "workspace", "label" : "label",
+    "storage" : "elastictape", "date" : "2020-01-01T00:00:00", "stage" : 2
+}).encode("utf-8")
+
+
+class Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1, so that the connections can be kept alive
+    protocol_version = "HTTP/1.1"
+    # the headers and the body are written separately: without TCP_NODELAY
+    # the kept alive connections stall on the delayed ACK of the client
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(REQUEST)))
+        self.end_headers()
+        self.wfile.write(REQUEST)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(tls, tmp_dir):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    scheme = "http"
+    if tls:
+        cert = os.path.join(tmp_dir, "cert.pem")
+        key = os.path.join(tmp_dir, "key.pem")
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+             "-keyout", key, "-out", cert, "-days", "1",
+             "-subj", "/CN=127.0.0.1"],
+            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = "https"
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, "{}://127.0.0.1:{}/api/v1/".format(
+        scheme, server.server_port
+    )
+
+
+def time_calls(call, n_calls):
+    """Time each of n_calls calls, in milliseconds"""
+    times = []
+    for i in range(n_calls):
+        start = time.perf_counter()
+        response = call()
+        response.content
+        times.append((time.perf_counter() - start) * 1000.0)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--calls", type=int, default=1000)
+    parser.add_argument("--tls", action="store_true", default=False)
+    args = parser.parse_args()
+    # the certificate of the stub server is self signed
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        server, api_url = start_server(args.tls, tmp_dir)
+        url = api_url + "request?name=benchmark&request_id=1"
+        unpooled = JdmaClient(api_url=api_url, user="benchmark", verify=False,
+                              keep_alive=False)
+        pooled = JdmaClient(api_url=api_url, user="benchmark", verify=False)
+        calls = (
+            ("requests.get", lambda: requests.get(url, verify=False)),
+            ("no keep-alive",
+             lambda: unpooled.get_request("benchmark", req_id=1)),
+            ("pooled", lambda: pooled.get_request("benchmark", req_id=1)),
+        )
+        print("{} calls over {}".format(
+            args.calls, "HTTPS" if args.tls else "HTTP"
+        ))
+        print("{:<14} {:>9} {:>9} {:>9} {:>10}".format(
+            "", "mean ms", "p50 ms", "p99 ms", "calls/s"
+        ))
+        for name, call in calls:
+            # warm up
+            time_calls(call, 10)
+            times = time_calls(call, args.calls)
+            times.sort()
+            print("{:<14} {:>9.3f} {:>9.3f} {:>9.3f} {:>10.0f}".format(
+                name, statistics.mean(times), times[len(times) // 2],
+                times[int(len(times) * 0.99)],
+                1000.0 / statistics.mean(times)
+            ))
+        pooled.close()
+        unpooled.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Benchmark of the rendering of a files listing by the jdma command line tool,
+in rows per second, for a synthetic listing written to ``/dev/null``,
+comparing:
+
+  - ``before`` : several ``sys.stdout.write`` calls per row, with the row
+    format built for each row, as ``display_files`` did before it rendered
+    through :class:`jdma_table.TableWriter`
+  - ``after`` : ``jdma.display_files``, to ``/dev/null``, so without colour
+  - ``after (colour)`` : ``jdma.display_files``, as if to a terminal, so with
+    the same escape codes as ``before``
+
+    python benchmarks/bench_render.py --files 200000 --digest
+
+"""
+
+import os
+import sys
+import math
+import time
+import argparse
+
+os.environ.setdefault("USER", "benchmark")
+
+from jdma_client import jdma
+from jdma_client.jdma_common import bcolors, unit_list
+
+
+def listing_records(n_files, files_per_archive, digest):
+    """The (batch, archive, file) records of a listing of n_files files"""
+    batch = {
+        "migration_id" : 1, "user" : "benchmark", "workspace" : "workspace",
+        "label" : "batch label", "storage" : "elastictape"
+    }
+    records = []
+    for i in range(0, n_files, files_per_archive):
+        archive = {"archive_id" : "1/archive_{:06d}".format(i)}
+        for j in range(i, min(i + files_per_archive, n_files)):
+            f = {"path" : "/gws/nopw/j04/workspace/data/file_{:08d}.nc".format(j),
+                 "size" : j * 1024}
+            if digest:
+                f["digest_format"] = "SHA256"
+                f["digest"] = "{:064x}".format(j)
+            records.append((batch, archive, f))
+    return records
+
+##### The rendering before TableWriter                                     #####
+
+def old_sizeof_fmt(num):
+    if num > 1:
+        exponent = min(int(math.log(num, 1024)), len(unit_list) - 1)
+        quotient = float(num) / 1024**exponent
+        unit, num_decimals = unit_list[exponent]
+        format_string = '{:>5.%sf} {}' % (num_decimals)
+        return format_string.format(quotient, unit)
+    elif num == 1:
+        return '1 byte'
+    else:
+        return '0 bytes'
+
+
+def old_display_files(records, args):
+    n_files = 0
+    previous = None
+    current = None
+    for record in records:
+        if current is None:
+            if args.simple != True:
+                sys.stdout.write(bcolors.MAGENTA)
+                sys.stdout.write((
+                    "{:>5} {:<16} {:<12} {:<12} {:<12} {:<18} {:<64} {:>8}"
+                ).format("b.id", "user", "workspace", "batch label",
+                         "storage", "archive", "file", "size"))
+                if args.digest == True:
+                    sys.stdout.write(("{:<72}").format(" digest"))
+                sys.stdout.write("\n"+bcolors.ENDC)
+        else:
+            old_display_file(previous, current, record, args)
+        previous = current
+        current = record
+        n_files += 1
+    if current is not None:
+        old_display_file(previous, current, None, args)
+    return n_files
+
+
+def old_display_file(previous, current, following, args):
+    r, a, f = current
+    if args.simple == True:
+        sys.stdout.write("{}\n".format(f["path"]))
+        return
+    first_in_archive = previous is None or previous[1] is not a
+    first_in_batch = previous is None or previous[0] is not r
+    last_in_archive = following is None or following[1] is not a
+    last_in_batch = following is None or following[0] is not r
+
+    fname = f["path"][-64:]
+    size = old_sizeof_fmt(f["size"])[0:8]
+    if last_in_batch:
+        sys.stdout.write(bcolors.UNDERLINE)
+    if last_in_archive and not first_in_archive:
+        ULA = bcolors.UNDERLINE
+    else:
+        ULA = ""
+    if first_in_batch:
+        M = r["migration_id"]
+        U = r["user"][0:16]
+        W = r["workspace"][0:12]
+        L = r["label"][0:12]
+        S = r["storage"][0:12]
+    else:
+        M = ""
+        U = ""
+        W = ""
+        L = ""
+        S = ""
+    if first_in_archive:
+        A = a["archive_id"][0:20]
+    else:
+        A = ""
+
+    sys.stdout.write((
+        "{:>5} {:<16} {:<12} {:<12} {:<12}" + ULA + " {:<18} {:<64} {:>8}"
+    ).format(M, U, W, L, S, A,
+             fname,
+             size))
+    if args.digest == True:
+        sys.stdout.write(("{:>8}:{:<64}").format(
+            f["digest_format"],
+            f["digest"]
+        ))
+    sys.stdout.write(bcolors.ENDC+"\n")
+
+##### Benchmark                                                            #####
+
+class Terminal(object):
+    """A file that claims to be a terminal, so that colour is output"""
+    def __init__(self, out):
+        self.out = out
+        self.write = out.write
+        self.flush = out.flush
+
+    def isatty(self):
+        return True
+
+
+def time_renders(renders, records, args):
+    """The best time, in seconds, of args.runs renders of the records by each
+       of the renders.  The renders take turns, so that they are timed under
+       the same load."""
+    best = [None] * len(renders)
+    stdout = sys.stdout
+    try:
+        for i in range(args.runs):
+            for j, (name, display, out) in enumerate(renders):
+                sys.stdout = out
+                start = time.perf_counter()
+                display(records, args)
+                t = time.perf_counter() - start
+                if best[j] is None or t < best[j]:
+                    best[j] = t
+    finally:
+        sys.stdout = stdout
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--files", type=int, default=200000)
+    parser.add_argument("--files-per-archive", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--digest", action="store_true", default=False)
+    parser.add_argument("--simple", action="store_true", default=False)
+    args = parser.parse_args()
+
+    records = listing_records(args.files, args.files_per_archive, args.digest)
+    with open(os.devnull, "w") as devnull:
+        renders = (
+            ("before", old_display_files, devnull),
+            ("after", jdma.display_files, devnull),
+            ("after (colour)", jdma.display_files, Terminal(devnull)),
+        )
+        print("{} files, digest={}, simple={}, best of {} runs".format(
+            args.files, args.digest, args.simple, args.runs
+        ))
+        print("{:<16} {:>9} {:>12}".format("", "s", "rows/s"))
+        best = time_renders(renders, records, args)
+        for (name, display, out), t in zip(renders, best):
+            print("{:<16} {:>9.3f} {:>12.0f}".format(
+                name, t, args.files / t
+            ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark of the start up time of the jdma command line tool, for a command
+that does not contact the JDMA server (``jdma help``).  The command is run
+**--runs** times, in new interpreters, and the wall clock times reported.  It
+is then run once with ``python -X importtime`` to report the slowest imports
+and check that the heavy modules (requests, urllib3, jinja2) are not imported.
+
+The exit status is 1 if the median time exceeds **--target** milliseconds or
+a heavy module is imported, so the script can be used to catch regressions:
+
+    python benchmarks/bench_startup.py --runs 20 --target 100
+
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+# the modules that should only be imported by the commands that need them
+HEAVY_MODULES = ("requests", "urllib3", "jinja2", "jdma_client.jdma_lib")
+
+# run the command line tool, in the same way as the jdma entry point
+COMMAND = ("import sys; sys.argv = ['jdma'] + sys.argv[1:]; "
+           "from jdma_client.jdma import main; main()")
+
+
+def run(args, python_args=()):
+    """Run the jdma command in a new interpreter, returning its stderr"""
+    env = dict(os.environ)
+    env.setdefault("USER", "benchmark")
+    # run against the source tree, unless the client is installed
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (root, env.get("PYTHONPATH")) if p
+    )
+    result = subprocess.run(
+        [sys.executable] + list(python_args) + ["-c", COMMAND] + args,
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
+    return result.stderr
+
+
+def import_times(stderr):
+    """Parse the output of -X importtime into (module, cumulative us)"""
+    times = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        times.append((module.strip(), int(cumulative_us)))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--target", type=float, default=100.0,
+                        help="target median start up time, in milliseconds")
+    parser.add_argument("command", nargs="*", default=["help"],
+                        help="the jdma command to run, default: help")
+    args = parser.parse_args()
+
+    # warm the file system cache and the bytecode cache
+    run(args.command)
+    times = []
+    for i in range(args.runs):
+        start = time.perf_counter()
+        run(args.command)
+        times.append((time.perf_counter() - start) * 1000.0)
+    baseline = []
+    for i in range(args.runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"])
+        baseline.append((time.perf_counter() - start) * 1000.0)
+
+    median = statistics.median(times)
+    print("jdma {} : median {:.1f} ms, min {:.1f} ms, max {:.1f} ms over {} "
+          "runs".format(" ".join(args.command), median, min(times),
+                        max(times), args.runs))
+    print("python -c pass : median {:.1f} ms, so jdma adds {:.1f} ms".format(
+        statistics.median(baseline), median - statistics.median(baseline)
+    ))
+
+    imports = import_times(run(args.command, ["-X", "importtime"]))
+    print("slowest imports (cumulative):")
+    for module, us in sorted(imports, key=lambda m: -m[1])[:10]:
+        print("  {:>8.1f} ms  {}".format(us / 1000.0, module))
+
+    failed = False
+    imported = set(m for m, us in imports)
+    for module in HEAVY_MODULES:
+        if module in imported:
+            print("FAIL: {} is imported".format(module))
+            failed = True
+    if median > args.target:
+        print("FAIL: median start up time {:.1f} ms is over the target of "
+              "{:.0f} ms".format(median, args.target))
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
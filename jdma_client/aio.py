@@ -0,0 +1,724 @@
+"""
+Asynchronous (asyncio) versions of the routines in jdma_lib.
+Each function is a coroutine with the same arguments as the function of the
+same name in jdma_lib, and returns an object with the same interface as the
+`requests.Response` returned by jdma_lib (**status_code**, **content**,
+**text**, **headers** and **json()**).
+All of the functions share one pooled aiohttp connection to the JDMA server, so
+many requests and batches can be monitored concurrently from a single event
+loop, e.g.:
+
+    responses = await asyncio.gather(
+        *[aio.get_request(name, req_id=r) for r in req_ids]
+    )
+
+Requires: aiohttp library (pip install aiohttp)
+
+"""
+
+import asyncio
+import functools
+import json
+import ssl
+import time
+
+import aiohttp
+
+from jdma_client.jdma_lib import JdmaClient, _request_data, _filter_requests
+from jdma_client.jdma_lib import _request_finished, _next_poll_interval
+from jdma_client.jdma_lib import _wait_results, partition_filelist
+from jdma_client.jdma_lib import _compress_body, RETRY_STATUS_CODES
+from jdma_client.jdma_lib import RETRY_METHODS, IDEMPOTENCY_HEADER
+from jdma_client.jdma_lib import new_idempotency_key, part_idempotency_key
+from jdma_client.jdma_lib import _batch_data, _walk_records, _part_data
+from jdma_client.jdma_lib import _submitted_data, _call_error_data
+from jdma_client.jdma_lib import JdmaResponseError, JdmaCircuitOpenError
+from jdma_client.jdma_lib import default_circuit_breaker_path
+from jdma_client.jdma_lib import _ListingBuilder, _jitter, ijson
+from jdma_client.jdma_common import read_http_settings
+from jdma_client.jdma_journal import RequestJournal
+
+# size of the chunks that a streamed listing is read, and parsed, in
+PARSE_CHUNK_SIZE = 64*1024
+# the errors raised when the stream of a listing is cut off, which are retried
+# by iter_files and iter_archives
+STREAM_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, ValueError)
+if ijson is not None:
+    STREAM_ERRORS += (ijson.JSONError,)
+
+##### Response - a requests.Response compatible result                   ######
+
+class AsyncResponse(object):
+    """The result of a call to the JDMA HTTP API, made by the AsyncJdmaClient.
+       The body of the response has already been read, so the attributes and
+       methods can be used in the same way as those of a `requests.Response`,
+       unless the call was streamed, in which case the body is read from
+       **raw**, an `aiohttp.StreamReader`, and the response must be closed
+       to return the connection to the pool.
+    """
+    def __init__(self, url, status_code, headers, content, raw=None,
+                 release=None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.raw = raw
+        self._release = release
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.text)
+
+    def close(self):
+        if self._release is not None:
+            self._release()
+            self._release = None
+
+##### Client - the pooled, keep-alive aiohttp session                      #####
+
+class AsyncJdmaClient(JdmaClient):
+    """An asyncio client for the JDMA HTTP API.  The client takes the same
+       arguments as the JdmaClient, but owns an aiohttp session, and each of
+       its methods returns a coroutine rather than a response.  The aiohttp
+       session is created on the first call, inside the running event loop,
+       and is closed by ``async with`` or by awaiting **close()**.  The
+       journal and the circuit breaker are called in the default executor of
+       the event loop, as they read and write local files.
+    """
+    # the errors raised by a call that fails without a response from the server
+    CALL_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError,
+                   JdmaCircuitOpenError)
+
+    def _create_session(self, pool_connections, pool_maxsize, keep_alive):
+        """Store the settings for the aiohttp session, which must be created
+           inside the running event loop"""
+        self._pool_maxsize = pool_maxsize
+        self._keep_alive = keep_alive
+        return None
+
+    def _ssl_context(self):
+        """Convert the verify setting into an aiohttp ssl argument"""
+        if self.verify is False:
+            return False
+        elif self.verify is True:
+            return None
+        # path to a CA bundle
+        return ssl.create_default_context(cafile=self.verify)
+
+    def _client_timeout(self, method, stream=False):
+        """Convert the timeouts for the method into an aiohttp ClientTimeout.
+           The body of a streamed response can take any time to read, so a
+           single timeout is applied between reads, rather than in total."""
+        timeout = self._timeout(method)
+        if isinstance(timeout, tuple):
+            return aiohttp.ClientTimeout(
+                sock_connect=timeout[0], sock_read=timeout[1]
+            )
+        if stream:
+            return aiohttp.ClientTimeout(
+                sock_connect=timeout, sock_read=timeout
+            )
+        return aiohttp.ClientTimeout(total=timeout)
+
+    async def _in_executor(self, function, *args):
+        """Run a function that does blocking (disk) I/O, e.g. a call to the
+           journal or to a circuit breaker kept in a file, in the default
+           executor of the event loop, so that the loop is not blocked"""
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(function, *args)
+        )
+
+    async def _breaker(self, function, *args):
+        """Call a method of the circuit breaker, in the executor if its state
+           is kept in a file"""
+        if self.circuit_breaker.path is None:
+            return function(*args)
+        return await self._in_executor(function, *args)
+
+    async def _send(self, method, url, data=None, stream=False, headers=None):
+        """Send a HTTP request to the JDMA server over the pooled session.  The
+           body of the response is read in full, unless **stream** is `True`
+           and the call succeeded, in which case it is read from the **raw**
+           stream of the response, which must be closed.  Data larger than the
+           compress_threshold is compressed.  Failed calls are retried with
+           the same policy as the JdmaClient."""
+        await self._breaker(self.circuit_breaker.before_call)
+        if self.compression is not None:
+            # the body may be compressed to, and read from, a temporary file
+            body, headers = await self._in_executor(
+                _read_body, data, self.compression, self.compress_threshold,
+                headers
+            )
+        else:
+            body, headers = _read_body(data, None, None, headers)
+        if self.session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self._pool_maxsize,
+                force_close=not self._keep_alive,
+                ssl=self._ssl_context()
+            )
+            self.session = aiohttp.ClientSession(connector=connector)
+        retry = 0
+        while True:
+            try:
+                response = await self.session.request(
+                    method, url, data=body, headers=headers,
+                    timeout=self._client_timeout(method, stream)
+                )
+                if stream and response.status == 200:
+                    result = AsyncResponse(
+                        str(response.url), response.status, response.headers,
+                        None, raw=response.content, release=response.release
+                    )
+                else:
+                    async with response:
+                        content = await response.read()
+                    result = AsyncResponse(
+                        str(response.url), response.status, response.headers,
+                        content
+                    )
+                if (result.status_code not in RETRY_STATUS_CODES or
+                        method not in RETRY_METHODS or
+                        retry >= self.retries):
+                    break
+            except aiohttp.ClientConnectorError:
+                # the connection could not be made - safe to retry any method
+                if retry >= self.retries:
+                    await self._breaker(self.circuit_breaker.record, False)
+                    raise
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if method not in RETRY_METHODS or retry >= self.retries:
+                    await self._breaker(self.circuit_breaker.record, False)
+                    raise
+            retry += 1
+            await asyncio.sleep(self.backoff_factor * 2 ** (retry - 1))
+        await self._breaker(
+            self.circuit_breaker.record, result.status_code < 500
+        )
+        return result
+
+    async def get_requests(self, name, req_ids, workspace=None, ffilter=None,
+                           max_workers=8, single_call=None):
+        """Get the details of many requests, fanning out the calls over the
+           event loop.  See :func:`jdma_lib.get_requests`"""
+        req_ids = [int(r) for r in req_ids]
+        if single_call is None:
+            single_call = workspace is not None or ffilter == "workspace"
+        if single_call:
+            try:
+                response = await self.get_request(
+                    name, workspace=workspace, ffilter=ffilter
+                )
+            except self.CALL_ERRORS as e:
+                return [_call_error_data(e, r) for r in req_ids]
+            return _filter_requests(response, req_ids)
+        # bound the number of concurrent calls
+        semaphore = asyncio.Semaphore(max_workers)
+        async def get_one(req_id):
+            try:
+                async with semaphore:
+                    response = await self.get_request(name, req_id=req_id)
+            except self.CALL_ERRORS as e:
+                return _call_error_data(e, req_id)
+            return _request_data(response, req_id)
+        return await asyncio.gather(*[get_one(r) for r in req_ids])
+
+    async def wait_for_requests(self, name, req_ids, timeout=None,
+                                poll_interval=2.0, max_poll_interval=300.0,
+                                callback=None):
+        """Wait for requests to finish, without blocking the event loop.  See
+           :func:`jdma_lib.wait_for_requests`"""
+        req_ids = [int(r) for r in req_ids]
+        results = {}
+        stages = {}
+        interval = poll_interval
+        start_time = time.time()
+        while True:
+            outstanding = [r for r in req_ids if r not in results]
+            progress = False
+            for data in await self.get_requests(name, outstanding):
+                req_id = data["request_id"]
+                # a failed poll is not a change of stage
+                if "stage" in data and stages.get(req_id) != data["stage"]:
+                    stages[req_id] = data["stage"]
+                    progress = True
+                if _request_finished(data):
+                    results[req_id] = data
+                    if callback is not None:
+                        callback(data)
+            if len(results) == len(set(req_ids)):
+                break
+            interval = _next_poll_interval(
+                interval, progress, poll_interval, max_poll_interval
+            )
+            sleep_time = _jitter(interval)
+            if timeout is not None:
+                remaining = timeout - (time.time() - start_time)
+                if remaining <= 0:
+                    break
+                sleep_time = min(sleep_time, remaining)
+            await asyncio.sleep(sleep_time)
+        return _wait_results(req_ids, results, stages)
+
+    async def upload_files_split(self, name, workspace=None, files=[],
+                                 label=None, request_type=None, storage=None,
+                                 credentials=None, max_batch_size=None,
+                                 max_files_per_batch=None, max_workers=4,
+                                 idempotency_key=None):
+        """Put a list of files to a storage backend, split into several
+           batches.  See :func:`jdma_lib.upload_files_split`"""
+        parts = partition_filelist(files, max_batch_size, max_files_per_batch)
+        if label is None:
+            label = "batch"
+        semaphore = asyncio.Semaphore(max_workers)
+        async def upload_part(p):
+            part_label = "{}.part{:03d}".format(label, p + 1)
+            key = part_idempotency_key(idempotency_key, p)
+            try:
+                async with semaphore:
+                    data = await self.submitted_request(name, key)
+                    if data is not None:
+                        return data
+                    response = await self.upload_files(
+                        name, workspace=workspace, filelist=parts[p],
+                        label=part_label, request_type=request_type,
+                        storage=storage, credentials=credentials,
+                        idempotency_key=key
+                    )
+            except Exception as e:
+                return {"label" : part_label, "error" : str(e),
+                        "idempotency_key" : key}
+            return _part_data(response, part_label, key)
+        return await asyncio.gather(
+            *[upload_part(p) for p in range(len(parts))]
+        )
+
+    async def download_batches(self, name, batch_ids, filelist=[],
+                               target_dir=None, credentials=None,
+                               max_workers=4, idempotency_key=None):
+        """Download several batches from their storage backends.  See
+           :func:`jdma_lib.download_batches`"""
+        batch_ids = [int(b) for b in batch_ids]
+        # the credentials for each storage backend, looked up once
+        storage_credentials = {}
+        semaphore = asyncio.Semaphore(max_workers)
+        async def download_batch(b):
+            batch_id = batch_ids[b]
+            key = part_idempotency_key(idempotency_key, b)
+            try:
+                async with semaphore:
+                    data = await self.submitted_request(name, key)
+                    if data is not None:
+                        return data
+                    response = await self.get_batch(name, batch_id=batch_id)
+                    if response.status_code != 200:
+                        return _batch_data(response, batch_id)
+                    storage = response.json()["storage"]
+                    if storage not in storage_credentials:
+                        if callable(credentials):
+                            storage_credentials[storage] = credentials(storage)
+                        elif credentials is not None:
+                            storage_credentials[storage] = credentials.get(
+                                storage
+                            )
+                        else:
+                            storage_credentials[storage] = None
+                    response = await self.download_files(
+                        name, batch_id=batch_id, filelist=filelist,
+                        target_dir=target_dir,
+                        credentials=storage_credentials[storage],
+                        idempotency_key=key
+                    )
+            except Exception as e:
+                return {"migration_id" : batch_id, "error" : str(e),
+                        "idempotency_key" : key}
+            return _batch_data(response, batch_id)
+        return await asyncio.gather(
+            *[download_batch(b) for b in range(len(batch_ids))]
+        )
+
+    async def _submit(self, url, body, idempotency_key, name, request_type,
+                      workspace=None, label=None, batch_id=None):
+        """Submit a request with an idempotency key, recording it in the
+           journal.  See :func:`jdma_lib.JdmaClient._submit`"""
+        if idempotency_key is None:
+            idempotency_key = new_idempotency_key()
+        new_key = False
+        if self.journal is not None:
+            new_key = await self._in_executor(functools.partial(
+                self.journal.add, idempotency_key, name, request_type,
+                workspace=workspace, label=label, batch_id=batch_id
+            ))
+        response = await self._send(
+            "POST", url, data=body,
+            headers={IDEMPOTENCY_HEADER : idempotency_key}
+        )
+        await self._in_executor(
+            self._journal_response, idempotency_key, new_key, response
+        )
+        return response
+
+    async def submitted_request(self, name, idempotency_key):
+        """Find the request already submitted with an idempotency key, if
+           any.  See :func:`jdma_lib.submitted_request`"""
+        entry = await self._in_executor(self._submitted_entry, idempotency_key)
+        if entry is None:
+            return None
+        if entry.request_id is not None:
+            response = await self.get_request(name, req_id=entry.request_id)
+            data = _request_data(response, entry.request_id)
+        else:
+            response = await self.get_request(name, workspace=entry.workspace)
+            data = await self._in_executor(
+                self._reconcile_response, entry, response
+            )
+        return _submitted_data(data, entry)
+
+    async def reconcile_request(self, name, idempotency_key):
+        """Find the request submitted with an idempotency key.  See
+           :func:`jdma_lib.reconcile_request`"""
+        entry = await self._in_executor(self._journal_entry, idempotency_key)
+        if entry.request_id is not None:
+            response = await self.get_request(name, req_id=entry.request_id)
+            return _request_data(response, entry.request_id)
+        response = await self.get_request(name, workspace=entry.workspace)
+        return await self._in_executor(
+            self._reconcile_response, entry, response
+        )
+
+    async def iter_files(self, name, batch_id=None, workspace=None, limit=0,
+                         digest=0, ffilter=None, resume_token=None,
+                         retries=3):
+        """Iterate over the files in a batch, as an asynchronous generator of
+           (**batch**, **archive**, **file**) records.  The listing is
+           streamed, and parsed as it arrives, if the ijson library is
+           installed; otherwise the whole listing is read before the first
+           record is yielded.  If the stream is cut off it is requested again,
+           up to **retries** times, and the records already yielded are
+           skipped.  See :func:`jdma_lib.iter_files`"""
+        async for record in self._iter_listing(
+            self.get_files, True, name, batch_id, workspace, limit, digest,
+            ffilter, resume_token, retries
+        ):
+            yield record
+
+    async def iter_archives(self, name, batch_id=None, workspace=None,
+                            limit=0, digest=0, ffilter=None,
+                            resume_token=None, retries=3):
+        """Iterate over the archives in a batch, as an asynchronous generator
+           of (**batch**, **archive**) records.  See :func:`iter_files`"""
+        async for record in self._iter_listing(
+            self.get_archives, False, name, batch_id, workspace, limit,
+            digest, ffilter, resume_token, retries
+        ):
+            yield record
+
+    async def _iter_listing(self, get_listing, files, name, batch_id,
+                            workspace, limit, digest, ffilter, resume_token,
+                            retries):
+        """Stream the records of a listing, requesting it again if the stream
+           is cut off.  See :class:`jdma_lib.ListingIterator`"""
+        if resume_token is None:
+            streamed = 0
+        else:
+            streamed = int(resume_token)
+        attempt = 0
+        while True:
+            # errors making the request have already been retried by _send
+            response = await get_listing(
+                name, batch_id=batch_id, workspace=workspace, limit=limit,
+                digest=digest, ffilter=ffilter, stream=ijson is not None
+            )
+            if response.status_code != 200:
+                raise JdmaResponseError(response)
+            skip = streamed
+            try:
+                async for record in _stream_records(response, files):
+                    if skip > 0:
+                        skip -= 1
+                        continue
+                    streamed += 1
+                    yield record
+                return
+            except STREAM_ERRORS:
+                if attempt >= retries:
+                    raise
+            finally:
+                response.close()
+            attempt += 1
+            await asyncio.sleep(_jitter(
+                self.backoff_factor * 2**(attempt - 1)
+            ))
+
+    async def close(self):
+        """Close the session and all the pooled connections"""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def __enter__(self):
+        raise TypeError(
+            "AsyncJdmaClient must be used with 'async with', not 'with'"
+        )
+
+    def __exit__(self, *args):
+        raise TypeError(
+            "AsyncJdmaClient must be used with 'async with', not 'with'"
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+
+def _read_body(data, compression, compress_threshold, headers):
+    """Compress the data of a request, if it is larger than the threshold,
+       and read it, so that it can be sent again by the retries"""
+    data, headers = _compress_body(
+        data, compression, compress_threshold, headers
+    )
+    if hasattr(data, "read"):
+        body = data.read()
+        data.close()
+    else:
+        body = data
+    return body, headers
+
+
+async def _stream_records(response, files):
+    """Parse the records of a listing from a streamed response, a chunk at a
+       time, or walk them if the body of the response has been read"""
+    if response.raw is None:
+        for record in _walk_records(response.json(), files):
+            yield record
+        return
+    builder = _ListingBuilder(files)
+    events = ijson.sendable_list()
+    parser = ijson.parse_coro(events, use_float=True)
+    while True:
+        chunk = await response.raw.read(PARSE_CHUNK_SIZE)
+        if chunk:
+            parser.send(chunk)
+        else:
+            # raises an IncompleteJSONError if the listing was cut off
+            parser.close()
+        for record in builder.records(events):
+            yield record
+        del events[:]
+        if not chunk:
+            return
+
+
+# the default client, used by all of the module level functions below
+_default_client = None
+
+def get_default_client():
+    """Get the default asyncio client, creating it on the first call from the
+       global ``settings`` and the ``http`` settings in ``~/.jdma.json``.
+
+       :rtype: AsyncJdmaClient
+    """
+    global _default_client
+    if _default_client is None:
+        _default_client = AsyncJdmaClient(
+            journal=RequestJournal(),
+            circuit_breaker_path=default_circuit_breaker_path(),
+            **read_http_settings()
+        )
+    return _default_client
+
+
+def set_default_client(client):
+    """Replace the default client used by the module level functions.
+
+       :param AsyncJdmaClient client: (`required`) the client to use
+    """
+    global _default_client
+    _default_client = client
+
+##### User functions                                                       #####
+
+async def create_user(name, email=None, workspace="default"):
+    """Asynchronous version of :func:`jdma_lib.create_user`"""
+    return await get_default_client().create_user(
+        name=name, email=email, workspace=workspace
+    )
+
+
+async def update_user(name, email=None, notify=None):
+    """Asynchronous version of :func:`jdma_lib.update_user`"""
+    return await get_default_client().update_user(
+        name=name, email=email, notify=notify
+    )
+
+
+async def info_user(name):
+    """Asynchronous version of :func:`jdma_lib.info_user`"""
+    return await get_default_client().info_user(name=name)
+
+##### Request functions                                                    #####
+
+async def get_request(name, req_id=None, workspace=None, ffilter=None):
+    """Asynchronous version of :func:`jdma_lib.get_request`"""
+    return await get_default_client().get_request(
+        name=name, req_id=req_id, workspace=workspace, ffilter=ffilter
+    )
+
+
+async def get_requests(name, req_ids, workspace=None, ffilter=None,
+                       max_workers=8, single_call=None):
+    """Asynchronous version of :func:`jdma_lib.get_requests`"""
+    return await get_default_client().get_requests(
+        name=name, req_ids=req_ids, workspace=workspace, ffilter=ffilter,
+        max_workers=max_workers, single_call=single_call
+    )
+
+
+async def wait_for_requests(name, req_ids, timeout=None, poll_interval=2.0,
+                            max_poll_interval=300.0, callback=None):
+    """Asynchronous version of :func:`jdma_lib.wait_for_requests`"""
+    return await get_default_client().wait_for_requests(
+        name=name, req_ids=req_ids, timeout=timeout,
+        poll_interval=poll_interval, max_poll_interval=max_poll_interval,
+        callback=callback
+    )
+
+
+async def get_batch(name, batch_id=None, workspace=None, label=None,
+                    ffilter=None):
+    """Asynchronous version of :func:`jdma_lib.get_batch`"""
+    return await get_default_client().get_batch(
+        name=name, batch_id=batch_id, workspace=workspace, label=label,
+        ffilter=ffilter
+    )
+
+
+async def get_storage():
+    """Asynchronous version of :func:`jdma_lib.get_storage`"""
+    return await get_default_client().get_storage()
+
+
+async def get_files(name, batch_id=None, workspace=None, limit=0, digest=0,
+                    ffilter=None):
+    """Asynchronous version of :func:`jdma_lib.get_files`"""
+    return await get_default_client().get_files(
+        name=name, batch_id=batch_id, workspace=workspace, limit=limit,
+        digest=digest, ffilter=ffilter
+    )
+
+
+async def get_archives(name, batch_id=None, workspace=None, limit=0, digest=0,
+                       ffilter=None):
+    """Asynchronous version of :func:`jdma_lib.get_archives`"""
+    return await get_default_client().get_archives(
+        name=name, batch_id=batch_id, workspace=workspace, limit=limit,
+        digest=digest, ffilter=ffilter
+    )
+
+
+async def iter_files(name, batch_id=None, workspace=None, limit=0, digest=0,
+                     ffilter=None, resume_token=None, retries=3):
+    """Asynchronous generator version of :func:`jdma_lib.iter_files`, e.g.:
+
+        async for batch, archive, file in aio.iter_files(name, batch_id=12):
+            ...
+    """
+    async for record in get_default_client().iter_files(
+        name=name, batch_id=batch_id, workspace=workspace, limit=limit,
+        digest=digest, ffilter=ffilter, resume_token=resume_token,
+        retries=retries
+    ):
+        yield record
+
+
+async def iter_archives(name, batch_id=None, workspace=None, limit=0,
+                        digest=0, ffilter=None, resume_token=None, retries=3):
+    """Asynchronous generator version of :func:`jdma_lib.iter_archives`"""
+    async for record in get_default_client().iter_archives(
+        name=name, batch_id=batch_id, workspace=workspace, limit=limit,
+        digest=digest, ffilter=ffilter, resume_token=resume_token,
+        retries=retries
+    ):
+        yield record
+
+##### File transfer functions                                              #####
+
+async def upload_files(name, workspace=None, filelist=[], label=None,
+                       request_type=None, storage=None, credentials=None,
+                       idempotency_key=None):
+    """Asynchronous version of :func:`jdma_lib.upload_files`"""
+    return await get_default_client().upload_files(
+        name=name, workspace=workspace, filelist=filelist, label=label,
+        request_type=request_type, storage=storage, credentials=credentials,
+        idempotency_key=idempotency_key
+    )
+
+
+async def upload_files_split(name, workspace=None, files=[], label=None,
+                             request_type=None, storage=None,
+                             credentials=None, max_batch_size=None,
+                             max_files_per_batch=None, max_workers=4,
+                             idempotency_key=None):
+    """Asynchronous version of :func:`jdma_lib.upload_files_split`"""
+    return await get_default_client().upload_files_split(
+        name=name, workspace=workspace, files=files, label=label,
+        request_type=request_type, storage=storage, credentials=credentials,
+        max_batch_size=max_batch_size, max_files_per_batch=max_files_per_batch,
+        max_workers=max_workers, idempotency_key=idempotency_key
+    )
+
+
+async def delete_batch(name, batch_id=None, storage=None, credentials=None,
+                       idempotency_key=None):
+    """Asynchronous version of :func:`jdma_lib.delete_batch`"""
+    return await get_default_client().delete_batch(
+        name=name, batch_id=batch_id, storage=storage, credentials=credentials,
+        idempotency_key=idempotency_key
+    )
+
+
+async def download_files(name, batch_id=None, filelist=[], target_dir=None,
+                         credentials=None, idempotency_key=None):
+    """Asynchronous version of :func:`jdma_lib.download_files`"""
+    return await get_default_client().download_files(
+        name=name, batch_id=batch_id, filelist=filelist,
+        target_dir=target_dir, credentials=credentials,
+        idempotency_key=idempotency_key
+    )
+
+
+async def download_batches(name, batch_ids, filelist=[], target_dir=None,
+                           credentials=None, max_workers=4,
+                           idempotency_key=None):
+    """Asynchronous version of :func:`jdma_lib.download_batches`"""
+    return await get_default_client().download_batches(
+        name=name, batch_ids=batch_ids, filelist=filelist,
+        target_dir=target_dir, credentials=credentials,
+        max_workers=max_workers, idempotency_key=idempotency_key
+    )
+
+
+async def submitted_request(name, idempotency_key):
+    """Asynchronous version of :func:`jdma_lib.submitted_request`"""
+    return await get_default_client().submitted_request(
+        name=name, idempotency_key=idempotency_key
+    )
+
+
+async def reconcile_request(name, idempotency_key):
+    """Asynchronous version of :func:`jdma_lib.reconcile_request`"""
+    return await get_default_client().reconcile_request(
+        name=name, idempotency_key=idempotency_key
+    )
+
+
+async def modify_batch(name, batch_id=None, label=None):
+    """Asynchronous version of :func:`jdma_lib.modify_batch`"""
+    return await get_default_client().modify_batch(
+        name=name, batch_id=batch_id, label=label
+    )
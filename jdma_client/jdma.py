@@ -15,10 +15,20 @@ if not sys.warnoptions:
 import os
 import argparse
 import json
+import re
 
-# import the jdma_lib library
-from jdma_client.jdma_lib import *
 from jdma_client.jdma_common import *
+# import the jdma_lib library, and the modules that use it, lazily, so that
+# requests (and urllib3) are only imported by the commands that use them
+jdma_lib = lazy_import("jdma_client.jdma_lib")
+jdma_cache = lazy_import("jdma_client.jdma_cache")
+jdma_scan = lazy_import("jdma_client.jdma_scan")
+jdma_export = lazy_import("jdma_client.jdma_export")
+jdma_verify = lazy_import("jdma_client.jdma_verify")
+jdma_delta = lazy_import("jdma_client.jdma_delta")
+jdma_select = lazy_import("jdma_client.jdma_select")
+jdma_journal = lazy_import("jdma_client.jdma_journal")
+from jdma_client.jdma_table import TableWriter
 
 # definitions for commands
 
@@ -65,7 +75,7 @@ def do_init(args):
         workspace = args.workspace
 
     # call the library function
-    response = create_user(settings.USER, email, workspace)
+    response = jdma_lib.create_user(settings.USER, email, workspace)
     # check the response code
     if response.status_code == 200:
         data = response.json()
@@ -93,7 +103,7 @@ def do_email(args):
     if args.email:
         email = args.email
     # call the library function
-    response = update_user(settings.USER, email)
+    response = jdma_lib.update_user(settings.USER, email)
     if response.status_code == 200:
         data = response.json()
         if args.json == True:
@@ -109,7 +119,7 @@ def do_email(args):
 def do_info(args):
     ("""**info** : get information about you, including email address and """
      """notification setting.""")
-    response = info_user(settings.USER)
+    response = jdma_lib.info_user(settings.USER)
     if response.status_code == 200:
         data = response.json()
         if args.json == True:
@@ -132,12 +142,12 @@ def do_notify(args):
     ### Send the HTTP request (PUT) to switch on / off notifications for the
     ### user ###
     # first get the status of notifications
-    response = info_user(settings.USER)
+    response = jdma_lib.info_user(settings.USER)
     if response.status_code == 200:
         data = response.json()
         notify = data["notify"]
         # update to inverse
-        response = update_user(settings.USER, notify=not notify)
+        response = jdma_lib.update_user(settings.USER, notify=not notify)
         if response.status_code == 200:
             sys.stdout.write((
                 "{}** SUCCESS ** - user notifications updated to: {}{}\n"
@@ -151,11 +161,14 @@ def do_notify(args):
 
 def do_request(args):
     ("""**request** *<request_id>* : List all requests, or the details of a """
-     """particular request with <request_id>.""")
+     """particular request with <request_id>.\n\n**request** *<request_id>* """
+     """*<request_id>* ... : List the details of many requests.  Use """
+     """*--ids-from=* to read the request ids from a file.""")
     ###Send the HTTP request (GET) to get the details about a single request.
-    # determine whether to list one request or all
-    if len(args.arg):
-        req_id = int(args.arg)
+    # determine whether to list one request, many requests or all
+    req_ids = get_id_args(args)
+    if len(req_ids) == 1:
+        req_id = req_ids[0]
     else:
         req_id = None
 
@@ -175,7 +188,11 @@ def do_request(args):
     else:
         workspace = args.workspace
 
-    response = get_request(
+    if len(req_ids) > 1:
+        list_many_requests(req_ids, workspace, args)
+        return
+
+    response = jdma_lib.get_request(
         name=settings.USER,
         workspace=workspace,
         req_id=req_id,
@@ -184,6 +201,9 @@ def do_request(args):
     # process if returned
     if response.status_code == 200:
         data = response.json()
+        if args.ndjson == True and req_id is None:
+            output_ndjson(data["requests"])
+            return
         if args.json == True:
             output_json(data)
             return
@@ -232,6 +252,108 @@ def do_request(args):
         error_message(response, error_msg, args.json)
 
 
+def do_wait(args):
+    ("""**wait** *<request_id>* *<request_id>* ... : Wait until the requests """
+     """reach a terminal stage (PUT_COMPLETED, GET_COMPLETED, """
+     """DELETE_COMPLETED or FAILED).\nUse *--ids-from=* to read the request """
+     """ids from a file and *--timeout=* to stop waiting after a number of """
+     """seconds.  Exits with a non-zero status if any of the requests failed """
+     """or did not finish.""")
+    req_ids = get_id_args(args)
+    if len(req_ids) == 0:
+        error_message(None, "please supply the request ids to wait for, for user",
+                      args.json)
+        sys.exit(1)
+
+    if args.timeout:
+        timeout = float(args.timeout)
+    else:
+        timeout = None
+
+    finished = set()
+    def request_finished(data):
+        # report each request as soon as it finishes
+        finished.add(data["request_id"])
+        if args.ndjson == True:
+            output_json(data)
+            return
+        if args.json == True:
+            return
+        if "error" in data:
+            sys.stdout.write((
+                "{}** ERROR ** - request {} : {}{}\n"
+            ).format(bcolors.RED, data["request_id"], data["error"],
+                     bcolors.ENDC))
+        elif data["stage"] in REQUEST_FAILED_STAGES:
+            sys.stdout.write((
+                "{}** FAILED ** - request {} : {}{}\n"
+            ).format(bcolors.RED, data["request_id"],
+                     data.get("failure_reason", ""), bcolors.ENDC))
+        else:
+            sys.stdout.write((
+                "{}** SUCCESS ** - request {} : {}{}\n"
+            ).format(bcolors.GREEN, data["request_id"],
+                     get_request_stage(data["stage"]), bcolors.ENDC))
+        sys.stdout.flush()
+
+    data = jdma_lib.wait_for_requests(
+        name=settings.USER,
+        req_ids=req_ids,
+        timeout=timeout,
+        callback=request_finished
+    )
+    if args.json == True and args.ndjson != True:
+        output_json({"requests" : data})
+    success = True
+    for r in data:
+        # report the requests that timed out
+        if r["request_id"] not in finished:
+            request_finished(r)
+        if "error" in r or r["stage"] in REQUEST_FAILED_STAGES:
+            success = False
+    if not success:
+        sys.exit(1)
+
+
+def get_id_args(args):
+    ("""Get a list of the ids supplied as arguments to the command, and in """
+     """the file given by --ids-from""")
+    ids = []
+    if len(args.arg):
+        ids.append(int(args.arg))
+    ids.extend([int(o) for o in args.opts])
+    if args.ids_from:
+        ids.extend(read_idlist(args.ids_from))
+    return ids
+
+
+def list_many_requests(req_ids, workspace, args):
+    ("""Called from do_request if more than one request_id is given.  Lists """
+     """the details of the requests, fetched concurrently.""")
+    # get_requests will use a single list call for the workspace-wide view
+    data = jdma_lib.get_requests(
+        name=settings.USER,
+        req_ids=req_ids,
+        workspace=workspace,
+        ffilter=args.filter
+    )
+    if args.ndjson == True:
+        output_ndjson(data)
+        return
+    if args.json == True:
+        output_json({"requests" : data})
+        return
+    found = [r for r in data if "error" not in r]
+    if len(found) > 0:
+        list_requests({"requests" : found}, args)
+    for r in data:
+        if "error" in r:
+            sys.stdout.write((
+                "{}** ERROR ** - cannot list request {} for user {} : {}{}\n"
+            ).format(bcolors.RED, r["request_id"], settings.USER, r["error"],
+                     bcolors.ENDC))
+
+
 def list_requests(data, args):
     ("""Called from do_requests if request_id is None.  Lists all the """
      """requests.""")
@@ -239,27 +361,27 @@ def list_requests(data, args):
     if n_req == 0:
         error_message(None, "no requests found for user", args.json)
     else:
-        # print the header
-        sys.stdout.write(bcolors.MAGENTA)
-        sys.stdout.write((
+        row_format = (
             "{:>6} {:<8} {:<8} {:<16} {:<16} {:16} {:<16} {:<17} {:<11}\n"
-        ).format("req id", "type", "batch id", "user", "workspace",
-                 "batch label", "storage", "date", "stage"))
-        sys.stdout.write(bcolors.ENDC)
-        for r in data["requests"]:
-            sys.stdout.write((
-                "{:>6} {:<8} {:<8} {:<16} {:<16} {:16} {:<16} {:<17} {:<11}"
-            ).format(
-                r["request_id"],
-                get_request_type(r["request_type"]),
-                r["migration_id"],
-                r["user"],
-                r["workspace"],
-                r["label"][0:16],
-                r["storage"][0:16],
-                r["date"][0:16].replace("T"," "),
-                get_request_stage(r["stage"]))+"\n"
-            )
+        ).format
+        with TableWriter() as table:
+            # print the header
+            table.write(table.colours.MAGENTA + row_format(
+                "req id", "type", "batch id", "user", "workspace",
+                "batch label", "storage", "date", "stage"
+            ) + table.colours.ENDC)
+            for r in data["requests"]:
+                table.write(row_format(
+                    r["request_id"],
+                    get_request_type(r["request_type"]),
+                    r["migration_id"],
+                    r["user"],
+                    r["workspace"],
+                    r["label"][0:16],
+                    r["storage"][0:16],
+                    r["date"][0:16].replace("T"," "),
+                    get_request_stage(r["stage"])
+                ))
 
 def display_batch(data):
     """Display a single batch, with data a dictionary derived from JSON"""
@@ -331,7 +453,7 @@ def do_batch(args):
         batch_id = None
 
     # send the HTTP request
-    response = get_batch(
+    response = jdma_lib.get_batch(
         name=settings.USER,
         batch_id=batch_id,
         workspace=workspace,
@@ -342,8 +464,11 @@ def do_batch(args):
     if response.status_code == 200:
         data = response.json()
         # check if the JSON option was chosen
+        if args.ndjson == True and "migrations" in data:
+            output_ndjson(data["migrations"])
+            return
         if args.json == True:
-            print(data)
+            output_json(data)
             return
         if batch_id is None and label_id is None:
             list_batches(data, workspace)
@@ -381,25 +506,25 @@ def list_batches(data, workspace=None):
         error_msg += bcolors.ENDC + "\n"
         sys.stdout.write(error_msg)
     else:
-        # print the header
-        sys.stdout.write(bcolors.MAGENTA)
-        sys.stdout.write((
+        row_format = (
             "{:>8} {:<16} {:<16} {:<16} {:<16} {:<17} {:<11}\n"
-        ).format("batch id", "user", "workspace", "batch label",
-                 "storage", "date", "stage"))
-        sys.stdout.write(bcolors.ENDC)
-        for r in data["migrations"]:
-            sys.stdout.write((
-                "{:>8} {:<16} {:<16} {:<16} {:<16} {:<17} {:<11}\n"
-            ).format(
-                r["migration_id"],
-                r["user"][0:16],
-                r["workspace"][0:16],
-                r["label"][0:16],
-                r["storage"][0:16],
-                r["registered_date"][0:16].replace("T"," "),
-                get_batch_stage(r["stage"]))
-            )
+        ).format
+        with TableWriter() as table:
+            # print the header
+            table.write(table.colours.MAGENTA + row_format(
+                "batch id", "user", "workspace", "batch label", "storage",
+                "date", "stage"
+            ) + table.colours.ENDC)
+            for r in data["migrations"]:
+                table.write(row_format(
+                    r["migration_id"],
+                    r["user"][0:16],
+                    r["workspace"][0:16],
+                    r["label"][0:16],
+                    r["storage"][0:16],
+                    r["registered_date"][0:16].replace("T"," "),
+                    get_batch_stage(r["stage"])
+                ))
 
 
 def migrate_or_put(args, request_type):
@@ -419,16 +544,44 @@ def migrate_or_put(args, request_type):
 
 
     # is this a directory?
+    validation = None
     if os.path.isdir(current_path):
         filelist = [current_path]
         label = os.path.basename(current_path)
     # does the filelist exist?
     elif os.path.exists(current_path):
-        # read the filelist in and add it to the data
-        filelist = read_filelist(current_path)
+        # the filelist is read from disk, a block at a time, each time it is
+        # used, rather than being held in memory.  Duplicate paths are kept,
+        # so that they are reported by the validation below, which means
+        # that there are none left when the filelist is sent
+        filelist = Filelist(current_path, unique=False)
         # set the label to (the non absolute path of) the filelist - this may
         # be overriden later if args.label is not None
         label = args.arg
+        # validate the filelist before it is submitted, rather than finding
+        # out that a path is missing or unreadable when the batch fails
+        validation = jdma_scan.validate_paths(filelist)
+        display_validation(validation, args)
+        if len(validation.errors):
+            error_msg = "{} invalid paths in filelist {} to {} for user".format(
+                len(validation.errors), args.arg, request_type
+            )
+            if args.json == True:
+                output_json({
+                    "error" : error_msg,
+                    "invalid" : [
+                        {"path" : p, "error" : e} for p, e in validation.errors
+                    ]
+                })
+            else:
+                error_message(None, error_msg, args.json)
+            sys.exit(1)
+        if len(validation.files) == 0 and validation.n_dirs == 0:
+            error_msg = "no files in filelist {} to {} for user".format(
+                args.arg, request_type
+            )
+            error_message(None, error_msg, args.json)
+            sys.exit(1)
     # file or directory not found
     else:
         error_msg = "directory or filelist not found: {} for user".format(args.arg)
@@ -449,18 +602,117 @@ def migrate_or_put(args, request_type):
     if args.label:
         label = args.label
 
+    # split the request into several batches?
+    split = args.max_batch_size != "" or args.max_files_per_batch != ""
+
+    # scan the directory / filelist before the request is made, optionally
+    # sending the files found, rather than the directory, to the server.  A
+    # dry run scans the directory, or the directories in the filelist, to
+    # report what would be uploaded
+    dry_run_scan = args.dry_run == True and (
+        validation is None or validation.n_dirs != 0
+    )
+    since_batch = args.since_batch != ""
+    scan = validation
+    if (args.scan == True or args.send_filelist == True or split or
+            dry_run_scan or since_batch):
+        scan = jdma_scan.scan_paths(filelist)
+        display_scan(scan, args)
+        if since_batch:
+            # only upload the files that are new, or have changed, since the
+            # previous batch
+            try:
+                delta = jdma_delta.delta_files(
+                    name=settings.USER,
+                    batch_id=int(args.since_batch),
+                    files=scan.files,
+                    hash_files=args.hash == True
+                )
+            except jdma_lib.JdmaResponseError as e:
+                error_msg = "cannot list files in batch {} for user".format(
+                    args.since_batch
+                )
+                error_message(e.response, error_msg, args.json)
+                sys.exit()
+            display_delta(delta, args)
+            scan.files = delta.files
+            scan.total_size = delta.total_size
+            if len(scan.files) == 0:
+                if args.json == True:
+                    output_json({
+                        "files" : 0, "since_batch" : int(args.since_batch)
+                    })
+                else:
+                    sys.stdout.write((
+                        "{}** SUCCESS ** - no new or changed files since batch "
+                        "{} to {}{}\n"
+                    ).format(bcolors.GREEN, args.since_batch, request_type,
+                             bcolors.ENDC))
+                return
+        if args.send_filelist == True or split or since_batch:
+            if len(scan.files) == 0:
+                error_msg = "no files found in {} to {} for user".format(
+                    args.arg, request_type
+                )
+                error_message(None, error_msg, args.json)
+                sys.exit()
+            filelist = scan.paths
+
+    if args.dry_run == True:
+        display_dry_run(scan, request_type, label, args)
+        return
+
     # get the credentials for the request
     storage, credentials = get_credentials(args.storage)
+
+    key = get_idempotency_key(args)
+    if split:
+        if args.max_batch_size:
+            max_batch_size = parse_size(args.max_batch_size)
+        else:
+            max_batch_size = None
+        if args.max_files_per_batch:
+            max_files_per_batch = int(args.max_files_per_batch)
+        else:
+            max_files_per_batch = None
+        # call the library function to partition the files and start the
+        # migrations or puts.  If the command is repeated with the same
+        # --idempotency-key only the batches not yet created are submitted
+        try:
+            results = jdma_lib.upload_files_split(
+                name=settings.USER,
+                workspace=workspace,
+                files=scan.files,
+                label=label,
+                request_type=request_type,
+                storage=storage,
+                credentials=credentials,
+                max_batch_size=max_batch_size,
+                max_files_per_batch=max_files_per_batch,
+                idempotency_key=key
+            )
+        except Exception as e:
+            submit_error(e, key, args)
+            return
+        display_split_upload(results, label, request_type, key, args)
+        return
+    if already_submitted(key, args):
+        return
     # call the library function to start the migration or put
-    response = upload_files(
-        name=settings.USER,
-        workspace=workspace,
-        filelist=filelist,
-        label=label,
-        request_type=request_type,
-        storage=storage,
-        credentials=credentials
-    )
+    try:
+        response = jdma_lib.upload_files(
+            name=settings.USER,
+            workspace=workspace,
+            filelist=filelist,
+            label=label,
+            request_type=request_type,
+            storage=storage,
+            credentials=credentials,
+            idempotency_key=key
+        )
+    except Exception as e:
+        submit_error(e, key, args)
+        return
 
     if response.status_code == 200:
         data = response.json()
@@ -521,12 +773,149 @@ def migrate_or_put(args, request_type):
         error_message(response, error_msg, args.json)
 
 
+def display_split_upload(results, label, request_type, key, args):
+    ("""Display the batches requested when a put or migrate is split into """
+     """several batches""")
+    if args.ndjson == True:
+        output_ndjson(results)
+        return
+    if args.json == True:
+        output_json({"batches" : results, "idempotency_key" : key})
+        return
+    requested = [data for data in results if "error" not in data]
+    if len(requested):
+        sys.stdout.write((
+            "{}** SUCCESS ** - {} batches ({}) requested with label "
+            "{}.partNNN:\n{}"
+        ).format(bcolors.GREEN, len(requested), request_type, label,
+                 bcolors.ENDC))
+        display_submitted(requested)
+    for data in results:
+        if "error" in data:
+            sys.stdout.write((
+                "{}** ERROR ** - cannot {} batch {} : {}{}\n"
+            ).format(bcolors.RED, request_type, data["label"], data["error"],
+                     bcolors.ENDC))
+    display_resubmit(results, key)
+
+
+def display_submitted(requested):
+    ("""Display a table of the requests submitted for several batches, """
+     """marking those that had already been submitted""")
+    sys.stdout.write(bcolors.MAGENTA)
+    sys.stdout.write((
+        "{:>6} {:>8} {:<16} {:<16} {:<16} {:<11}\n"
+    ).format("req id", "batch id", "workspace", "batch label", "storage",
+             "stage"))
+    sys.stdout.write(bcolors.ENDC)
+    for data in requested:
+        if data.get("already_submitted"):
+            note = " (already submitted)"
+        else:
+            note = ""
+        sys.stdout.write((
+            "{:>6} {:>8} {:<16} {:<16} {:<16} {:<11}{}\n"
+        ).format(data["request_id"],
+                 data.get("batch_id", data.get("migration_id", "")),
+                 str(data.get("workspace", ""))[0:16],
+                 str(data.get("label", ""))[0:16],
+                 str(data.get("storage", ""))[0:16],
+                 get_request_stage(data["stage"]) if "stage" in data else "",
+                 note))
+
+
+def display_resubmit(results, key):
+    ("""If any of the requests for several batches failed, and may have been """
+     """created, tell the user how to submit the rest""")
+    if any("idempotency_key" in data and "error" in data for data in results):
+        sys.stdout.write((
+            "{}Repeat the command with --idempotency-key={} to submit the "
+            "failed requests.  The requests that have already been created "
+            "are not submitted again.{}\n"
+        ).format(bcolors.YELLOW, key, bcolors.ENDC))
+
+
+def display_scan(scan, args):
+    ("""Display the totals, and any problems, found by the scan of the """
+     """directory or filelist in migrate_or_put""")
+    if args.json == True:
+        return
+    sys.stdout.write((
+        "{}** SCAN ** - {} files, {} directories, total size {}{}\n"
+    ).format(bcolors.MAGENTA, len(scan.files), scan.n_dirs,
+             sizeof_fmt(scan.total_size).strip(), bcolors.ENDC))
+    for path, error in scan.errors:
+        sys.stdout.write((
+            "{}** WARNING ** - cannot read {} : {}{}\n"
+        ).format(bcolors.RED, path, error, bcolors.ENDC))
+
+
+def display_validation(validation, args):
+    ("""Display the totals, and any invalid paths, found by the validation """
+     """of the filelist in migrate_or_put""")
+    if args.json == True:
+        return
+    sys.stdout.write((
+        "{}** VALIDATE ** - {} files, {} directories, total size {}{}\n"
+    ).format(bcolors.MAGENTA, len(validation.files), validation.n_dirs,
+             sizeof_fmt(validation.total_size).strip(), bcolors.ENDC))
+    for path, error in validation.errors:
+        sys.stdout.write((
+            "{}** INVALID ** - {} : {}{}\n"
+        ).format(bcolors.RED, path, error, bcolors.ENDC))
+
+
+def display_delta(delta, args):
+    ("""Display the number of new, changed and unchanged files found by the """
+     """comparison with a previous batch in migrate_or_put""")
+    if args.json == True:
+        return
+    sys.stdout.write((
+        "{}** DELTA ** - {} new, {} changed, {} unchanged files since batch "
+        "{}, total size {}{}\n"
+    ).format(bcolors.MAGENTA, delta.n_new, delta.n_changed, delta.n_unchanged,
+             args.since_batch, sizeof_fmt(delta.total_size).strip(),
+             bcolors.ENDC))
+
+
+def display_dry_run(scan, request_type, label, args):
+    ("""Display what would be uploaded by a dry run of migrate_or_put, """
+     """without submitting the request""")
+    if args.json == True:
+        output_json({
+            "dry_run" : True,
+            "request_type" : request_type,
+            "label" : label,
+            "files" : len(scan.files),
+            "size" : scan.total_size,
+            "errors" : [{"path" : p, "error" : e} for p, e in scan.errors]
+        })
+        return
+    sys.stdout.write((
+        "{}** DRY RUN ** - {} of {} files, total size {}, with label {} not "
+        "submitted{}\n"
+    ).format(bcolors.YELLOW, request_type, len(scan.files),
+             sizeof_fmt(scan.total_size).strip(), label, bcolors.ENDC))
+
+
 def do_put(args):
     ("""**put** *<path>|<filelist>*: Create a batch upload of the current """
      """directory, or directory in *<path>* or a list of files.\nUse *--label=* """
      """to give the batch a label.\nUse *--storage* to specify which external """
      """storage to target for the migration.  Use command **storage** to """
-     """list all the available storage targets.""")
+     """list all the available storage targets.\nUse *--scan* to scan the """
+     """directory or filelist before the upload, reporting the number and """
+     """total size of the files and any that cannot be read, and """
+     """*--send-filelist* to send the list of files found, rather than the """
+     """directory, with the request.\nUse *--max-batch-size=* and / or """
+     """*--max-files-per-batch=* to split the upload into several batches, """
+     """labelled *<label>.partNNN*.\nA filelist is validated before it is """
+     """submitted: every path must be absolute, exist and be readable.  Use """
+     """*--dry-run* to validate and scan the directory or filelist without """
+     """submitting the request.\nUse *--since-batch=<batch_id>* to only """
+     """upload the files that are new, or have changed (in size or """
+     """modification time), since the batch *<batch_id>* was uploaded.  Add """
+     """*--hash* to compare the digests of the files modified since then.""")
     migrate_or_put(args, "PUT")
 
 
@@ -536,7 +925,10 @@ def do_migrate(args):
      """to give the batch a label.\nUse *--storage* to specify which external """
      """storage to target for the migration.\nUse command **storage** to """
      """list all the available storage targets.\nThe data in the directory """
-     """or filelist will be deleted after the upload is completed.""")
+     """or filelist will be deleted after the upload is completed.\nUse """
+     """*--scan*, *--send-filelist*, *--max-batch-size=*, """
+     """*--max-files-per-batch=*, *--dry-run*, *--since-batch=* and *--hash* """
+     """as for the **put** command.""")
     migrate_or_put(args, "MIGRATE")
 
 def do_delete(args):
@@ -553,7 +945,7 @@ def do_delete(args):
     else:
         force = False
     # get the batch info
-    batch_response = get_batch(name=settings.USER, batch_id=batch_id)
+    batch_response = jdma_lib.get_batch(name=settings.USER, batch_id=batch_id)
     # check the return
     if batch_response.status_code != 200:
         error_msg = ("cannot delete batch {}").format(str(batch_id))
@@ -584,12 +976,20 @@ def do_delete(args):
 
     # get the credentials for the request
     storage, credentials = get_credentials(batch_data["storage"])
+    key = get_idempotency_key(args)
+    if already_submitted(key, args):
+        return
     # do the call to the library function
-    response = delete_batch(
-        name=settings.USER,
-        batch_id=batch_id,
-        storage=batch_data["storage"],
-        credentials=credentials)
+    try:
+        response = jdma_lib.delete_batch(
+            name=settings.USER,
+            batch_id=batch_id,
+            storage=batch_data["storage"],
+            credentials=credentials,
+            idempotency_key=key)
+    except Exception as e:
+        submit_error(e, key, args)
+        return
 
     if response.status_code == 200:
         data = response.json()
@@ -635,19 +1035,37 @@ def do_get(args):
      """containing a list of filenames to retrieve.\nThe filenames in the """
      """filelist must be the relative path, as obtained by """
      """``jdma --simple files <batch_id>``."""
+     """\n\n**get** *<batch_id>* *<batch_id>* ... : Retrieve several batches """
+     """at once.  The batch ids can also be read from a file with """
+     """*--batches-from=*.  The batches are looked up and the requests """
+     """submitted concurrently, use *--concurrency=* to set the number at """
+     """once."""
+     """\n\n**get** *<batch_id>* *--include=<pattern>* *--exclude=<pattern>* """
+     """: Retrieve the files in a batch whose paths match any of the """
+     """*--include* patterns, and none of the *--exclude* patterns, e.g. """
+     """``jdma get 12 --include='*.nc' --exclude='tmp/*'``.\nThe patterns """
+     """are glob patterns, or regular expressions with *--regex*, and are """
+     """matched against the listing of the batch, so only the files, and """
+     """archives, selected are retrieved."""
     )
     ### Send the HTTP request (POST) to add a GET request to the
     ### MigrationRequests###
-    # get the batch id
+    # get the batch id, and any further batch ids to retrieve at the same time
+    batch_ids = []
     if len(args.arg):
-        batch_id = int(args.arg)
+        batch_ids.append(int(args.arg))
+    filelist = None
+    for opt in args.opts:
+        if opt.isdigit() and not os.path.isfile(opt):
+            batch_ids.append(int(opt))
+        else:
+            filelist = opt
+    if args.batches_from:
+        batch_ids.extend(read_idlist(args.batches_from))
+    if len(batch_ids):
+        batch_id = batch_ids[0]
     else:
         batch_id = None
-
-    if len(args.opts):
-        filelist = args.opts
-    else:
-        filelist = None
     # get the target directory if any
     if args.target:
         target_dir = os.path.abspath(args.target)
@@ -660,10 +1078,28 @@ def do_get(args):
     else:
         filelist = []
 
+    # select the files in the batch that match the patterns
+    if args.include or args.exclude:
+        if len(batch_ids) != 1:
+            error_message(
+                None,
+                "--include and --exclude require a single batch id to "
+                "retrieve (GET) for user",
+                args.json
+            )
+            return
+        filelist = select_get_files(batch_id, filelist, args)
+        if not filelist:
+            return
+
+    if len(batch_ids) > 1:
+        get_batches(batch_ids, filelist, target_dir, args)
+        return
+
     # get the batch so we can get the storage type and then get the credentials
     # for the storage type
     storage = args.storage
-    response = get_batch(
+    response = jdma_lib.get_batch(
         name=settings.USER,
         batch_id=batch_id,
     )
@@ -683,14 +1119,22 @@ def do_get(args):
     # get the credentials for the request
     storage, credentials = get_credentials(storage)
 
+    key = get_idempotency_key(args)
+    if already_submitted(key, args):
+        return
     # do the request
-    response = download_files(
-        name=settings.USER,
-        batch_id=batch_id,
-        filelist=filelist,
-        target_dir=target_dir,
-        credentials=credentials
-    )
+    try:
+        response = jdma_lib.download_files(
+            name=settings.USER,
+            batch_id=batch_id,
+            filelist=filelist,
+            target_dir=target_dir,
+            credentials=credentials,
+            idempotency_key=key
+        )
+    except Exception as e:
+        submit_error(e, key, args)
+        return
 
     if response.status_code == 200:
         data = response.json()
@@ -739,9 +1183,305 @@ def do_get(args):
         error_message(response, error_msg, args.json)
 
 
+def select_get_files(batch_id, filelist, args):
+    ("""Select the files in the batch to retrieve with the *--include* and """
+     """*--exclude* patterns, for do_get.  If a filelist was also given then """
+     """only the files in it are selected.  Returns the paths of the files """
+     """selected, or None if there was an error or no files were selected.""")
+    try:
+        if use_cache(args, batch_id, None, 0):
+            records = jdma_cache.cached_iter_files(
+                name=settings.USER,
+                batch_id=batch_id,
+                refresh=args.refresh == True
+            )
+        else:
+            records = jdma_lib.iter_files(
+                name=settings.USER,
+                batch_id=batch_id
+            )
+        if filelist:
+            filelist = set(filelist)
+            records = (r for r in records if r[2]["path"] in filelist)
+        selection = jdma_select.select_file_records(
+            records, args.include, args.exclude, regex=args.regex == True
+        )
+    except jdma_lib.JdmaResponseError as e:
+        error_msg = "cannot list files in batch {} for user".format(batch_id)
+        error_message(e.response, error_msg, args.json)
+        return None
+    except re.error as e:
+        error_message(
+            None, "invalid regular expression ({}) for user".format(e),
+            args.json
+        )
+        return None
+
+    if len(selection.paths) == 0:
+        if args.json == True:
+            output_json({"migration_id" : batch_id, "files" : 0,
+                         "selected" : 0})
+        else:
+            sys.stdout.write((
+                "{}** SELECT ** - no files in batch {} match the patterns, "
+                "not retrieving (GET) the batch{}\n"
+            ).format(bcolors.YELLOW, batch_id, bcolors.ENDC))
+        return None
+    if args.json != True and args.ndjson != True:
+        sys.stdout.write((
+            "{}** SELECT ** - {} of {} files, total size {}, in {} archives "
+            "selected from batch {}{}\n"
+        ).format(bcolors.MAGENTA, len(selection.paths), selection.n_files,
+                 sizeof_fmt(selection.total_size).strip(),
+                 len(selection.archives), batch_id, bcolors.ENDC))
+    return selection.paths
+
+
+def get_batches(batch_ids, filelist, target_dir, args):
+    ("""Retrieve several batches at once, for do_get.  The credentials for """
+     """each storage backend are only read once.  If the command is repeated """
+     """with *--idempotency-key* only the batches whose requests were not """
+     """created are submitted.""")
+    key = get_idempotency_key(args)
+    if args.concurrency:
+        max_workers = int(args.concurrency)
+    else:
+        max_workers = 4
+    results = jdma_lib.download_batches(
+        name=settings.USER,
+        batch_ids=batch_ids,
+        filelist=filelist,
+        target_dir=target_dir,
+        credentials=lambda storage: get_credentials(storage)[1],
+        max_workers=max_workers,
+        idempotency_key=key
+    )
+    if args.ndjson == True:
+        output_ndjson(results)
+        return
+    if args.json == True:
+        output_json({"requests" : results, "idempotency_key" : key})
+        return
+    requested = [data for data in results if "error" not in data]
+    if len(requested):
+        sys.stdout.write((
+            "{}** SUCCESS ** - {} retrievals (GET) requested:\n{}"
+        ).format(bcolors.GREEN, len(requested), bcolors.ENDC))
+        display_submitted(requested)
+    for data in results:
+        if "error" not in data:
+            continue
+        sys.stdout.write((
+            "{}** ERROR ** - cannot retrieve (GET) batch {} : {}{}\n"
+        ).format(bcolors.RED, data["migration_id"], data["error"],
+                 bcolors.ENDC))
+    display_resubmit(results, key)
+
+
+def get_idempotency_key(args):
+    ("""The idempotency key to submit a request with - the key given with """
+     """*--idempotency-key*, or a new key""")
+    if args.idempotency_key:
+        return args.idempotency_key
+    return jdma_lib.new_idempotency_key()
+
+
+def already_submitted(key, args):
+    ("""Has a request already been submitted with the key given with """
+     """*--idempotency-key*?  If so, the request is displayed.""")
+    if not args.idempotency_key:
+        return False
+    data = jdma_lib.submitted_request(name=settings.USER, idempotency_key=key)
+    if data is None:
+        # the request was not created - submit it again
+        return False
+    if args.json == True:
+        output_json(data)
+        return True
+    sys.stdout.write((
+        "{}** SUCCESS ** - request already submitted with idempotency key "
+        "{} : request id {}{}\n"
+    ).format(bcolors.GREEN, key, data["request_id"], bcolors.ENDC))
+    return True
+
+
+def submit_error(e, key, args):
+    ("""Report a failed call to submit a request, which the server may or """
+     """may not have created""")
+    error_msg = (
+        "{}.  The request may have been created: use jdma reconcile {} to "
+        "check, or repeat the command with --idempotency-key={} to submit it "
+        "without creating a duplicate request"
+    ).format(str(e), key, key)
+    if args.json == True:
+        output_json({"error" : error_msg, "idempotency_key" : key})
+        return
+    sys.stdout.write((
+        "{}** ERROR ** - {}{}\n"
+    ).format(bcolors.RED, error_msg, bcolors.ENDC))
+
+
+def do_reconcile(args):
+    ("""**reconcile** *<idempotency_key>* : Check whether the **put**, """
+     """**migrate**, **get** or **delete** request submitted with """
+     """*<idempotency_key>* was created, after the command failed.  Without """
+     """*<idempotency_key>* every request whose creation is not known is """
+     """checked.\nIf the request was not created it can be submitted again, """
+     """by repeating the command with *--idempotency-key=<idempotency_key>*.""")
+    journal = jdma_lib.get_default_client().journal
+    if len(args.arg):
+        entries = [journal.get(args.arg)]
+        if entries[0] is None:
+            error_msg = "idempotency key {} is not in the journal for user".format(
+                args.arg
+            )
+            error_message(None, error_msg, args.json)
+            return
+    else:
+        entries = journal.entries(settings.USER, pending=True)
+    results = []
+    for entry in entries:
+        try:
+            data = jdma_lib.reconcile_request(
+                name=settings.USER, idempotency_key=entry.key
+            )
+        except jdma_lib.JdmaResponseError as e:
+            error_message(e.response, "cannot list requests", args.json)
+            return
+        results.append((entry, data))
+
+    if args.json == True:
+        output_json({"requests" : [
+            {"idempotency_key" : entry.key, "request" : data}
+            for entry, data in results
+        ]})
+        return
+    if len(results) == 0:
+        sys.stdout.write((
+            "{}** SUCCESS ** - no requests to reconcile for user {}{}\n"
+        ).format(bcolors.GREEN, settings.USER, bcolors.ENDC))
+        return
+    for entry, data in results:
+        if data is None:
+            sys.stdout.write((
+                "{}** NOT CREATED ** - {} request with idempotency key {} : "
+                "repeat the command with --idempotency-key={}{}\n"
+            ).format(bcolors.YELLOW, entry.request_type, entry.key, entry.key,
+                     bcolors.ENDC))
+        elif "error" in data:
+            sys.stdout.write((
+                "{}** ERROR ** - {} request {} with idempotency key {} : {}{}\n"
+            ).format(bcolors.RED, entry.request_type, data["request_id"],
+                     entry.key, data["error"], bcolors.ENDC))
+        else:
+            sys.stdout.write((
+                "{}** SUCCESS ** - {} request with idempotency key {} : "
+                "request id {}, stage {}{}\n"
+            ).format(bcolors.GREEN, entry.request_type, entry.key,
+                     data["request_id"], get_request_stage(data["stage"]),
+                     bcolors.ENDC))
+
+
+def do_verify(args):
+    ("""**verify** *<batch_id>* : Verify the files retrieved from a batch by """
+     """**get** against the digests (checksums) recorded when the batch was """
+     """uploaded, reporting any files that are missing or corrupt.\nIf the """
+     """files were retrieved to a different target directory, specify it """
+     """with *--target=*.\nThe files are hashed in parallel, with a process """
+     """for each CPU.\nThe exit status is 1 if any of the files are missing, """
+     """corrupt or unreadable, or no files were verified, e.g. as none of """
+     """the files in the batch have digests.""")
+    if len(args.arg):
+        batch_id = int(args.arg)
+    else:
+        error_message(None, "no batch id given to verify for user", args.json)
+        sys.exit(1)
+    # get the target directory if any
+    if args.target:
+        target_dir = os.path.abspath(args.target)
+    else:
+        target_dir = None
+
+    try:
+        if use_cache(args, batch_id, None, 0):
+            files = jdma_cache.cached_iter_files(
+                name=settings.USER,
+                batch_id=batch_id,
+                digest=1,
+                refresh=args.refresh == True
+            )
+        else:
+            files = jdma_lib.iter_files(
+                name=settings.USER,
+                batch_id=batch_id,
+                digest=1
+            )
+        result = jdma_verify.verify_file_records(files, target_dir)
+    except jdma_lib.JdmaResponseError as e:
+        error_msg = "cannot list files in batch {} for user".format(batch_id)
+        error_message(e.response, error_msg, args.json)
+        sys.exit(1)
+
+    if args.json == True:
+        output_json({
+            "migration_id" : batch_id,
+            "files" : result.n_files,
+            "verified" : result.n_verified,
+            "size" : result.total_size,
+            "missing" : result.missing,
+            "corrupt" : [{"path" : p, "reason" : r} for p, r in result.corrupt],
+            "errors" : [{"path" : p, "error" : e} for p, e in result.errors],
+            "unchecked" : [
+                {"path" : p, "reason" : r} for p, r in result.unchecked
+            ]
+        })
+        if not result.ok:
+            sys.exit(1)
+        return
+
+    with TableWriter() as table:
+        C = table.colours
+        for path in result.missing:
+            table.write((
+                "{}** MISSING ** - {}{}\n"
+            ).format(C.RED, path, C.ENDC))
+        for path, reason in result.corrupt:
+            table.write((
+                "{}** CORRUPT ** - {} : {}{}\n"
+            ).format(C.RED, path, reason, C.ENDC))
+        for path, error in result.errors:
+            table.write((
+                "{}** ERROR ** - cannot read {} : {}{}\n"
+            ).format(C.RED, path, error, C.ENDC))
+        for path, reason in result.unchecked:
+            table.write((
+                "{}** WARNING ** - not verified {} : {}{}\n"
+            ).format(C.YELLOW, path, reason, C.ENDC))
+
+    if result.n_files == 0:
+        sys.stdout.write((
+            "{}** ERROR ** - No files found for user {} for batch {}{}\n"
+        ).format(bcolors.RED, settings.USER, batch_id, bcolors.ENDC))
+    elif result.ok:
+        sys.stdout.write((
+            "{}** SUCCESS ** - {} of {} files verified in batch {}, total size "
+            "{}{}\n"
+        ).format(bcolors.GREEN, result.n_verified, result.n_files, batch_id,
+                 sizeof_fmt(result.total_size).strip(), bcolors.ENDC))
+    else:
+        sys.stdout.write((
+            "{}** FAILED ** - {} of {} files verified in batch {} : {} "
+            "missing, {} corrupt, {} unreadable, {} unchecked{}\n"
+        ).format(bcolors.RED, result.n_verified, result.n_files, batch_id,
+                 len(result.missing), len(result.corrupt), len(result.errors),
+                 len(result.unchecked), bcolors.ENDC))
+    if not result.ok:
+        sys.exit(1)
+
+
 def do_storage(args):
     ("""**storage** : list the storage targets that batches can be written to.""")
-    response = get_storage()
+    response = jdma_lib.get_storage()
     storage = {}
     if response.status_code == 200:
         # parse the JSON that comes back
@@ -772,13 +1512,14 @@ def do_storage(args):
 def do_files(args):
     ("""**files** *<batch_id>* : List the original paths of files in a batch.\n"""
      """Use the *--simple* option to produce a simply formatted list which can be """
-     """used in conjunction with the **get** command to get a subset of the batch.""")
+     """used in conjunction with the **get** command to get a subset of the batch.\n"""
+     """The listing of a batch that is ON_STORAGE is cached locally, use """
+     """*--refresh* to refresh the cache or *--no-cache* to bypass it.\n"""
+     """Use *--export parquet|arrow|csv <file>* to export the listing to a """
+     """columnar file, rather than displaying it.""")
     ###Send the HTTP request (GET) to list the files in a Migration###
-    # get the batch id if any
-    if len(args.arg):
-        batch_id = int(args.arg)
-    else:
-        batch_id = None
+    # get the batch id if any, and the format and file to export to
+    batch_id, export_format, export_file = get_export_args(args)
 
     if args.workspace == "default":
         if args.filter == "workspace":
@@ -798,28 +1539,60 @@ def do_files(args):
     else:
         limit = 0
 
-    if args.digest:
+    if args.digest or export_format:
         digest = 1
     else:
         digest = 0
 
-    # do the request (POST)
-    response = get_files(
-        name=settings.USER,
-        batch_id=batch_id,
-        workspace=workspace,
-        limit=limit,
-        digest=digest,
-        ffilter=args.filter
-    )
+    if args.json == True and args.ndjson != True and not export_format:
+        # do the request (GET) for the whole JSON document
+        response = jdma_lib.get_files(
+            name=settings.USER,
+            batch_id=batch_id,
+            workspace=workspace,
+            limit=limit,
+            digest=digest,
+            ffilter=args.filter
+        )
+        if response.status_code == 200:
+            output_json(response.json())
+            return True
+    else:
+        try:
+            if use_cache(args, batch_id, workspace, limit):
+                # serve the listing from the local cache if it is unchanged
+                files = jdma_cache.cached_iter_files(
+                    name=settings.USER,
+                    batch_id=batch_id,
+                    digest=digest,
+                    refresh=args.refresh == True
+                )
+            else:
+                # iterate over the files, which are fetched as they are
+                # displayed
+                files = jdma_lib.iter_files(
+                    name=settings.USER,
+                    batch_id=batch_id,
+                    workspace=workspace,
+                    limit=limit,
+                    digest=digest,
+                    ffilter=args.filter
+                )
+            if export_format:
+                n_files = jdma_export.export_file_records(
+                    files, export_file, export_format
+                )
+                output_export(n_files, "files", export_file, args)
+            elif args.ndjson == True:
+                n_files = output_ndjson(file_records(files))
+            else:
+                n_files = display_files(files, args)
+            response = None
+        except jdma_lib.JdmaResponseError as e:
+            response = e.response
 
-    if response.status_code == 200:
-        data = response.json()
-        if args.json == True:
-            output_json(data)
-            return
-        n_mig = len(data["migrations"])
-        if n_mig == 0:
+    if response is None:
+        if n_files == 0 and args.json != True:
             error_msg = (
                 "{}** ERROR ** - No files found for user {}"
             ).format(bcolors.RED, settings.USER)
@@ -829,72 +1602,6 @@ def do_files(args):
                 error_msg += " in workspace " + workspace
             error_msg += bcolors.ENDC + "\n"
             sys.stdout.write(error_msg)
-        else:
-            if args.simple != True:
-                # print the header
-                sys.stdout.write(bcolors.MAGENTA)
-                sys.stdout.write((
-                    "{:>5} {:<16} {:<12} {:<12} {:<12} {:<18} {:<64} {:>8}"
-                ).format("b.id", "user", "workspace", "batch label",
-                         "storage", "archive", "file", "size"))
-                if args.digest == True:
-                    sys.stdout.write(("{:<72}").format(" digest"))
-                sys.stdout.write("\n"+bcolors.ENDC)
-            for r in data["migrations"]:
-                # print the migration details and the first archive details
-                n_a = len(r["archives"])
-                if n_a == 0:
-                    continue
-                c_a = 0
-                for a in r["archives"]:
-                    n_f = len(a["files"])
-                    c_f = 0
-                    for f in a["files"]:
-                        if args.simple == True:
-                            sys.stdout.write("{}\n".format(f["path"]))
-                            continue
-                        fname = f["path"][-64:]
-                        size = sizeof_fmt(f["size"])[0:8]
-                        # fancy underlining?
-                        if c_f == n_f-1 and c_a == n_a-1:
-                            sys.stdout.write(bcolors.UNDERLINE)
-                        if n_f > 1 and c_f == n_f-1:
-                            ULA = bcolors.UNDERLINE
-                        else:
-                            ULA = ""
-                        # determine what to print out
-                        if c_a == 0 and c_f == 0:
-                            M = r["migration_id"]
-                            U = r["user"][0:16]
-                            W = r["workspace"][0:12]
-                            L = r["label"][0:12]
-                            S = r["storage"][0:12]
-                        else:
-                            M = ""
-                            U = ""
-                            W = ""
-                            L = ""
-                            S = ""
-                        if c_f == 0:
-                            A = a["archive_id"][0:20]
-                        else:
-                            A = ""
-
-                        sys.stdout.write((
-                            "{:>5} {:<16} {:<12} {:<12} {:<12}" + ULA + " {:<18} {:<64} {:>8}"
-                        ).format(M, U, W, L, S, A,
-                                 fname,
-                                 size))
-                        if args.digest == True:
-                            digest = f["digest"]
-                            digest_format = f["digest_format"]
-                            sys.stdout.write(("{:>8}:{:<64}").format(
-                                digest_format,
-                                digest
-                            ))
-                        sys.stdout.write(bcolors.ENDC+"\n")
-                        c_f += 1
-                    c_a += 1
         return True
 
     else:
@@ -911,15 +1618,234 @@ def do_files(args):
         error_message(response, error_msg, args.json)
         return False
 
-def do_archives(args):
-    ("""**archives** *<batch_id>* : List the archives in a batch."""
-    )
-    ###Send the HTTP request (GET) to list the archives in a Migration###
-    # get the batch id if any
+def get_export_args(args):
+    ("""Get the batch id, if any, and the format and file to export to, for """
+     """the files and archives commands.  Returns `None` for the format if """
+     """the listing is not being exported, and raises a ValueError if the """
+     """format is not known.""")
     if len(args.arg):
         batch_id = int(args.arg)
     else:
         batch_id = None
+    if args.export is None:
+        return batch_id, None, None
+    export_format, export_file = args.export
+    if export_format not in jdma_export.EXPORT_FORMATS:
+        raise ValueError((
+            "unknown export format {}, must be one of {}"
+        ).format(export_format, " | ".join(jdma_export.EXPORT_FORMATS)))
+    return batch_id, export_format, export_file
+
+
+def output_export(n_records, kind, export_file, args):
+    """Report the number of files or archives exported to a file"""
+    if args.json == True:
+        output_json({"exported" : n_records, "file" : export_file})
+    elif n_records != 0:
+        sys.stdout.write((
+            "Exported {}{}{} {} to {}{}{}\n"
+        ).format(bcolors.GREEN, n_records, bcolors.ENDC, kind,
+                 bcolors.YELLOW, export_file, bcolors.ENDC))
+
+
+def do_index(args):
+    ("""**index** *sync* : Sync the local index of the files in all of your """
+     """batches, or all of the batches in a workspace with *--workspace=* """
+     """and *--filter=workspace*, so that they can be searched with the """
+     """**find** command.  Only the batches that have changed since the last """
+     """sync are fetched from the server.\nThe exit status is 1 if any of the """
+     """batches could not be synced.""")
+    if args.arg != "sync":
+        error_message(
+            None, "unknown index command {} for user".format(args.arg),
+            args.json
+        )
+        sys.exit(1)
+    if args.workspace in ("default", "all"):
+        workspace = None
+    else:
+        workspace = args.workspace
+    try:
+        result = jdma_cache.sync_index(
+            name=settings.USER,
+            workspace=workspace,
+            ffilter=args.filter
+        )
+    except jdma_lib.JdmaResponseError as e:
+        error_message(e.response, "cannot list batches", args.json)
+        sys.exit(1)
+
+    if args.json == True:
+        output_json({
+            "batches" : result.n_batches,
+            "synced" : result.n_synced,
+            "files" : result.n_files,
+            "removed" : result.n_removed,
+            "errors" : [
+                {"migration_id" : batch_id, "status_code" : r.status_code}
+                for batch_id, r in result.errors
+            ]
+        })
+        if len(result.errors):
+            sys.exit(1)
+        return
+    for batch_id, response in result.errors:
+        error_message(
+            response, "cannot list files in batch {}".format(batch_id),
+            args.json
+        )
+    sys.stdout.write((
+        "{}** SUCCESS ** - index synced: {} batches, {} synced with {} files, "
+        "{} removed{}\n"
+    ).format(bcolors.GREEN, result.n_batches, result.n_synced, result.n_files,
+             result.n_removed, bcolors.ENDC))
+    if len(result.errors):
+        sys.exit(1)
+
+
+def do_find(args):
+    ("""**find** *<pattern>* : Find which batches and archives contain the """
+     """files whose paths match *<pattern>*, using the local index built by """
+     """``jdma index sync``.\n*<pattern>* is a glob pattern, e.g. ``*.nc``, """
+     """which matches the end of the paths unless it is an absolute path, """
+     """or a regular expression with *--regex*.\nUse *--limit* to limit the """
+     """number of files found.\nThe exit status is 1 if no files are found.""")
+    if not len(args.arg):
+        error_message(None, "no pattern to find for user", args.json)
+        sys.exit(1)
+    # the index does not hold the digests of the files
+    args.digest = False
+    files = jdma_cache.find_files(
+        name=settings.USER,
+        pattern=args.arg,
+        regex=args.regex == True,
+        limit=int(args.limit)
+    )
+    if args.ndjson == True:
+        n_files = output_ndjson(file_records(files))
+    elif args.json == True:
+        records = list(file_records(files))
+        n_files = len(records)
+        output_json({"files" : records})
+    else:
+        n_files = display_files(files, args)
+    if n_files == 0 and args.json != True:
+        sys.stdout.write((
+            "{}** ERROR ** - No files found for user {} matching {}{}\n"
+        ).format(bcolors.RED, settings.USER, args.arg, bcolors.ENDC))
+    if n_files == 0:
+        sys.exit(1)
+
+
+def use_cache(args, batch_id, workspace, limit):
+    ("""Can the listing of the files or archives be served from the local """
+     """cache?  Only the complete listing of a single batch of the user is """
+     """cached.""")
+    return (args.no_cache != True and batch_id is not None and
+            workspace is None and args.filter == "user" and
+            int(limit) == 0)
+
+
+# the formats of the rows of the files and archives tables, built once
+FILE_BATCH_FORMAT = "{:>5} {:<16} {:<12} {:<12} {:<12}".format
+FILE_BATCH_BLANK = FILE_BATCH_FORMAT("", "", "", "", "")
+FILE_FORMAT = " {:<18} {:<64} {:>8}".format
+FILE_DIGEST_FORMAT = "{:>8}:{:<64}".format
+ARCHIVE_FORMAT = "{:>5} {:<16} {:<12} {:<12} {:<12} {:<18} {:>8}".format
+ARCHIVE_DIGEST_FORMAT = "{:>8}:{:<32}".format
+
+def file_records(records):
+    ("""Flatten the (batch, archive, file) records from do_files into a """
+     """single Dictionary per file, for NDJSON output""")
+    for r, a, f in records:
+        record = dict(r)
+        record["archive_id"] = a["archive_id"]
+        record.update(f)
+        yield record
+
+
+def display_files(records, args):
+    ("""Display the files from do_files as they are parsed from the response."""
+     """  Each file is displayed once the next file has been parsed, so that """
+     """the last file in each archive and batch can be underlined.  Returns """
+     """the number of files displayed.""")
+    n_files = 0
+    previous = None
+    current = None
+    with TableWriter() as table:
+        C = table.colours
+        for record in records:
+            if current is None:
+                if args.simple != True:
+                    # print the header
+                    header = FILE_BATCH_FORMAT(
+                        "b.id", "user", "workspace", "batch label", "storage"
+                    ) + FILE_FORMAT("archive", "file", "size")
+                    if args.digest == True:
+                        header += "{:<72}".format(" digest")
+                    table.write(C.MAGENTA + header + "\n" + C.ENDC)
+            else:
+                display_file(previous, current, record, args, table)
+            previous = current
+            current = record
+            n_files += 1
+        if current is not None:
+            display_file(previous, current, None, args, table)
+    return n_files
+
+
+def display_file(previous, current, following, args, table):
+    ("""Display a single file, as a (batch, archive, file) record.  The """
+     """previous and following records determine what to print out.""")
+    r, a, f = current
+    if args.simple == True:
+        table.write(f["path"] + "\n")
+        return
+    C = table.colours
+    first_in_archive = previous is None or previous[1] is not a
+    first_in_batch = previous is None or previous[0] is not r
+    last_in_archive = following is None or following[1] is not a
+    last_in_batch = following is None or following[0] is not r
+
+    fname = f["path"][-64:]
+    size = sizeof_fmt(f["size"])[0:8]
+    # fancy underlining?
+    if last_in_batch:
+        UL = C.UNDERLINE
+    else:
+        UL = ""
+    if last_in_archive and not first_in_archive:
+        ULA = C.UNDERLINE
+    else:
+        ULA = ""
+    # determine what to print out
+    if first_in_batch:
+        batch = FILE_BATCH_FORMAT(
+            r["migration_id"], r["user"][0:16], r["workspace"][0:12],
+            r["label"][0:12], r["storage"][0:12]
+        )
+    else:
+        batch = FILE_BATCH_BLANK
+    if first_in_archive:
+        A = a["archive_id"][0:20]
+    else:
+        A = ""
+    row = UL + batch + ULA + FILE_FORMAT(A, fname, size)
+    if args.digest == True:
+        row += FILE_DIGEST_FORMAT(f["digest_format"], f["digest"])
+    table.write(row + C.ENDC + "\n")
+
+
+def do_archives(args):
+    ("""**archives** *<batch_id>* : List the archives in a batch.\n"""
+     """The listing of a batch that is ON_STORAGE is cached locally, use """
+     """*--refresh* to refresh the cache or *--no-cache* to bypass it.\n"""
+     """Use *--export parquet|arrow|csv <file>* to export the listing to a """
+     """columnar file, rather than displaying it."""
+    )
+    ###Send the HTTP request (GET) to list the archives in a Migration###
+    # get the batch id if any, and the format and file to export to
+    batch_id, export_format, export_file = get_export_args(args)
 
     if args.workspace == "default":
         if args.filter == "workspace":
@@ -939,90 +1865,67 @@ def do_archives(args):
     else:
         limit = 0
 
-    if args.digest:
+    if args.digest or export_format:
         digest = 1
     else:
         digest = 0
 
-    # do the HTTP API call
-    response = get_archives(
-        name = settings.USER,
-        batch_id=batch_id,
-        workspace=workspace,
-        limit=limit,
-        digest=digest,
-        ffilter=args.filter
-    )
-
-    if response.status_code == 200:
-        data = response.json()
-        if args.json == True:
-            output_json(data)
+    if args.json == True and args.ndjson != True and not export_format:
+        # do the HTTP API call for the whole JSON document
+        response = jdma_lib.get_archives(
+            name = settings.USER,
+            batch_id=batch_id,
+            workspace=workspace,
+            limit=limit,
+            digest=digest,
+            ffilter=args.filter
+        )
+        if response.status_code == 200:
+            output_json(response.json())
             return
-        n_mig = len(data["migrations"])
-        if n_mig == 0:
+    else:
+        try:
+            if use_cache(args, batch_id, workspace, limit):
+                # serve the listing from the local cache if it is unchanged
+                archives = jdma_cache.cached_iter_archives(
+                    name=settings.USER,
+                    batch_id=batch_id,
+                    digest=digest,
+                    refresh=args.refresh == True
+                )
+            else:
+                # iterate over the archives, which are fetched as they are
+                # displayed
+                archives = jdma_lib.iter_archives(
+                    name = settings.USER,
+                    batch_id=batch_id,
+                    workspace=workspace,
+                    limit=limit,
+                    digest=digest,
+                    ffilter=args.filter
+                )
+            if export_format:
+                n_archives = jdma_export.export_archive_records(
+                    archives, export_file, export_format
+                )
+                output_export(n_archives, "archives", export_file, args)
+            elif args.ndjson == True:
+                n_archives = output_ndjson(archive_records(archives))
+            else:
+                n_archives = display_archives(archives, args)
+            response = None
+        except jdma_lib.JdmaResponseError as e:
+            response = e.response
+
+    if response is None:
+        if n_archives == 0 and args.json != True:
             error_msg = "no archives found"
             if batch_id:
                 error_msg += " for batch " + str(batch_id)
             if workspace:
                 error_msg += " in workspace " + workspace
             error_msg += " for user"
-            error_message(response, error_msg, args.json)
-        else:
-            if args.simple != True:
-                # print the header
-                sys.stdout.write(bcolors.MAGENTA)
-                sys.stdout.write((
-                    "{:>5} {:<16} {:<12} {:<12} {:<12} {:<18} {:>8}"
-                ).format("b.id", "user", "workspace", "batch label",
-                         "storage", "archive", "size"))
-                if args.digest == True:
-                    sys.stdout.write((" {:<40}").format("digest"))
-                sys.stdout.write("\n"+bcolors.ENDC)
-            for r in data["migrations"]:
-                # print the migration details and the first archive details
-                if len(r["archives"]) == 0:
-                    # deleted migrations have zero length archives
-                    continue
-                a = r["archives"][0]
-                if args.simple == True:
-                    sys.stdout.write(a["archive_id"] + "\n")
-                else:
-                    sys.stdout.write((
-                        "{:>5} {:<16} {:<12} {:<12} {:<12} {:<18} {:>8}"
-                    ).format(r["migration_id"],
-                             r["user"][0:16],
-                             r["workspace"][0:12],
-                             r["label"][0:12],
-                             r["storage"][0:12],
-                             a["archive_id"][0:20],
-                             sizeof_fmt(a["size"])))
-                    if args.digest == True:
-                        sys.stdout.write(("{:>8}:{:<32}").format(
-                            a["digest_format"],
-                            a["digest"]
-                        ))
-                    sys.stdout.write("\n")
-                # underline the last one
-                ac = 1
-                for a in r["archives"][1:]:
-                    if args.simple != True:
-                        if ac == len(r["archives"])-1:
-                            sys.stdout.write(bcolors.UNDERLINE)
-                        sys.stdout.write((
-                            "{:>5} {:<16} {:<12} {:<12} {:<12} {:<18} {:>8}"
-                        ).format("","","","","",
-                             a["archive_id"][0:20],
-                             sizeof_fmt(a["size"])))
-                        if args.digest == True:
-                            sys.stdout.write(("{:>8}:{:<32}").format(
-                                a["digest_format"],
-                                a["digest"]
-                            ))
-                        sys.stdout.write("\n"+bcolors.ENDC)
-                    else:
-                        sys.stdout.write(a["archive_id"] + "\n")
-                    ac += 1
+            error_message(None, error_msg, args.json)
 
     elif response.status_code != 500:
         error_data = response.json()
@@ -1034,6 +1937,82 @@ def do_archives(args):
     else:
         error_message(response, "", args.json)
 
+def archive_records(records):
+    ("""Flatten the (batch, archive) records from do_archives into a single """
+     """Dictionary per archive, for NDJSON output""")
+    for r, a in records:
+        record = dict(r)
+        record.update(a)
+        yield record
+
+
+def display_archives(records, args):
+    ("""Display the archives from do_archives as they are parsed from the """
+     """response.  Returns the number of archives displayed.""")
+    n_archives = 0
+    previous = None
+    current = None
+    with TableWriter() as table:
+        C = table.colours
+        for record in records:
+            if current is None:
+                if args.simple != True:
+                    # print the header
+                    header = ARCHIVE_FORMAT(
+                        "b.id", "user", "workspace", "batch label",
+                        "storage", "archive", "size"
+                    )
+                    if args.digest == True:
+                        header += " {:<40}".format("digest")
+                    table.write(C.MAGENTA + header + "\n" + C.ENDC)
+            else:
+                display_archive(previous, current, record, args, table)
+            previous = current
+            current = record
+            n_archives += 1
+        if current is not None:
+            display_archive(previous, current, None, args, table)
+    return n_archives
+
+
+def display_archive(previous, current, following, args, table):
+    ("""Display a single archive, as a (batch, archive) record.  The """
+     """previous and following records determine what to print out.""")
+    r, a = current
+    if args.simple == True:
+        table.write(a["archive_id"] + "\n")
+        return
+    C = table.colours
+    first_in_batch = previous is None or previous[0] is not r
+    last_in_batch = following is None or following[0] is not r
+    if first_in_batch:
+        # print the migration details and the first archive details
+        row = ARCHIVE_FORMAT(
+            r["migration_id"],
+            r["user"][0:16],
+            r["workspace"][0:12],
+            r["label"][0:12],
+            r["storage"][0:12],
+            a["archive_id"][0:20],
+            sizeof_fmt(a["size"])
+        )
+    else:
+        # underline the last one
+        if last_in_batch:
+            row = C.UNDERLINE
+        else:
+            row = ""
+        row += ARCHIVE_FORMAT(
+            "", "", "", "", "", a["archive_id"][0:20], sizeof_fmt(a["size"])
+        )
+    if args.digest == True:
+        row += ARCHIVE_DIGEST_FORMAT(a["digest_format"], a["digest"])
+    if first_in_batch:
+        table.write(row + "\n")
+    else:
+        table.write(row + "\n" + C.ENDC)
+
+
 def do_label(args):
     ("""**label** *<batch_id>* : Change the label of the batch with *<batch_id>*."""
     )
@@ -1050,14 +2029,14 @@ def do_label(args):
     else:
         label = None
     # call the library function
-    response = modify_batch(
+    response = jdma_lib.modify_batch(
         name = settings.USER,
         batch_id = batch_id,
         label = label
     )
     if response.status_code == 200:
         if args.json == True:
-            output_json(response.json)
+            output_json(response.json())
             return
         sys.stdout.write((
             "{}** SUCCESS ** - label of batch {} changed to: {}{}\n"
@@ -1077,26 +2056,66 @@ def main():
 
 | ``-l|--label=LABEL`` : Label to name or update the request."
 
-| ``-r | --target`` : Optional target directory for GET."
+| ``-r | --target`` : Optional target directory for GET, and the directory to verify the retrieved files in for **verify**."
 
 | ``-s | --storage`` : Specify external storage to use for migration.  Use command **storage** to list the available storage targets.  Default is given in the config file ``~/.jdma.json``.
 
-| ``-n | --limit`` : Limit the number of files output when using the **files** or **archives** command.
+| ``-n | --limit`` : Limit the number of files output when using the **files**, **archives** or **find** command.
 
 | ``-d | --digest`` : Show the digest when using the files or archives command.
 
 | ``-j | --json`` : Output JSON, rather than formatted output, for all commands.
 
+| ``--ndjson`` : Output newline delimited JSON, one record per line, for all commands.  The **request**, **batch**, **wait**, **files** and **archives** listings output one line per request, batch, archive or file, as they are received.
+
 | ``-t | --simple`` : Output simple listings for files and archives commands.
 
+| ``--scan`` : Scan the directory or filelist before a **put** or **migrate**, reporting the number and total size of the files and any files that cannot be read.
+
+| ``--send-filelist`` : Scan the directory or filelist before a **put** or **migrate** and send the list of files found, rather than the directory, with the request.
+
+| ``--dry-run`` : Validate and scan the directory or filelist of a **put** or **migrate**, reporting the number and total size of the files and any invalid paths, without submitting the request.
+
+| ``--since-batch=BATCH_ID`` : Only upload the files, in the directory or filelist of a **put** or **migrate**, that are new or have changed since the batch BATCH_ID was uploaded.  A file has changed if its size is different, or it was modified after the batch was registered.
+
+| ``--hash`` : With ``--since-batch``, hash the files modified after the batch was registered and only upload those whose digest is different.
+
+| ``--max-batch-size=SIZE`` : Split a **put** or **migrate** into several batches, each no larger than SIZE, e.g. ``10TB``.  The batches are labelled ``<label>.partNNN``.
+
+| ``--max-files-per-batch=N`` : Split a **put** or **migrate** into several batches, each with no more than N files.
+
+| ``--compress=gzip|zstd`` : Compress the bodies of the requests larger than 1MB, e.g. the filelist of a **put** or **migrate**, with gzip or zstd.  Only use this if the JDMA server accepts compressed request bodies.  Overrides the ``compression`` setting in the config file ``~/.jdma.json``.
+
+| ``--no-cache`` : Do not use the local cache of the listings of batches when using the **files** or **archives** command.
+
+| ``--refresh`` : Fetch the listing of a batch from the server, and refresh the local cache, when using the **files** or **archives** command.
+
+| ``--ids-from=FILE`` : Read the request ids for the **request** or **wait** command from a file, as well as from the command line.
+
+| ``--timeout=SECONDS`` : Maximum time to wait for requests to finish in the **wait** command.
+
+| ``--batches-from=FILE`` : Read the ids of the batches to retrieve with the **get** command from a file, as well as from the command line.
+
+| ``--concurrency=N`` : Number of batches to look up and submit at once when the **get** command retrieves several batches.  Default is 4.
+
+| ``--idempotency-key=KEY`` : Submit the request of a **put**, **migrate**, **get** or **delete** command with the idempotency key KEY.  If a request has already been created with KEY it is not submitted again.  Use this to retry a command that failed, with the key that it reported.  A command that submits several requests, a **put** or **migrate** split into several batches or a **get** of several batches, submits each with the key KEY.partNNN, and only the requests that were not created are submitted again.
+
+| ``--regex`` : The pattern of the **find** command, or the ``--include`` and ``--exclude`` patterns of the **get** command, are regular expressions, rather than glob patterns.
+
+| ``--include=PATTERN`` : Only retrieve the files, in the batch of a **get** command, whose paths match PATTERN, e.g. ``--include='*.nc'``.  A pattern that is not an absolute path matches the end of the paths.  Can be given more than once.
+
+| ``--exclude=PATTERN`` : Do not retrieve the files, in the batch of a **get** command, whose paths match PATTERN, e.g. ``--exclude='tmp/*'``.  Can be given more than once.
+
+| ``--export parquet|arrow|csv FILE`` : Export the listing of the **files** or **archives** command to FILE, e.g. ``jdma files 12 --export parquet files.parquet``.  The listing is streamed into the file in record batches and includes the digests.  The ``parquet`` and ``arrow`` formats require the pyarrow library.
+
 | ``-F | --force`` : Force deletion of batch, rather than prompting for user confirmation.
 
     """
     command_help = "Type help <command> to get help on a specific command"
     command_choices = ["init", "email", "info", "notify", "request", "batch",
                        "put", "get", "files", "label", "migrate",
-                       "archives", "delete", "storage",
-                       "help"]
+                       "archives", "delete", "storage", "wait", "reconcile",
+                       "verify", "index", "find", "help"]
     command_text = "[" + " | ".join(command_choices) + "]"
 
     parser = argparse.ArgumentParser(
@@ -1112,7 +2131,7 @@ def main():
         "arg", help="Argument to the command", default="", nargs="?"
     )
     parser.add_argument(
-        "opts", help="Options for the command", default="", nargs="?"
+        "opts", help="Options for the command", default=[], nargs="*"
     )
     parser.add_argument(
         "-e", "--email", action="store", default="",
@@ -1157,10 +2176,107 @@ def main():
         "-j", "--json", action="store_true", default="False",
         help=("Output JSON, rather than formatted output, for all commands.")
     )
+    parser.add_argument(
+        "--ndjson", action="store_true", default=False,
+        help=("Output newline delimited JSON, one record per line, rather "
+              "than formatted output, for all commands.")
+    )
     parser.add_argument(
         "-t", "--simple", action="store_true", default="False",
         help=("Output simple listings for files and archives commands.")
     )
+    parser.add_argument(
+        "--scan", action="store_true", default=False,
+        help=("Scan the directory or filelist before a put or migrate.")
+    )
+    parser.add_argument(
+        "--send-filelist", action="store_true", default=False,
+        help=("Scan the directory or filelist before a put or migrate and "
+              "send the list of files found with the request.")
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", default=False,
+        help=("Validate and scan the directory or filelist of a put or "
+              "migrate, without submitting the request.")
+    )
+    parser.add_argument(
+        "--since-batch", action="store", default="",
+        help=("Only put or migrate the files that are new, or have changed, "
+              "since this batch.")
+    )
+    parser.add_argument(
+        "--hash", action="store_true", default=False,
+        help=("With --since-batch, compare the digests of the files modified "
+              "since the batch.")
+    )
+    parser.add_argument(
+        "--max-batch-size", action="store", default="",
+        help=("Split a put or migrate into batches of at most this size, "
+              "e.g. 10TB.")
+    )
+    parser.add_argument(
+        "--max-files-per-batch", action="store", default="",
+        help=("Split a put or migrate into batches of at most this number of "
+              "files.")
+    )
+    parser.add_argument(
+        "--compress", action="store", default=None, choices=("gzip", "zstd"),
+        help=("Compress the large request bodies, e.g. the filelist of a put, "
+              "with gzip or zstd.  The server must accept compressed bodies.")
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", default=False,
+        help=("Do not use the local cache of file and archive listings.")
+    )
+    parser.add_argument(
+        "--refresh", action="store_true", default=False,
+        help=("Refresh the local cache of file and archive listings.")
+    )
+    parser.add_argument(
+        "--timeout", action="store", default="",
+        help=("Maximum time, in seconds, to wait for requests in the wait "
+              "command.")
+    )
+    parser.add_argument(
+        "--ids-from", action="store", default="",
+        help=("Read the ids for the request command from a file.")
+    )
+    parser.add_argument(
+        "--batches-from", action="store", default="",
+        help=("Read the ids of the batches for the get command from a file, "
+              "as well as from the command line.")
+    )
+    parser.add_argument(
+        "--concurrency", action="store", default="",
+        help=("Number of batches to retrieve at once in the get command.")
+    )
+    parser.add_argument(
+        "--idempotency-key", action="store", default="",
+        help=("Idempotency key to submit the request of a put, migrate, get "
+              "or delete command with.")
+    )
+    parser.add_argument(
+        "--regex", action="store_true", default=False,
+        help=("The pattern of the find command, or the --include and "
+              "--exclude patterns of the get command, are regular "
+              "expressions.")
+    )
+    parser.add_argument(
+        "--include", action="append", default=[],
+        help=("Only retrieve the files in the batch whose paths match the "
+              "pattern in the get command.  Can be given more than once.")
+    )
+    parser.add_argument(
+        "--exclude", action="append", default=[],
+        help=("Do not retrieve the files in the batch whose paths match the "
+              "pattern in the get command.  Can be given more than once.")
+    )
+    parser.add_argument(
+        "--export", action="store", default=None, nargs=2,
+        metavar=("FORMAT", "FILE"),
+        help=("Export the listing of the files or archives command to FILE, "
+              "in the FORMAT parquet | arrow | csv.")
+    )
     parser.add_argument(
         "-F", "--force", action="store_true", default="False",
         help=("Force deletion of batch, rather than prompting for user "
@@ -1174,16 +2290,36 @@ def main():
                'commands and "jdma help <command>" to show help for a command')
         sys.exit()
 
+    # NDJSON output is JSON output, with listings streamed one record per line
+    if args.ndjson == True:
+        args.json = True
+
     # read the credentials file if we are not initialising the user
     if args.cmd != "init":
         settings.user_credentials = read_credentials_file()
 
+    # compress the request bodies, overriding the config file
+    if args.compress:
+        http_settings = read_http_settings()
+        http_settings["compression"] = args.compress
+        jdma_lib.set_default_client(jdma_lib.JdmaClient(
+            journal=jdma_journal.RequestJournal(),
+            circuit_breaker_path=jdma_lib.default_circuit_breaker_path(),
+            **http_settings
+        ))
+
     method = globals().get("do_" + args.cmd)
 
     try:
         method(args)
     except KeyboardInterrupt:
         sys.stdout.write(("{}\n").format(bcolors.ENDC))
+    except BrokenPipeError:
+        # the output was closed early, e.g. a listing piped to head - stop
+        # quietly, without the interpreter complaining when stdout is flushed
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)
     except Exception as e:
         sys.stdout.write((
             "{}** ERROR ** - {} {}\n"
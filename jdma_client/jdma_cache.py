@@ -0,0 +1,515 @@
+"""
+Local, on-disk cache of the file and archive listings of batches.
+
+The listing of a batch does not change once the batch is ON_STORAGE, so it is
+stored in a SQLite database, by default at ``~/.cache/jdma/cache.sqlite``, the
+first time it is fetched, and served from there afterwards.  Each listing is
+keyed on the user, the batch id, whether it is a files or archives listing and
+whether it contains the digests.  A listing is invalidated, and fetched again,
+when the stage or the registered date of the batch changes.
+
+The cache also serves as an index of all of the files in the batches of a user
+(or workspace): :func:`sync_index` caches the listing of every batch that has
+changed since it was last synced, and :func:`find_files` searches the paths of
+the cached files, without contacting the server.  The paths are indexed, and so
+are the reversed paths, so that patterns that match the start, e.g.
+``/data/run1/*``, or the end, e.g. ``*.nc``, of the paths use an index.
+
+"""
+
+import os
+import re
+import json
+import sqlite3
+
+from jdma_client.jdma_lib import get_default_client, JdmaResponseError
+
+# the batch stage (see get_batch_stage) for which listings are cached
+CACHEABLE_BATCH_STAGE = 2     # ON_STORAGE
+
+# number of rows to write to the database in one go
+WRITE_CHUNK_SIZE = 10000
+
+# the batch stage of batches that have been deleted, whose listings are removed
+# from the index
+DELETED_BATCH_STAGE = 5
+
+# the characters with a special meaning in a GLOB pattern
+GLOB_SPECIAL = re.compile(r"[*?\[\]]")
+
+##### The cache database                                                   #####
+
+def default_cache_path():
+    """Path of the cache database - in $XDG_CACHE_HOME/jdma, or ~/.cache/jdma"""
+    cache_home = os.environ.get(
+        "XDG_CACHE_HOME", os.path.join(os.environ["HOME"], ".cache")
+    )
+    return os.path.join(cache_home, "jdma", "cache.sqlite")
+
+
+class ListingCache(object):
+    """SQLite cache of the file and archive listings of batches.
+
+       :param string path: (`optional`) path of the SQLite database.  If `none` then :func:`default_cache_path` is used.
+    """
+    def __init__(self, path=None):
+        if path is None:
+            path = default_cache_path()
+        self.path = path
+        cache_dir = os.path.dirname(path)
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, mode=0o700)
+        # wait for other processes that are writing to the cache
+        self.conn = sqlite3.connect(path, timeout=30)
+        self._create_tables()
+        # the number of listings written, to name their temporary tables
+        self.n_puts = 0
+
+    def _create_tables(self):
+        """Create the tables, if they do not exist"""
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS listings (
+                user TEXT, batch_id INTEGER, kind TEXT, digest INTEGER,
+                stage INTEGER, registered_date TEXT, migration TEXT,
+                PRIMARY KEY (user, batch_id, kind, digest)
+            );
+            CREATE TABLE IF NOT EXISTS archives (
+                user TEXT, batch_id INTEGER, kind TEXT, digest INTEGER,
+                archive_idx INTEGER, archive TEXT
+            );
+            CREATE INDEX IF NOT EXISTS archives_key ON archives (
+                user, batch_id, kind, digest, archive_idx
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                user TEXT, batch_id INTEGER, digest INTEGER, seq INTEGER,
+                archive_idx INTEGER, path TEXT, file TEXT, rpath TEXT
+            );
+            CREATE INDEX IF NOT EXISTS files_key ON files (
+                user, batch_id, digest, seq
+            );
+            CREATE INDEX IF NOT EXISTS files_path ON files (user, path);
+        """)
+        columns = [row[1] for row in self.conn.execute(
+            "PRAGMA table_info(files)"
+        )]
+        if "rpath" not in columns:
+            # add the reversed paths to a cache written by an earlier version
+            self.conn.create_function(
+                "REVERSE", 1, _reverse, deterministic=True
+            )
+            self.conn.execute("ALTER TABLE files ADD COLUMN rpath TEXT")
+            self.conn.execute("UPDATE files SET rpath=REVERSE(path)")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS files_rpath ON files (user, rpath)"
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get(self, user, batch_id, kind, digest, stage, registered_date):
+        """Get a listing from the cache, if it is present and the batch has
+           not changed since it was cached.
+
+           :return: A list of the records of the listing, as yielded by :func:`jdma_lib.iter_file_records` (for kind == "files") or :func:`jdma_lib.iter_archive_records` (for kind == "archives"), or `None` if the listing is not in the cache.
+        """
+        key = (user, batch_id, kind, digest)
+        row = self.conn.execute(
+            "SELECT stage, registered_date, migration FROM listings "
+            "WHERE user=? AND batch_id=? AND kind=? AND digest=?", key
+        ).fetchone()
+        if row is None:
+            return None
+        if row[0] != stage or row[1] != registered_date:
+            # the batch has changed - invalidate the listing
+            self.invalidate(user, batch_id)
+            return None
+        migration = json.loads(row[2])
+        # the records for the same archive share the same Dictionary
+        archives = []
+        for (archive,) in self.conn.execute(
+            "SELECT archive FROM archives "
+            "WHERE user=? AND batch_id=? AND kind=? AND digest=? "
+            "ORDER BY archive_idx", key
+        ):
+            archives.append(json.loads(archive))
+        if kind == "archives":
+            return [(migration, a) for a in archives]
+        return self._iter_files(user, batch_id, digest, migration, archives)
+
+    def is_current(self, user, batch_id, kind, digest, stage,
+                   registered_date):
+        """Is the listing in the cache, and unchanged since it was cached?"""
+        row = self.conn.execute(
+            "SELECT stage, registered_date FROM listings "
+            "WHERE user=? AND batch_id=? AND kind=? AND digest=?",
+            (user, batch_id, kind, digest)
+        ).fetchone()
+        return (row is not None and row[0] == stage and
+                row[1] == registered_date)
+
+    def batch_ids(self, user):
+        """Get the ids of the batches with a cached listing"""
+        return set(batch_id for (batch_id,) in self.conn.execute(
+            "SELECT DISTINCT batch_id FROM listings WHERE user=?", (user,)
+        ))
+
+    def find(self, user, pattern, regex=False, limit=0):
+        """Find the cached files whose paths match a pattern.
+
+           :param string pattern: (`required`) a glob pattern, matched against the whole path, or a regular expression, searched for in the path.
+           :param bool regex: (`optional`) the pattern is a regular expression.
+           :param integer limit: (`optional`) the maximum number of files to find.  `0` finds all the files.
+
+           :return: A generator of tuples of (**batch**, **archive**, **file**) Dictionaries, for each file found, in no particular order.
+        """
+        values = [user]
+        if regex:
+            matcher = re.compile(pattern).search
+            self.conn.create_function(
+                "REGEXP", 2,
+                lambda p, path: matcher(path) is not None,
+                deterministic=True
+            )
+            condition = "files.path REGEXP ?"
+            values.append(pattern)
+        else:
+            # GLOB is case sensitive, and so can use the index on the paths
+            # for a pattern with a literal prefix.  A pattern with a literal
+            # suffix, e.g. */tas.nc, but no literal prefix, uses the index on
+            # the reversed paths instead
+            condition = "files.path GLOB ?"
+            values.append(pattern)
+            suffix = GLOB_SPECIAL.split(pattern)[-1]
+            if GLOB_SPECIAL.match(pattern) and suffix:
+                condition += " AND files.rpath GLOB ?"
+                values.append(_reverse(suffix) + "*")
+        query = (
+            "SELECT files.batch_id, files.archive_idx, listings.migration, "
+            "archives.archive, files.file FROM files "
+            "JOIN listings ON listings.user=files.user AND "
+            "listings.batch_id=files.batch_id AND listings.kind='files' AND "
+            "listings.digest=files.digest "
+            "JOIN archives ON archives.user=files.user AND "
+            "archives.batch_id=files.batch_id AND archives.kind='files' AND "
+            "archives.digest=files.digest AND "
+            "archives.archive_idx=files.archive_idx "
+            "WHERE files.user=? AND " + condition + " "
+            # a file may be cached with and without its digest - only find
+            # it in the listing without the digests, as synced by sync_index,
+            # if there is one
+            "AND (files.digest=0 OR NOT EXISTS ("
+            "SELECT 1 FROM listings AS l WHERE l.user=files.user AND "
+            "l.batch_id=files.batch_id AND l.kind='files' AND l.digest=0))"
+        )
+        if limit:
+            query += " LIMIT ?"
+            values.append(int(limit))
+        migrations = {}
+        archives = {}
+        for batch_id, archive_idx, migration, archive, f in self.conn.execute(
+            query, values
+        ):
+            # the records for the same batch, and archive, share the same
+            # Dictionary
+            if batch_id not in migrations:
+                migrations[batch_id] = json.loads(migration)
+            if (batch_id, archive_idx) not in archives:
+                archives[batch_id, archive_idx] = json.loads(archive)
+            yield (migrations[batch_id], archives[batch_id, archive_idx],
+                   json.loads(f))
+
+    def _iter_files(self, user, batch_id, digest, migration, archives):
+        """Iterate over the cached files of a listing"""
+        cursor = self.conn.execute(
+            "SELECT archive_idx, file FROM files "
+            "WHERE user=? AND batch_id=? AND digest=? ORDER BY seq",
+            (user, batch_id, digest)
+        )
+        for archive_idx, f in cursor:
+            yield migration, archives[archive_idx], json.loads(f)
+
+    def put(self, user, batch_id, kind, digest, stage, registered_date,
+            records):
+        """Write a listing to the cache, as it is iterated over.  The records
+           are collected in temporary tables, which are private to this
+           connection and do not lock the cache, and the listing is only
+           stored, in one short transaction, once all of the records have been
+           iterated over.  Other processes can read from, and write to, the
+           cache while the listing is streamed from the server.
+
+           :return: A generator of the records.
+        """
+        key = (user, batch_id, kind, digest)
+        # the temporary tables are named for each put, so that listings can be
+        # written to the cache at the same time
+        self.n_puts += 1
+        new_archives = "temp.new_archives_{}".format(self.n_puts)
+        new_files = "temp.new_files_{}".format(self.n_puts)
+        self.conn.execute(
+            "CREATE TABLE {} (archive_idx INTEGER, archive TEXT)".format(
+                new_archives
+            )
+        )
+        self.conn.execute(
+            "CREATE TABLE {} (seq INTEGER, archive_idx INTEGER, path TEXT, "
+            "file TEXT, rpath TEXT)".format(new_files)
+        )
+        migration = None
+        archive = None
+        archive_idx = -1
+        rows = []
+        seq = 0
+        try:
+            for record in records:
+                if migration is None:
+                    migration = record[0]
+                # the records for the same archive are consecutive and share
+                # the same Dictionary
+                if record[1] is not archive:
+                    archive = record[1]
+                    archive_idx += 1
+                    self.conn.execute(
+                        "INSERT INTO {} VALUES (?, ?)".format(new_archives),
+                        (archive_idx, json.dumps(archive))
+                    )
+                if kind == "files":
+                    path = record[2]["path"]
+                    rows.append((seq, archive_idx, path,
+                                 json.dumps(record[2]), _reverse(path)))
+                    seq += 1
+                    if len(rows) == WRITE_CHUNK_SIZE:
+                        self._write_files(new_files, rows)
+                        rows = []
+                yield record
+            self._write_files(new_files, rows)
+            # replace the listing in the cache
+            self._delete(user, batch_id, kind, digest)
+            if migration is not None:
+                self.conn.execute(
+                    "INSERT INTO archives SELECT ?, ?, ?, ?, archive_idx, "
+                    "archive FROM {}".format(new_archives), key
+                )
+                self.conn.execute(
+                    "INSERT INTO files SELECT ?, ?, ?, seq, archive_idx, "
+                    "path, file, rpath FROM {}".format(new_files),
+                    (user, batch_id, digest)
+                )
+                self.conn.execute(
+                    "INSERT INTO listings VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    key + (stage, registered_date, json.dumps(migration))
+                )
+            self.conn.commit()
+        finally:
+            # discard a partially written listing
+            self.conn.rollback()
+            self.conn.execute("DROP TABLE IF EXISTS " + new_archives)
+            self.conn.execute("DROP TABLE IF EXISTS " + new_files)
+
+    def _write_files(self, table, rows):
+        self.conn.executemany(
+            "INSERT INTO {} VALUES (?, ?, ?, ?, ?)".format(table), rows
+        )
+
+    def invalidate(self, user, batch_id, kind=None, digest=None):
+        """Remove the listings for a batch from the cache"""
+        self._delete(user, batch_id, kind, digest)
+        self.conn.commit()
+
+    def _delete(self, user, batch_id, kind=None, digest=None):
+        for table in ("listings", "archives", "files"):
+            query = "DELETE FROM {} WHERE user=? AND batch_id=?".format(table)
+            values = [user, batch_id]
+            if kind is not None and table != "files":
+                query += " AND kind=?"
+                values.append(kind)
+            elif kind is not None and kind != "files":
+                continue
+            if digest is not None:
+                query += " AND digest=?"
+                values.append(digest)
+            self.conn.execute(query, values)
+
+def _reverse(path):
+    """Reverse a path, to index the ends of the paths"""
+    return path[::-1]
+
+##### Cached listings                                                      #####
+
+def cached_iter_files(name, batch_id, digest=0, refresh=False, cache=None,
+                      client=None):
+    """Iterate over the files in a batch, serving the listing from the local
+       cache if the batch is ON_STORAGE and has not changed since the listing
+       was cached.  Otherwise the listing is fetched with
+       :func:`jdma_lib.iter_files` (and cached, if the batch is ON_STORAGE).
+
+       :param string name: (`required`) name of the user to get files for.
+       :param integer batch_id: (`required`) batch id to list files for.
+       :param integer digest: (`optional`) output the digest (checksum) for each file.
+       :param bool refresh: (`optional`) fetch the listing from the server, and replace the cached listing.
+       :param ListingCache cache: (`optional`) the cache to use.  If `none` then the cache at the default path is used.
+       :param JdmaClient client: (`optional`) the client to use.  If `none` then the default client is used.
+
+       :return: An iterable of tuples of (**batch**, **archive**, **file**) Dictionaries.  A **JdmaResponseError** is raised if the server returns an error.
+    """
+    return _cached_iter(name, batch_id, "files", digest, refresh, cache,
+                        client)
+
+
+def cached_iter_archives(name, batch_id, digest=0, refresh=False, cache=None,
+                         client=None):
+    """Iterate over the archives in a batch, serving the listing from the
+       local cache if possible.  See :func:`cached_iter_files`.
+
+       :return: An iterable of tuples of (**batch**, **archive**) Dictionaries.
+    """
+    return _cached_iter(name, batch_id, "archives", digest, refresh, cache,
+                        client)
+
+
+def _cached_iter(name, batch_id, kind, digest, refresh, cache, client):
+    if client is None:
+        client = get_default_client()
+    if kind == "files":
+        iter_listing = client.iter_files
+    else:
+        iter_listing = client.iter_archives
+    # get the batch to check its stage and date
+    response = client.get_batch(name, batch_id=batch_id)
+    if response.status_code != 200:
+        raise JdmaResponseError(response)
+    batch = response.json()
+    listing = iter_listing(name, batch_id=batch_id, digest=digest)
+    if batch["stage"] != CACHEABLE_BATCH_STAGE:
+        return listing
+
+    if cache is None:
+        cache = ListingCache()
+    stage = batch["stage"]
+    registered_date = batch.get("registered_date")
+    if not refresh:
+        records = cache.get(
+            name, batch_id, kind, digest, stage, registered_date
+        )
+        if records is not None:
+            return records
+    return cache.put(
+        name, batch_id, kind, digest, stage, registered_date, listing
+    )
+
+##### Index of the files in all of the batches                             #####
+
+class SyncResult(object):
+    """The result of syncing the index of the files in the batches.
+
+       - **n_batches** (`integer`): the number of batches in the index
+       - **n_synced** (`integer`): the number of batches whose listings were fetched, as they had changed since they were last synced
+       - **n_files** (`integer`): the number of files in the listings that were fetched
+       - **n_removed** (`integer`): the number of batches removed from the index, as they have been deleted
+       - **errors** (`List`): a list of (**batch_id**, **response**) tuples, one for each batch whose listing could not be fetched
+    """
+    def __init__(self):
+        self.n_batches = 0
+        self.n_synced = 0
+        self.n_files = 0
+        self.n_removed = 0
+        self.errors = []
+
+
+def sync_index(name, workspace=None, ffilter=None, cache=None, client=None):
+    """Sync the local index of the files in all of the batches of a user, or a
+       workspace.  Only the listings of the batches whose stage or registered
+       date has changed since they were last synced are fetched, and the
+       listings of deleted batches are removed.
+
+       :param string name: (`required`) name of the user.
+       :param string workspace: (`optional`) only sync the batches in this workspace.
+       :param string ffilter: (`optional`) filter the batches on `user` or `workspace`, as in :func:`jdma_lib.get_batch`.
+       :param ListingCache cache: (`optional`) the cache to use.  If `none` then the cache at the default path is used.
+       :param JdmaClient client: (`optional`) the client to use.  If `none` then the default client is used.
+
+       :raises JdmaResponseError: if the server returned an error.
+
+       :return: The numbers of batches and files synced.
+       :rtype: SyncResult
+    """
+    if client is None:
+        client = get_default_client()
+    if cache is not None:
+        return _sync_index(name, workspace, ffilter, cache, client)
+    # close the cache that is opened here
+    with ListingCache() as cache:
+        return _sync_index(name, workspace, ffilter, cache, client)
+
+
+def _sync_index(name, workspace, ffilter, cache, client):
+    response = client.get_batch(name, workspace=workspace, ffilter=ffilter)
+    if response.status_code != 200:
+        raise JdmaResponseError(response)
+    result = SyncResult()
+    batch_ids = set()
+    for batch in response.json()["migrations"]:
+        batch_id = batch["migration_id"]
+        stage = batch["stage"]
+        registered_date = batch.get("registered_date")
+        if stage == DELETED_BATCH_STAGE:
+            continue
+        batch_ids.add(batch_id)
+        if cache.is_current(
+            name, batch_id, "files", 0, stage, registered_date
+        ):
+            continue
+        listing = client.iter_files(name, batch_id=batch_id, digest=0)
+        try:
+            for record in cache.put(
+                name, batch_id, "files", 0, stage, registered_date, listing
+            ):
+                result.n_files += 1
+        except JdmaResponseError as e:
+            # carry on with the other batches
+            result.errors.append((batch_id, e.response))
+            continue
+        result.n_synced += 1
+    # remove the batches that have been deleted.  Only a sync of all the
+    # user's batches knows which batches no longer exist
+    if workspace is None and ffilter in (None, "user"):
+        removed = cache.batch_ids(name) - batch_ids
+    else:
+        removed = set(
+            batch["migration_id"] for batch in response.json()["migrations"]
+            if batch["stage"] == DELETED_BATCH_STAGE
+        ) & cache.batch_ids(name)
+    for batch_id in removed:
+        cache.invalidate(name, batch_id)
+    result.n_removed = len(removed)
+    result.n_batches = len(cache.batch_ids(name))
+    return result
+
+
+def find_files(name, pattern, regex=False, limit=0, cache=None):
+    """Find which batches and archives contain the files whose paths match a
+       pattern, using the local index, built by :func:`sync_index`.  The
+       server is not contacted.
+
+       :param string name: (`required`) name of the user.
+       :param string pattern: (`required`) a glob pattern or, if **regex** is `True`, a regular expression.  A glob pattern that is not an absolute path, e.g. ``*.nc``, matches the end of the paths.
+       :param bool regex: (`optional`) the pattern is a regular expression, which is searched for in the paths.
+       :param integer limit: (`optional`) the maximum number of files to find.  `0` finds all the files.
+       :param ListingCache cache: (`optional`) the cache to use.  If `none` then the cache at the default path is used.
+
+       :return: A generator of tuples of (**batch**, **archive**, **file**) Dictionaries, for each file found, in no particular order.
+    """
+    if not regex and not pattern.startswith("/") and not pattern.startswith("*"):
+        pattern = "*/" + pattern
+    if cache is not None:
+        yield from cache.find(name, pattern, regex=regex, limit=limit)
+        return
+    # close the cache that is opened here, once the files have been found
+    with ListingCache() as cache:
+        yield from cache.find(name, pattern, regex=regex, limit=limit)
@@ -1,10 +1,13 @@
-"""Common functions for the jdma client"""
-from jinja2 import Environment, FunctionLoader
+"""Common functions for the jdma client.
+
+This module is imported by every command of the command line tool, so it
+should import only light-weight modules.  The heavier modules (requests,
+jinja2) are imported inside the functions that use them."""
 import os
 import sys
 import json
 import math
-import requests
+import importlib.util
 
 ####################### Settings for the user / server etc ####################
 
@@ -26,6 +29,21 @@ class settings:
     user_credentials = {}
     DEBUG = True
 
+##### Lazy imports ######
+
+def lazy_import(name):
+    ("""Import a module lazily - the module is only loaded when one of its """
+     """attributes is first used.""")
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
 ##### Lovely colours! ######
 
 class bcolors:
@@ -43,6 +61,7 @@ class bcolors:
 
 def load_template_from_url(url):
     """Load a Jinja2 template from a URL"""
+    import requests
     # fetch the template from the URL as a string
     response = requests.get(url)
     if response.status_code != 200:
@@ -56,54 +75,68 @@ def load_template_from_url(url):
 ##### Some helper functions to convert the numerical request types, stages #####
 ##### and batch stages into strings                                        #####
 
+# the request types, stages and batch stages, indexed by their numbers.  See
+# jdma_control.models.MigrationRequest and jdma_control.models.Migration for
+# details.  These are built once, as the get_ functions below are called for
+# every row of a listing.
+REQUEST_TYPES = ("PUT", "GET", "MIGRATE", "DELETE")
+
+REQUEST_STAGES = {
+      0 : 'PUT_START',
+      1 : 'PUT_BUILDING',
+      2 : 'PUT_PENDING',
+      3 : 'PUT_PACK',
+      4 : 'PUTTING',
+      5 : 'VERIFY_PENDING',
+      6 : 'VERIFY_GETTING',
+      7 : 'VERIFYING',
+      8 : 'PUT_TIDY',
+      9 : 'PUT_COMPLETED',
+    100 : 'GET_START',
+    101 : 'GET_PENDING',
+    102 : 'GETTING',
+    103 : 'GET_UNPACK',
+    104 : 'GET_RESTORE',
+    105 : 'GET_TIDY',
+    106 : 'GET_COMPLETED',
+    200 : 'DELETE_START',
+    201 : 'DELETE_PENDING',
+    202 : 'DELETING',
+    203 : 'DELETE_TIDY',
+    204 : 'DELETE_COMPLETED',
+   1000 : 'FAILED',
+   1001 : 'FAILED_COMPLETED'
+}
+
+BATCH_STAGES = {
+    0 : 'ON_DISK',
+    1 : 'PUTTING',
+    2 : 'ON_STORAGE',
+    3 : 'FAILED',
+    4 : 'DELETING',
+    5 : 'DELETED'
+}
+
+
 def get_request_type(req_type):
     ("""Get a string from a request type integer.  See """
      """jdma_control.models.MigrationRequest for details""")
-    request_types = ["PUT", "GET", "MIGRATE", "DELETE"]
-    return request_types[req_type]
+    return REQUEST_TYPES[req_type]
 
 
 def get_request_stage(stage):
-    request_stages = {
-          0 : 'PUT_START',
-          1 : 'PUT_BUILDING',
-          2 : 'PUT_PENDING',
-          3 : 'PUT_PACK',
-          4 : 'PUTTING',
-          5 : 'VERIFY_PENDING',
-          6 : 'VERIFY_GETTING',
-          7 : 'VERIFYING',
-          8 : 'PUT_TIDY',
-          9 : 'PUT_COMPLETED',
-        100 : 'GET_START',
-        101 : 'GET_PENDING',
-        102 : 'GETTING',
-        103 : 'GET_UNPACK',
-        104 : 'GET_RESTORE',
-        105 : 'GET_TIDY',
-        106 : 'GET_COMPLETED',
-        200 : 'DELETE_START',
-        201 : 'DELETE_PENDING',
-        202 : 'DELETING',
-        203 : 'DELETE_TIDY',
-        204 : 'DELETE_COMPLETED',
-       1000 : 'FAILED',
-       1001 : 'FAILED_COMPLETED'
-    }
-
-    return request_stages[stage]
+    return REQUEST_STAGES[stage]
+
+
+# the request stages at which a request has finished, either successfully
+# (PUT_COMPLETED, GET_COMPLETED, DELETE_COMPLETED) or not (FAILED,
+# FAILED_COMPLETED)
+REQUEST_TERMINAL_STAGES = (9, 106, 204, 1000, 1001)
+REQUEST_FAILED_STAGES = (1000, 1001)
 
 
 def get_batch_stage(stage):
-    batch_stages = {
-        0 : 'ON_DISK',
-        1 : 'PUTTING',
-        2 : 'ON_STORAGE',
-        3 : 'FAILED',
-        4 : 'DELETING',
-        5 : 'DELETED'
-    }
-    return batch_stages[stage]
+    return BATCH_STAGES[stage]
 
 ##### Helper function to convert permission numbers into string representations
 
@@ -126,6 +159,7 @@ def create_credentials_file(name, workspace="default"):
     # form the config file name
     jdma_user_config_filename = os.environ["HOME"] + "/" + ".jdma.json"
     if not os.path.exists(jdma_user_config_filename):
+        from jinja2 import Environment, FunctionLoader
         env = Environment(loader=FunctionLoader(load_template_from_url))
         template = env.get_template(settings.JDMA_CONFIG_URL)
         with open(jdma_user_config_filename, 'w') as fh:
@@ -167,28 +201,100 @@ def read_credentials_file(user_home=""):
 
     return jdma_user_credentials
 
+# the settings that can be given in the "http" section of ~/.jdma.json
+HTTP_SETTINGS = ("connect_timeout", "read_timeout", "post_read_timeout",
+                 "retries", "backoff_factor", "circuit_breaker_failures",
+                 "circuit_breaker_reset", "compression", "compress_threshold")
+
+
+def read_http_settings(user_home=""):
+    ("""Read the settings for the HTTP calls to the JDMA server (timeouts, """
+     """retries, circuit breaker and compression) from the "http" section """
+     """of ~/.jdma.json.  If the credentials have already been read into """
+     """settings.user_credentials then they are used, otherwise the file is """
+     """read, if it exists.  Returns a dictionary of the keyword arguments """
+     """for a JdmaClient.""")
+    jdma_user_credentials = settings.user_credentials
+    if not jdma_user_credentials:
+        if user_home == "":
+            user_home = os.environ["HOME"]
+        jdma_user_config_filename = user_home + "/" + ".jdma.json"
+        try:
+            with open(jdma_user_config_filename) as fp:
+                jdma_user_credentials = json.load(fp)
+        except (IOError, ValueError):
+            return {}
+    http_settings = jdma_user_credentials.get("http", {})
+    for key in http_settings:
+        if key not in HTTP_SETTINGS:
+            raise Exception(
+                "Unknown setting in the http section of ~/.jdma.json: {}"
+                .format(key)
+            )
+    return dict(http_settings)
+
 unit_list = list(zip(['bytes', 'kB', 'MB', 'GB', 'TB', 'PB', 'EB'],
                      [0, 0, 1, 1, 1, 1, 1]))
+# the format for each unit, built once as sizeof_fmt is called for every row
+# of a listing
+size_formats = [('{:>5.%sf} %s' % (num_decimals, unit)).format
+                for unit, num_decimals in unit_list]
 
 
 def sizeof_fmt(num):
     """Human friendly file size"""
     if num > 1:
         exponent = min(int(math.log(num, 1024)), len(unit_list) - 1)
-        quotient = float(num) / 1024**exponent
-        unit, num_decimals = unit_list[exponent]
-        format_string = '{:>5.%sf} {}' % (num_decimals)
-        return format_string.format(quotient, unit)
+        return size_formats[exponent](float(num) / 1024**exponent)
     elif num == 1:
         return '1 byte'
     else:
         return '0 bytes'
 
-def output_json(json):
-    # output json to the command line in a format that can be read by jq
-    json_string = str(json)
-    json_string2 = json_string.replace("'", '"').replace('u"', '"')
-    print(json_string2)
+def parse_size(size_str):
+    ("""Convert a human friendly size, e.g. 500GB, 10T or 1024, into a """
+     """number of bytes""")
+    size_str = size_str.strip().upper()
+    if size_str.endswith("BYTES"):
+        size_str = size_str[:-5]
+    elif size_str.endswith("B"):
+        size_str = size_str[:-1]
+    units = "KMGTPE"
+    exponent = 0
+    if len(size_str) > 0 and size_str[-1] in units:
+        exponent = units.index(size_str[-1]) + 1
+        size_str = size_str[:-1]
+    return int(float(size_str) * 1024**exponent)
+
+
+def output_json(data):
+    ("""Output data to the command line as a JSON document, on a single """
+     """line, that can be read by jq""")
+    sys.stdout.write(json.dumps(data) + "\n")
+
+
+def output_ndjson(records, out=None):
+    ("""Output records to the command line as newline delimited JSON """
+     """(NDJSON), one JSON document per line, as they are produced.  The """
+     """lines are written in chunks.  Returns the number of records """
+     """output.""")
+    if out is None:
+        out = sys.stdout
+    n_records = 0
+    lines = []
+    for record in records:
+        lines.append(json.dumps(record))
+        n_records += 1
+        if len(lines) == NDJSON_LINES_PER_WRITE:
+            out.write("\n".join(lines) + "\n")
+            lines = []
+    if lines:
+        out.write("\n".join(lines) + "\n")
+    out.flush()
+    return n_records
+
+# number of NDJSON lines to collect before writing them to the output
+NDJSON_LINES_PER_WRITE = 4096
 
 
 def user_not_initialized_message():
@@ -214,7 +320,7 @@ def print_response_error(response):
                 display=False
 
 
-def error_message(response, message, output_json):
+def error_message(response, message, json_output):
     # get the reason why it failed
     user = settings.USER
     error = ""
@@ -227,7 +333,7 @@ def error_message(response, message, output_json):
             user = json_response['name']
         if 'workspace' in json_response:
             workspace = json_response['workspace']
-        if output_json == True:
+        if json_output == True:
             output_json(json_response)
             return
     except:
@@ -235,6 +341,13 @@ def error_message(response, message, output_json):
             error = str(response.status_code)
         except:
             error = ""
+    if json_output == True:
+        # there is no JSON response, so output the message as JSON
+        json_error = "{} {}".format(message, user).strip()
+        if error != "":
+            json_error += " : " + error
+        output_json({"error" : json_error})
+        return
     out_message = "{}** ERROR ** - {} {}"
     # if workspace != "":
     #     out_message += " in workspace {}".format(workspace)
@@ -270,19 +383,95 @@ def get_credentials(storage):
     return storage, credentials
 
 
-def read_filelist(path):
-    filelist = []
-    fh = open(path)
-    flist = fh.read()
-    # split the file and add to the data as "filelist" - add the absolute
-    # paths, though
-    flist_split = flist.split()
-    flist_split = map(str.strip, flist_split)
-
-    filelist = []
-    for f in flist_split:
-        filelist.append(f)
-    fh.close()
+# size of the blocks to read filelists in
+FILELIST_BLOCK_SIZE = 1024 * 1024
+
+
+def _open_filelist(path):
+    ("""Open a filelist for reading, as binary, decompressing it if it is """
+     """gzip compressed""")
+    with open(path, "rb") as fh:
+        magic = fh.read(2)
+    if magic == b"\x1f\x8b":
+        import gzip
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def iter_filelist(path, delimiter=None, unique=True):
+    ("""Iterate over the paths in a filelist, reading it a block at a time """
+     """so that the whole filelist is never held in memory.  The paths are """
+     """separated by newlines or, if the filelist contains any NUL """
+     """characters (e.g. the output of ``find -print0``), by NULs.  Gzip """
+     """compressed filelists are decompressed as they are read.  Each path """
+     """is normalised (``os.path.normpath``), empty lines are skipped and, """
+     """if ``unique`` is True, duplicate paths are removed.  Pass """
+     """``unique=False`` to keep the duplicates, e.g. to report them.""")
+    seen = set()
+    with _open_filelist(path) as fh:
+        block = fh.read(FILELIST_BLOCK_SIZE)
+        if delimiter is None:
+            if b"\0" in block:
+                delimiter = b"\0"
+            else:
+                delimiter = b"\n"
+        elif isinstance(delimiter, str):
+            delimiter = delimiter.encode("utf-8")
+        remainder = b""
+        while block:
+            entries = (remainder + block).split(delimiter)
+            # the last entry may be incomplete - carry it over to the next
+            # block
+            remainder = entries.pop()
+            for entry in entries:
+                f = _normalise_filelist_entry(entry)
+                if f is None:
+                    continue
+                if unique:
+                    if f in seen:
+                        continue
+                    seen.add(f)
+                yield f
+            block = fh.read(FILELIST_BLOCK_SIZE)
+        f = _normalise_filelist_entry(remainder)
+        if f is not None and not (unique and f in seen):
+            yield f
+
+
+def _normalise_filelist_entry(entry):
+    ("""Decode and normalise a single entry of a filelist, returning None """
+     """for an empty entry""")
+    f = entry.decode("utf-8", "surrogateescape").rstrip("\r\n")
+    if f.strip() == "":
+        return None
+    return os.path.normpath(f)
+
+
+class Filelist(object):
+    ("""The paths in a filelist, which is read, a block at a time, each """
+     """time that it is iterated over, see iter_filelist.  Unlike the """
+     """generator returned by iter_filelist, it can be iterated over more """
+     """than once, e.g. to validate the filelist and then send it.""")
+    def __init__(self, path, delimiter=None, unique=True):
+        self.path = path
+        self.delimiter = delimiter
+        self.unique = unique
+
+    def __iter__(self):
+        return iter_filelist(self.path, self.delimiter, self.unique)
+
+
+def read_filelist(path, unique=True):
+    ("""Read a filelist into a list of paths, see iter_filelist""")
+    filelist = list(iter_filelist(path, unique=unique))
     if len(filelist) == 0:
         raise Exception("Filelist {} has no files".format(path))
     return filelist
+
+
+def read_idlist(path):
+    ("""Read a list of integer ids (of requests or batches) from a file, """
+     """separated by whitespace""")
+    with open(path) as fh:
+        idlist = [int(i) for i in fh.read().split()]
+    return idlist
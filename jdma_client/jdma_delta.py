@@ -0,0 +1,165 @@
+"""
+Incremental (delta) uploads: find the files in a directory or filelist that
+are new, or have changed, since a previous batch was uploaded, so that only
+they are uploaded in a new batch.
+
+The listing of the previous batch is read into a compact index, keyed on the
+path of each file, with the size and digest of the file.  Each file found by a
+local scan (see :func:`jdma_scan.scan_paths`) is then looked up in the index,
+so the comparison is O(n) in the number of files.  A file is new if it is not
+in the index, and changed if its size is different, or it was modified after
+the previous batch was registered.  Optionally, the files modified after the
+batch was registered are hashed, in parallel, and only the files whose digest
+differs are treated as changed.
+
+"""
+
+import sys
+
+from jdma_client.jdma_lib import get_default_client, JdmaResponseError
+from jdma_client.jdma_lib import parse_server_date
+from jdma_client.jdma_cache import cached_iter_files
+from jdma_client.jdma_verify import verify_paths
+
+
+class FileIndex(object):
+    """A compact index of the files in a batch, keyed on their paths.  The
+       digests are stored as bytes, rather than hexadecimal strings, and the
+       digest formats are interned, so that the index of a batch of millions
+       of files fits comfortably in memory.
+
+       :param records: (`required`) the (**batch**, **archive**, **file**) records of the listing of the batch, from :func:`jdma_lib.iter_files` or :func:`jdma_cache.cached_iter_files`.
+    """
+    def __init__(self, records):
+        self.files = {}
+        for m, a, f in records:
+            digest = f.get("digest")
+            digest_format = f.get("digest_format")
+            try:
+                digest = bytes.fromhex(digest)
+            except (TypeError, ValueError):
+                digest = None
+            if digest_format is not None:
+                digest_format = sys.intern(digest_format)
+            self.files[f["path"]] = (f.get("size"), digest, digest_format)
+
+    def __len__(self):
+        return len(self.files)
+
+    def get(self, path):
+        """Get the (**size**, **digest**, **digest_format**) of a file, or
+           `None` if the file is not in the index"""
+        return self.files.get(path)
+
+
+class DeltaResult(object):
+    """The files that are new, or have changed, since a batch was uploaded.
+
+       - **files** (`List`): a list of the (**path**, **size**, **mtime**) tuples of the new and changed files, to upload
+       - **n_new** (`integer`): the number of files that are not in the batch
+       - **n_changed** (`integer`): the number of files that have changed since the batch was uploaded
+       - **n_unchanged** (`integer`): the number of files that are unchanged
+       - **total_size** (`integer`): the total size of the new and changed files, in bytes
+    """
+    def __init__(self):
+        self.files = []
+        self.n_new = 0
+        self.n_changed = 0
+        self.n_unchanged = 0
+        self.total_size = 0
+
+    def add_file(self, path, size, mtime):
+        self.files.append((path, size, mtime))
+        self.total_size += size
+
+    @property
+    def paths(self):
+        """The paths of the new and changed files"""
+        return [f[0] for f in self.files]
+
+
+def delta_files(name, batch_id, files, hash_files=False, max_workers=None,
+                client=None):
+    """Find the files that are new, or have changed, since a batch was
+       uploaded, by comparing a local scan against the listing of the batch.
+
+       :param string name: (`required`) name of the user.
+       :param integer batch_id: (`required`) the id of the previous batch.
+       :param list[`tuple`] files: (`required`) list of (**path**, **size**, **mtime**) tuples of the local files, e.g. the **files** of a :func:`jdma_scan.scan_paths` result.
+       :param bool hash_files: (`optional`) hash the files that were modified after the batch was registered, and only treat them as changed if their digest differs from that in the batch.
+       :param integer max_workers: (`optional`) number of processes to hash the files with.  If `none` then the number of CPUs is used.
+       :param JdmaClient client: (`optional`) the client to use.  If `none` then the default client is used.
+
+       :raises JdmaResponseError: if the server returned an error.
+
+       :return: The new and changed files.
+       :rtype: DeltaResult
+    """
+    if client is None:
+        client = get_default_client()
+    response = client.get_batch(name, batch_id=batch_id)
+    if response.status_code != 200:
+        raise JdmaResponseError(response)
+    # files modified after the earliest time the batch could have been
+    # registered may have changed
+    registered = parse_server_date(response.json().get("registered_date"))
+    if registered is None:
+        since = None
+    else:
+        since = registered[0]
+    index = FileIndex(
+        cached_iter_files(name, batch_id, digest=1, client=client)
+    )
+    return compare_files(files, index, since, hash_files, max_workers)
+
+
+def compare_files(files, index, since=None, hash_files=False,
+                  max_workers=None):
+    """Compare the local files against the index of a batch.  See
+       :func:`delta_files`.
+
+       :param list[`tuple`] files: (`required`) list of (**path**, **size**, **mtime**) tuples of the local files.
+       :param FileIndex index: (`required`) the index of the batch.
+       :param float since: (`optional`) the time the batch was registered, in seconds since the epoch.  Files modified after this time may have changed.  If `none` then only the sizes (and digests) are compared.
+
+       :rtype: DeltaResult
+    """
+    result = DeltaResult()
+    to_hash = []
+    for path, size, mtime in files:
+        entry = index.get(path)
+        if entry is None:
+            result.n_new += 1
+            result.add_file(path, size, mtime)
+        elif entry[0] != size:
+            result.n_changed += 1
+            result.add_file(path, size, mtime)
+        elif since is None or mtime > since:
+            if hash_files and entry[1] is not None and entry[2] is not None:
+                to_hash.append((path, size, mtime, entry))
+            elif since is None and not hash_files:
+                result.n_unchanged += 1
+            else:
+                result.n_changed += 1
+                result.add_file(path, size, mtime)
+        else:
+            result.n_unchanged += 1
+
+    if to_hash:
+        verified = verify_paths(
+            [(f[0], f[1], f[3][1].hex(), f[3][2]) for f in to_hash],
+            max_workers
+        )
+        # any file not verified, e.g. because it could not be read, is
+        # treated as changed, so that it is uploaded (or the upload fails)
+        changed = set(verified.missing)
+        changed.update(p for p, _ in verified.corrupt)
+        changed.update(p for p, _ in verified.errors)
+        changed.update(p for p, _ in verified.unchecked)
+        for path, size, mtime, entry in to_hash:
+            if path in changed:
+                result.n_changed += 1
+                result.add_file(path, size, mtime)
+            else:
+                result.n_unchanged += 1
+    return result
@@ -0,0 +1,206 @@
+"""
+Columnar export of the listings of the files and archives in batches.
+
+The listing is streamed from the JDMA server (or the local cache) and written
+in record batches, of **EXPORT_BATCH_SIZE** rows, so that the listings of
+workspaces with tens of millions of files can be exported without holding the
+whole listing in memory.  The formats are:
+
+  - ``parquet`` : an Apache Parquet file
+  - ``arrow`` : an Apache Arrow IPC file, which can be memory mapped
+  - ``csv`` : a comma separated values file, with a header row
+
+The ``parquet`` and ``arrow`` formats require the pyarrow library, which can be
+installed with ``pip install jdma_client[export]``.  The ``csv`` format does
+not.
+
+"""
+
+import csv
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from jdma_client.jdma_lib import iter_files, iter_archives
+
+EXPORT_FORMATS = ("parquet", "arrow", "csv")
+
+# number of rows in each record batch written to the export file
+EXPORT_BATCH_SIZE = 65536
+
+# the columns of the exports, and their types
+FILE_COLUMNS = (
+    ("batch_id", "int64"),
+    ("archive_id", "string"),
+    ("path", "string"),
+    ("size", "int64"),
+    ("digest", "string"),
+    ("digest_format", "string"),
+)
+
+ARCHIVE_COLUMNS = (
+    ("batch_id", "int64"),
+    ("archive_id", "string"),
+    ("size", "int64"),
+    ("digest", "string"),
+    ("digest_format", "string"),
+)
+
+##### Library functions                                                    #####
+
+def export_files(name, path, export_format="parquet", batch_id=None,
+                 workspace=None, limit=0, digest=1, ffilter=None):
+    """Export the listing of the files in a batch, or batches, to a columnar
+       file, with a row for each file and the columns: **batch_id**,
+       **archive_id**, **path**, **size**, **digest** and **digest_format**.
+       The listing is streamed from the server and written as it is parsed.
+
+       :param string name: (`required`) name of the user.
+       :param string path: (`required`) path of the file to export to.
+       :param string export_format: (`optional`) the format of the file: ``parquet``, ``arrow`` or ``csv``.
+       :param integer batch_id: (`optional`) batch id to export the files of.  If `none` then the files in all the batches are exported, subject to **workspace** and **ffilter**.
+       :param string workspace: (`optional`) workspace to export the files of.
+       :param integer limit: (`optional`) the maximum number of files to export.  `0` exports all files.
+       :param integer digest: (`optional`) export the digests of the files: `1` or `0`.
+       :param string ffilter: (`optional`) filter by user or workspace, as in :func:`jdma_lib.get_files`.
+
+       :raises JdmaResponseError: if the server returned an error.
+
+       :return: The number of files exported.
+       :rtype: integer
+    """
+    records = iter_files(
+        name=name, batch_id=batch_id, workspace=workspace, limit=limit,
+        digest=digest, ffilter=ffilter
+    )
+    return export_file_records(records, path, export_format)
+
+
+def export_archives(name, path, export_format="parquet", batch_id=None,
+                    workspace=None, limit=0, digest=1, ffilter=None):
+    """Export the listing of the archives in a batch, or batches, to a
+       columnar file, with a row for each archive and the columns:
+       **batch_id**, **archive_id**, **size**, **digest** and
+       **digest_format**.  The parameters are those of :func:`export_files`.
+
+       :raises JdmaResponseError: if the server returned an error.
+
+       :return: The number of archives exported.
+       :rtype: integer
+    """
+    records = iter_archives(
+        name=name, batch_id=batch_id, workspace=workspace, limit=limit,
+        digest=digest, ffilter=ffilter
+    )
+    return export_archive_records(records, path, export_format)
+
+
+def export_file_records(records, path, export_format="parquet"):
+    """Export the (**batch**, **archive**, **file**) records of a listing, from
+       :func:`jdma_lib.iter_files` or :func:`jdma_cache.cached_iter_files`,
+       to a columnar file.
+
+       :return: The number of files exported.
+       :rtype: integer
+    """
+    rows = (
+        (m.get("migration_id"), a.get("archive_id"), f.get("path"),
+         f.get("size"), f.get("digest"), f.get("digest_format"))
+        for m, a, f in records
+    )
+    return _export(rows, FILE_COLUMNS, path, export_format)
+
+
+def export_archive_records(records, path, export_format="parquet"):
+    """Export the (**batch**, **archive**) records of a listing, from
+       :func:`jdma_lib.iter_archives` or
+       :func:`jdma_cache.cached_iter_archives`, to a columnar file.
+
+       :return: The number of archives exported.
+       :rtype: integer
+    """
+    rows = (
+        (m.get("migration_id"), a.get("archive_id"), a.get("size"),
+         a.get("digest"), a.get("digest_format"))
+        for m, a in records
+    )
+    return _export(rows, ARCHIVE_COLUMNS, path, export_format)
+
+##### Writers for each of the formats                                      #####
+
+def _export(rows, columns, path, export_format):
+    """Write the rows (tuples) to the file in the format"""
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(
+            "Unknown export format {}, must be one of {}".format(
+                export_format, ", ".join(EXPORT_FORMATS)
+            )
+        )
+    if export_format == "csv":
+        return _export_csv(rows, columns, path)
+    if pyarrow is None:
+        raise ImportError(
+            "The {} export format requires the pyarrow library, install it "
+            "with: pip install jdma_client[export]".format(export_format)
+        )
+    return _export_arrow(rows, columns, path, export_format)
+
+
+def _export_csv(rows, columns, path):
+    """Write the rows to a CSV file, a record batch at a time"""
+    n_rows = 0
+    with open(path, "w", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow([c[0] for c in columns])
+        for batch in _record_batches(rows):
+            writer.writerows(batch)
+            n_rows += len(batch)
+    return n_rows
+
+
+def _export_arrow(rows, columns, path, export_format):
+    """Write the rows to a Parquet or Arrow IPC file, a record batch at a
+       time"""
+    schema = pyarrow.schema(
+        [(c, pyarrow.type_for_alias(t)) for c, t in columns]
+    )
+    if export_format == "parquet":
+        writer = pyarrow.parquet.ParquetWriter(path, schema)
+    else:
+        writer = pyarrow.ipc.new_file(path, schema)
+    n_rows = 0
+    try:
+        for batch in _record_batches(rows):
+            # transpose the rows into columns
+            arrays = [
+                pyarrow.array(column, type=field.type)
+                for column, field in zip(zip(*batch), schema)
+            ]
+            if export_format == "parquet":
+                writer.write_table(pyarrow.Table.from_arrays(
+                    arrays, schema=schema
+                ))
+            else:
+                writer.write_batch(pyarrow.RecordBatch.from_arrays(
+                    arrays, schema=schema
+                ))
+            n_rows += len(batch)
+    finally:
+        writer.close()
+    return n_rows
+
+
+def _record_batches(rows, batch_size=EXPORT_BATCH_SIZE):
+    """Collect the rows into lists of at most batch_size rows"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,168 @@
+"""
+Local journal of the requests (PUT, MIGRATE, GET and DELETE) submitted to the
+JDMA.
+
+Every request is submitted with a client-side idempotency key (a UUID), which
+is written to the journal, stored in a SQLite database at
+``~/.local/state/jdma/journal.sqlite`` by default, before the request is sent.
+When the server replies, the id of the request it created is written against
+the key.  If the call fails, e.g. it times out, the entry is left without a
+request id, and :func:`jdma_lib.reconcile_request` can be used to find out
+whether the server created the request, before it is submitted again with the
+same key.
+
+"""
+
+import os
+import time
+import sqlite3
+import threading
+
+##### The journal database                                                 #####
+
+def default_journal_path():
+    """Path of the journal database - in $XDG_STATE_HOME/jdma, or
+       ~/.local/state/jdma"""
+    state_home = os.environ.get(
+        "XDG_STATE_HOME", os.path.join(os.environ["HOME"], ".local", "state")
+    )
+    return os.path.join(state_home, "jdma", "journal.sqlite")
+
+
+class JournalEntry(object):
+    """An entry in the journal, for one submitted request.
+
+       - **key** (`string`): the idempotency key the request was submitted with
+       - **user** (`string`): the user the request was submitted for
+       - **request_type** (`string`): PUT, MIGRATE, GET or DELETE
+       - **workspace** (`string`): the workspace of the request, if known
+       - **label** (`string`): the label of the batch, if known
+       - **batch_id** (`integer`): the batch id, for GET and DELETE requests
+       - **submitted** (`float`): the time the request was submitted, in seconds since the epoch
+       - **request_id** (`integer`): the id of the request created by the server, or `None` if it is not known whether the request was created
+    """
+    def __init__(self, key, user, request_type, workspace, label, batch_id,
+                 submitted, request_id):
+        self.key = key
+        self.user = user
+        self.request_type = request_type
+        self.workspace = workspace
+        self.label = label
+        self.batch_id = batch_id
+        self.submitted = submitted
+        self.request_id = request_id
+
+    @property
+    def pending(self):
+        """Is it unknown whether the server created the request?"""
+        return self.request_id is None
+
+
+class RequestJournal(object):
+    """SQLite journal of the requests submitted to the JDMA.  The database is
+       opened on first use and can be shared by the threads that share a
+       client.
+
+       :param string path: (`optional`) path of the SQLite database.  If `none` then :func:`default_journal_path` is used.
+    """
+    def __init__(self, path=None):
+        if path is None:
+            path = default_journal_path()
+        self.path = path
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        """Open the database, and create the table, if they do not exist"""
+        if self.conn is None:
+            journal_dir = os.path.dirname(self.path)
+            if journal_dir and not os.path.isdir(journal_dir):
+                os.makedirs(journal_dir, mode=0o700)
+            self.conn = sqlite3.connect(
+                self.path, timeout=30, check_same_thread=False
+            )
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS submissions (
+                    key TEXT PRIMARY KEY, user TEXT, request_type TEXT,
+                    workspace TEXT, label TEXT, batch_id INTEGER,
+                    submitted REAL, request_id INTEGER
+                )
+            """)
+            self.conn.commit()
+        return self.conn
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add(self, key, user, request_type, workspace=None, label=None,
+            batch_id=None):
+        """Write a request to the journal, before it is submitted.  If the key
+           is already in the journal (the request is being resubmitted) then
+           the existing entry is kept.
+
+           :return: `True` if the key was added, `False` if it was already in the journal.
+        """
+        with self.lock:
+            conn = self._connect()
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO submissions VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, NULL)",
+                (key, user, request_type, workspace, label, batch_id,
+                 time.time())
+            )
+            conn.commit()
+        return cursor.rowcount == 1
+
+    def complete(self, key, request_id):
+        """Record the id of the request the server created for the key"""
+        with self.lock:
+            conn = self._connect()
+            conn.execute(
+                "UPDATE submissions SET request_id=? WHERE key=?",
+                (request_id, key)
+            )
+            conn.commit()
+
+    def remove(self, key):
+        """Remove a request from the journal, e.g. when the server refused to
+           create it, so that it can be submitted again"""
+        with self.lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM submissions WHERE key=?", (key,))
+            conn.commit()
+
+    def get(self, key):
+        """Get the entry for a key.
+
+           :return: The entry, or `None` if the key is not in the journal.
+           :rtype: JournalEntry
+        """
+        with self.lock:
+            row = self._connect().execute(
+                "SELECT * FROM submissions WHERE key=?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return JournalEntry(*row)
+
+    def entries(self, user, pending=False):
+        """Get the entries for a user, in the order they were submitted.
+
+           :param bool pending: (`optional`) only get the entries where it is not known whether the server created the request.
+           :rtype: List[JournalEntry]
+        """
+        query = "SELECT * FROM submissions WHERE user=?"
+        if pending:
+            query += " AND request_id IS NULL"
+        query += " ORDER BY submitted"
+        with self.lock:
+            rows = self._connect().execute(query, (user,)).fetchall()
+        return [JournalEntry(*row) for row in rows]
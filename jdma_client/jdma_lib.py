@@ -5,16 +5,1145 @@ via Python.
 Each function forms the HTTP API request call required to carry out each task.
 
 Requires: requests library (pip install requests)
+Optional: ijson library (pip install ijson) to parse file listings as they are
+          streamed from the server
+          zstandard library (pip install zstandard) to compress large request
+          bodies with zstd, if compression is switched on
 
 """
 
+import os
 import requests
 import json
+import gzip
+import heapq
+import random
+import tempfile
+import threading
+import time
+import uuid
+import datetime
+import calendar
+from concurrent.futures import ThreadPoolExecutor
+from urllib3.util.retry import Retry
+from urllib3.exceptions import HTTPError as Urllib3HTTPError
 # switch off warnings
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+# ijson is optional - if it is not installed then listings are parsed in one go
+try:
+    import ijson
+except ImportError:
+    ijson = None
+# zstandard is optional - if it is not installed then only gzip can be used to
+# compress the request bodies
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 from jdma_client.jdma_common import *
+from jdma_client.jdma_journal import RequestJournal, default_journal_path
+
+##### Timeouts, retries and the circuit breaker                           #####
+
+# default timeouts, in seconds, to connect to the server, and to wait between
+# the bytes received from the server for GET / PUT and POST calls
+CONNECT_TIMEOUT = 10.0
+READ_TIMEOUT = 120.0
+POST_READ_TIMEOUT = 600.0
+# default number of retries, and the backoff between them
+RETRIES = 3
+BACKOFF_FACTOR = 1.0
+# the status codes that are retried, and the (idempotent) methods that are
+# retried after a read error or one of the status codes
+RETRY_STATUS_CODES = (502, 503, 504)
+RETRY_METHODS = frozenset(("GET", "PUT", "HEAD", "OPTIONS"))
+# the errors raised when the stream of a listing is cut off, which are retried
+# by the ListingIterator: an error reading the body, or a JSON error from
+# parsing the truncated body
+STREAM_ERRORS = (requests.exceptions.RequestException, Urllib3HTTPError,
+                 ValueError)
+if ijson is not None:
+    STREAM_ERRORS += (ijson.JSONError,)
+# the error for a request that is not in the list of the user's requests
+REQUEST_NOT_FOUND = "Request not found"
+# default number of consecutive failures before the circuit breaker opens,
+# and the time, in seconds, before it lets a call through again
+CIRCUIT_BREAKER_FAILURES = 5
+CIRCUIT_BREAKER_RESET = 60.0
+
+
+class JdmaCircuitOpenError(Exception):
+    """Raised, without contacting the server, when the circuit breaker of a
+       client is open, i.e. the previous calls to the server have failed."""
+    pass
+
+
+class CircuitBreaker(object):
+    """A circuit breaker for the calls to the JDMA server.  After
+       **failures** consecutive calls have failed, with a connection error or
+       a 5xx status code, the breaker opens and calls fail immediately, with
+       a **JdmaCircuitOpenError**, rather than waiting for the timeouts and
+       retries of each call.  After **reset_timeout** seconds a single call is
+       let through: if it succeeds the breaker closes again.
+
+       The state of the breaker is held in memory, so it is shared by the
+       threads that share a client.  If **path** is given, the state is also
+       kept in that file, keyed by **key**, so that it is shared by separate
+       processes, e.g. ``jdma`` commands run from cron, which would otherwise
+       each start with a closed breaker.  The default client keeps the state
+       in the file given by :func:`default_circuit_breaker_path`.
+
+       :param integer failures: (`optional`) number of consecutive failures to open the breaker.  `None` or 0 disables the breaker.
+       :param float reset_timeout: (`optional`) time, in seconds, before a call is let through an open breaker.
+       :param string path: (`optional`) path of the file to keep the state of the breaker in.  If `none` then the state is only held in memory.
+       :param string key: (`optional`) the key of the state in the file, e.g. the URL of the JDMA server.
+    """
+    def __init__(self, failures=CIRCUIT_BREAKER_FAILURES,
+                 reset_timeout=CIRCUIT_BREAKER_RESET, path=None, key=None):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.path = path
+        self.key = key
+        self.n_failures = 0
+        self.opened_at = None
+        # the breaker is shared by the threads that share the client
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        """Raise a JdmaCircuitOpenError if the breaker is open"""
+        if not self.failures:
+            return
+        with self.lock:
+            self._load()
+            if self.opened_at is None:
+                return
+            wait = self.reset_timeout - (time.time() - self.opened_at)
+            if wait > 0:
+                raise JdmaCircuitOpenError((
+                    "The JDMA server is not responding, after {} failed "
+                    "calls.  Not retrying for {:.0f} seconds"
+                ).format(self.n_failures, wait))
+            # half open - let this call through, but open the breaker again
+            # (for the other threads and processes) until it has succeeded
+            self.opened_at = time.time()
+            self._save()
+
+    def record(self, success):
+        """Record whether a call succeeded"""
+        if not self.failures:
+            return
+        with self.lock:
+            self._load()
+            if success:
+                if self.n_failures == 0 and self.opened_at is None:
+                    return
+                self.n_failures = 0
+                self.opened_at = None
+            else:
+                self.n_failures += 1
+                if self.n_failures >= self.failures:
+                    self.opened_at = time.time()
+            self._save()
+
+    def _read_states(self):
+        """Read the states of the breakers in the file"""
+        with open(self.path) as fh:
+            states = json.load(fh)
+        if not isinstance(states, dict):
+            raise ValueError("Invalid circuit breaker file")
+        return states
+
+    def _load(self):
+        """Update the state from the file, which other processes may have
+           changed"""
+        if self.path is None:
+            return
+        try:
+            state = self._read_states().get(self.key)
+        except (OSError, ValueError):
+            # no other process has saved a state, keep the state in memory
+            return
+        if state is None:
+            self.n_failures = 0
+            self.opened_at = None
+        else:
+            self.n_failures, self.opened_at = state
+
+    def _save(self):
+        """Write the state to the file, replacing it atomically so that other
+           processes never read a partly written file"""
+        if self.path is None:
+            return
+        try:
+            try:
+                states = self._read_states()
+            except (OSError, ValueError):
+                states = {}
+            if self.n_failures == 0 and self.opened_at is None:
+                states.pop(self.key, None)
+            else:
+                states[self.key] = [self.n_failures, self.opened_at]
+            state_dir = os.path.dirname(self.path)
+            if state_dir and not os.path.isdir(state_dir):
+                os.makedirs(state_dir, mode=0o700)
+            fd, tmp_path = tempfile.mkstemp(dir=state_dir or None)
+            with os.fdopen(fd, "w") as fh:
+                json.dump(states, fh)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            # the state is still held in memory
+            pass
+
+
+def default_circuit_breaker_path():
+    """Path of the file the default client keeps the state of its circuit
+       breaker in, next to the journal (see
+       :func:`jdma_journal.default_journal_path`)
+
+       :rtype: string
+    """
+    return os.path.join(
+        os.path.dirname(default_journal_path()), "circuit_breaker.json"
+    )
+
+##### Client - holds the settings and the pooled, keep-alive HTTP session  #####
+
+class JdmaClient(object):
+    """A client for the JDMA HTTP API.  The client holds the settings needed
+       to talk to a JDMA server (the URL of the HTTP API, the user name, the
+       TLS settings, the timeouts and the retry policy) and owns a
+       `requests.Session <http://docs.python-requests.org/en/master/user/advanced/#session-objects>`_
+       so that the TCP and TLS connections to the JDMA server are pooled and
+       kept alive between calls, rather than a new connection being made for
+       every call.
+
+       The settings are held per client, rather than read from the global
+       ``settings`` on every call, so several clients, talking to different
+       JDMA servers or for different users, can be used at the same time, in
+       different threads.  Any setting that is not supplied is taken from
+       ``jdma_common.settings`` when the client is created.
+
+       The methods of the client have the same arguments and return values as
+       the module level functions of the same name.
+
+       :param string api_url: (`optional`) URL of the JDMA HTTP API, e.g. ``https://jdma3.ceda.ac.uk/jdma_control/api/v1/``
+       :param string user: (`optional`) name of the user to make requests for.
+       :param verify: (`optional`) verify the TLS certificate of the server.  Either a bool or the path to a CA bundle.
+       :param float timeout: (`optional`) timeout, in seconds, for each HTTP call, overriding **connect_timeout**, **read_timeout** and **post_read_timeout**.  Either a float or a (connect, read) tuple.
+       :param float connect_timeout: (`optional`) timeout, in seconds, to connect to the server.  `None` waits forever.
+       :param float read_timeout: (`optional`) timeout, in seconds, between the bytes received from the server, for GET and PUT calls.  `None` waits forever.
+       :param float post_read_timeout: (`optional`) timeout, in seconds, between the bytes received from the server for POST calls, e.g. :func:`upload_files`, which can take longer for the server to process.  `None` waits forever.
+       :param integer retries: (`optional`) number of times to retry a call that fails with a connection error or a 502, 503 or 504 status code.  POST calls, which are not idempotent, are only retried if the connection to the server could not be made, i.e. the request was never sent.
+       :param float backoff_factor: (`optional`) the retries wait for **backoff_factor** * 2^(retry number - 1) seconds.
+       :param integer circuit_breaker_failures: (`optional`) number of consecutive failed calls (after retrying) after which calls fail immediately with a **JdmaCircuitOpenError**, without contacting the server.  `None` or 0 disables the circuit breaker.
+       :param float circuit_breaker_reset: (`optional`) time, in seconds, after which a single call is allowed through again to see whether the server has recovered.
+       :param string circuit_breaker_path: (`optional`) path of the file to keep the state of the circuit breaker in, so that it is shared with other processes, see :class:`CircuitBreaker`.  If `none` then the state is only held by the client.
+       :param RequestJournal journal: (`optional`) the journal to record the requests submitted by :func:`upload_files`, :func:`download_files` and :func:`delete_batch` in, so that they can be reconciled with :func:`reconcile_request` if a call fails.  If `none` then the requests are not journaled.
+       :param integer pool_connections: (`optional`) number of connection pools (one per host) to cache.
+       :param integer pool_maxsize: (`optional`) maximum number of connections to keep alive in each pool.  Set this to at least the number of threads that share the client.
+       :param bool keep_alive: (`optional`) keep the connections alive between calls.  If `False` then the connection is closed after every call.
+       :param string compression: (`optional`) the ``Content-Encoding`` used to compress the bodies of requests larger than **compress_threshold**, e.g. the filelists sent by :func:`upload_files` and :func:`download_files`.  Either "gzip", "zstd" (requires the zstandard library) or `None` to never compress.  The default is `None`, as the JDMA server must support the ``Content-Encoding`` of the request bodies for compression to be switched on.
+       :param integer compress_threshold: (`optional`) size, in bytes, above which the bodies of requests are compressed.
+    """
+    # the errors raised by a call that fails without a response from the server
+    CALL_ERRORS = (requests.exceptions.RequestException, JdmaCircuitOpenError)
+
+    def __init__(self, api_url=None, user=None, verify=None, timeout=None,
+                 pool_connections=4, pool_maxsize=16, keep_alive=True,
+                 compression=None, compress_threshold=None,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 post_read_timeout=POST_READ_TIMEOUT, retries=RETRIES,
+                 backoff_factor=BACKOFF_FACTOR,
+                 circuit_breaker_failures=CIRCUIT_BREAKER_FAILURES,
+                 circuit_breaker_reset=CIRCUIT_BREAKER_RESET,
+                 circuit_breaker_path=None, journal=None):
+        if api_url is None:
+            api_url = settings.JDMA_API_URL
+        if user is None:
+            user = settings.USER
+        if verify is None:
+            verify = settings.VERIFY
+        self.api_url = api_url
+        self.user = user
+        self.verify = verify
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.post_read_timeout = post_read_timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.circuit_breaker = CircuitBreaker(
+            circuit_breaker_failures, circuit_breaker_reset,
+            path=circuit_breaker_path, key=api_url
+        )
+        self.journal = journal
+        if compression not in COMPRESSIONS:
+            raise Exception(
+                "Unknown compression: {}.  Choose from {}".format(
+                    compression, ", ".join(str(c) for c in COMPRESSIONS)
+                )
+            )
+        if compression == "zstd" and zstandard is None:
+            raise Exception(
+                "zstd compression requires the zstandard library "
+                "(pip install zstandard)"
+            )
+        self.compression = compression
+        if compress_threshold is None:
+            compress_threshold = COMPRESS_THRESHOLD
+        self.compress_threshold = compress_threshold
+        self.session = self._create_session(
+            pool_connections, pool_maxsize, keep_alive
+        )
+
+    def _create_session(self, pool_connections, pool_maxsize, keep_alive):
+        """Create the pooled HTTP session"""
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=self._retry_policy()
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        if not keep_alive:
+            session.headers["Connection"] = "close"
+        return session
+
+    def _send(self, method, url, data=None, stream=False, headers=None):
+        """Send a HTTP request to the JDMA server over the pooled session.  The
+           data can be a string, bytes or a file (which is closed after it has
+           been sent).  Data larger than the compress_threshold is compressed."""
+        self.circuit_breaker.before_call()
+        data, headers = _compress_body(
+            data, self.compression, self.compress_threshold, headers
+        )
+        try:
+            response = self.session.request(
+                method, url, data=data, headers=headers, verify=self.verify,
+                timeout=self._timeout(method), stream=stream
+            )
+        except requests.exceptions.RequestException:
+            self.circuit_breaker.record(False)
+            raise
+        finally:
+            if hasattr(data, "close"):
+                data.close()
+        self.circuit_breaker.record(response.status_code < 500)
+        return response
+
+    def _timeout(self, method):
+        """The (connect, read) timeout for a call with the HTTP method"""
+        if self.timeout is not None:
+            return self.timeout
+        if method == "POST":
+            return (self.connect_timeout, self.post_read_timeout)
+        return (self.connect_timeout, self.read_timeout)
+
+    def _retry_policy(self):
+        """The urllib3 Retry policy for the calls made by the session.  Only
+           the idempotent methods are retried after a read error or an error
+           status code, so a POST is only retried when the connection could
+           not be made, and the server cannot have acted on it."""
+        return Retry(
+            total=self.retries,
+            connect=self.retries,
+            read=self.retries,
+            status=self.retries,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=RETRY_METHODS,
+            backoff_factor=self.backoff_factor,
+            raise_on_status=False,
+            respect_retry_after_header=True
+        )
+
+    def close(self):
+        """Close the session and all the pooled connections"""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    ### User methods
+
+    def create_user(self, name, email=None, workspace="default"):
+        """Create a user.  See :func:`create_user`"""
+        # create the credentials file - this function will check whether it exists
+        create_credentials_file(name, workspace)
+        url = self.api_url + "user"
+        data = {"name" : name}
+        if email is not None:
+            data["email"] = email
+        ### Send the HTTP request (POST) to initialise a user.###
+        return self._send("POST", url, data=json.dumps(data))
+
+    def update_user(self, name, email=None, notify=None):
+        """Update a user's information.  See :func:`update_user`"""
+        ### Send the HTTP request (PUT) to update the email address of the user by
+        ### sending a PUT request.###
+        url = self.api_url + "user?name=" + name
+        data = {"name" : name}
+        if email is not None:
+            data["email"] = email
+        if notify is not None:
+            data["notify"] = notify
+        return self._send("PUT", url, data=json.dumps(data))
+
+    def info_user(self, name):
+        """Get a user's information.  See :func:`info_user`"""
+        ###Send the HTTP request (GET) to return information about the user###
+        url = self.api_url + "user?name=" + name
+        return self._send("GET", url)
+
+    ### Request methods
+
+    def get_request(self, name, req_id=None, workspace=None, ffilter=None):
+        """Get a list of requests or a single request.  See :func:`get_request`"""
+        url = self.api_url + "request?name=" + name
+        if req_id != None:
+            url += "&request_id=" + str(req_id)
+        if workspace != None:
+            url += "&workspace=" + workspace
+        if ffilter != None:
+            url += "&filter=" + ffilter
+        # send the request
+        return self._send("GET", url)
+
+    def get_requests(self, name, req_ids, workspace=None, ffilter=None,
+                     max_workers=8, single_call=None):
+        """Get the details of many requests.  See :func:`get_requests`"""
+        req_ids = [int(r) for r in req_ids]
+        if single_call is None:
+            single_call = workspace is not None or ffilter == "workspace"
+        if single_call:
+            try:
+                response = self.get_request(
+                    name, workspace=workspace, ffilter=ffilter
+                )
+            except self.CALL_ERRORS as e:
+                return [_call_error_data(e, r) for r in req_ids]
+            return _filter_requests(response, req_ids)
+        # fan out the single request calls over a bounded thread pool, which
+        # shares the pooled connections of the session
+        def get_one(req_id):
+            try:
+                response = self.get_request(name, req_id=req_id)
+            except self.CALL_ERRORS as e:
+                return _call_error_data(e, req_id)
+            return _request_data(response, req_id)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(get_one, req_ids))
+
+    def wait_for_requests(self, name, req_ids, timeout=None,
+                          poll_interval=2.0, max_poll_interval=300.0,
+                          callback=None):
+        """Wait for requests to finish.  See :func:`wait_for_requests`"""
+        req_ids = [int(r) for r in req_ids]
+        results = {}
+        stages = {}
+        interval = poll_interval
+        start_time = time.time()
+        while True:
+            outstanding = [r for r in req_ids if r not in results]
+            progress = False
+            for data in self.get_requests(name, outstanding):
+                req_id = data["request_id"]
+                # a failed poll is not a change of stage
+                if "stage" in data and stages.get(req_id) != data["stage"]:
+                    stages[req_id] = data["stage"]
+                    progress = True
+                if _request_finished(data):
+                    results[req_id] = data
+                    if callback is not None:
+                        callback(data)
+            if len(results) == len(set(req_ids)):
+                break
+            # back off while none of the requests are changing stage
+            interval = _next_poll_interval(
+                interval, progress, poll_interval, max_poll_interval
+            )
+            sleep_time = _jitter(interval)
+            if timeout is not None:
+                remaining = timeout - (time.time() - start_time)
+                if remaining <= 0:
+                    break
+                sleep_time = min(sleep_time, remaining)
+            time.sleep(sleep_time)
+        return _wait_results(req_ids, results, stages)
+
+    def get_batch(self, name, batch_id=None, workspace=None, label=None,
+                  ffilter=None):
+        """Get a list of batches or a single batch.  See :func:`get_batch`"""
+        url = self.api_url + "migration?name=" + name
+        if batch_id != None:
+            url += "&migration_id=" + str(batch_id)
+        if workspace != None:
+            url += "&workspace=" + workspace
+        if label != None:
+            url += "&label=" + label
+        if ffilter != None:
+            url += "&filter=" + ffilter
+        # send the HTTP request
+        return self._send("GET", url)
+
+    def get_storage(self):
+        """Get a list of storage backends.  See :func:`get_storage`"""
+        url = self.api_url + "list_backends"
+        return self._send("GET", url)
+
+    def get_files(self, name, batch_id=None, workspace=None, limit=0, digest=0,
+                  ffilter=None, stream=False):
+        """Get a list of files in a batch.  See :func:`get_files`"""
+        url = self.api_url + "file?name=" + self.user
+        if batch_id is not None:
+            url += "&migration_id=" + str(batch_id)
+        if workspace is not None:
+            url += "&workspace=" + workspace
+        if ffilter != None:
+            url += "&filter=" + ffilter
+
+        # add the limit (the number of files output)
+        url += "&limit=" + str(limit)
+        # add whether to list the digest or not
+        url += "&digest="+ str(digest)
+        # do the request (GET)
+        return self._send("GET", url, stream=stream)
+
+    def get_archives(self, name, batch_id=None, workspace=None, limit=0,
+                     digest=0, ffilter=None, stream=False):
+        """Get a list of archives in a batch.  See :func:`get_archives`"""
+        url = self.api_url + "archive?name=" + self.user
+        if batch_id:
+            url += "&migration_id=" + str(batch_id)
+        if workspace:
+            url += "&workspace=" + workspace
+        if ffilter != None:
+            url += "&filter=" + ffilter
+
+        # add the limit (the number of files output)
+        url += "&limit=" + str(limit)
+        # add whether to list the digest or not
+        url += "&digest=" + str(digest)
+        # do the request (GET)
+        return self._send("GET", url, stream=stream)
+
+    def iter_files(self, name, batch_id=None, workspace=None, limit=0,
+                   digest=0, ffilter=None, page_size=1000, resume_token=None,
+                   retries=3):
+        """Iterate lazily over the files in a batch.  See :func:`iter_files`"""
+        return ListingIterator(
+            self, name, batch_id=batch_id, workspace=workspace, limit=limit,
+            digest=digest, ffilter=ffilter, files=True, page_size=page_size,
+            resume_token=resume_token, retries=retries
+        )
+
+    def iter_archives(self, name, batch_id=None, workspace=None, limit=0,
+                      digest=0, ffilter=None, page_size=1000,
+                      resume_token=None, retries=3):
+        """Iterate lazily over the archives in a batch.  See
+           :func:`iter_archives`"""
+        return ListingIterator(
+            self, name, batch_id=batch_id, workspace=workspace, limit=limit,
+            digest=digest, ffilter=ffilter, files=False, page_size=page_size,
+            resume_token=resume_token, retries=retries
+        )
+
+    ### File transfer methods
+
+    def upload_files(self, name, workspace=None, filelist=[], label=None,
+                     request_type=None, storage=None, credentials=None,
+                     idempotency_key=None):
+        """Put a list of files to a storage backend.  See :func:`upload_files`"""
+        # build the URL
+        url = self.api_url + "request"
+
+        # set the data
+        data = {"name" : name,
+                "workspace" : workspace,
+                "filelist" : filelist,
+                "label" : label,
+                "request_type" : request_type,
+                "storage" : storage,
+                "credentials" : credentials}
+
+        # do the request (POST)
+        return self._submit(
+            url, _json_body(data), idempotency_key, name, request_type,
+            workspace=workspace, label=label
+        )
+
+    def upload_files_split(self, name, workspace=None, files=[], label=None,
+                           request_type=None, storage=None, credentials=None,
+                           max_batch_size=None, max_files_per_batch=None,
+                           max_workers=4, idempotency_key=None):
+        """Put a list of files to a storage backend, split into several
+           batches.  See :func:`upload_files_split`"""
+        parts = partition_filelist(files, max_batch_size, max_files_per_batch)
+        if label is None:
+            label = "batch"
+        def upload_part(p):
+            part_label = "{}.part{:03d}".format(label, p + 1)
+            key = part_idempotency_key(idempotency_key, p)
+            try:
+                # only the parts not already submitted with the key are
+                # submitted
+                data = self.submitted_request(name, key)
+                if data is not None:
+                    return data
+                response = self.upload_files(
+                    name, workspace=workspace, filelist=parts[p],
+                    label=part_label, request_type=request_type,
+                    storage=storage, credentials=credentials,
+                    idempotency_key=key
+                )
+            except Exception as e:
+                # the request may have been created, it can be reconciled
+                # with the idempotency key
+                return {"label" : part_label, "error" : str(e),
+                        "idempotency_key" : key}
+            return _part_data(response, part_label, key)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(upload_part, range(len(parts))))
+
+    def delete_batch(self, name, batch_id=None, storage=None, credentials=None,
+                     idempotency_key=None):
+        """Delete a batch from a storage backend.  See :func:`delete_batch`"""
+        # use the same POST URL as GET and PUT
+        url = self.api_url + "request"
+        # set the user and request type data
+        data = {"name" : name,
+                "request_type" : "DELETE",
+                "migration_id" : batch_id,
+                "storage" : storage,
+                "credentials" : credentials}
+        # do the request (POST)
+        return self._submit(
+            url, json.dumps(data), idempotency_key, name, "DELETE",
+            batch_id=batch_id
+        )
+
+    def download_files(self, name, batch_id=None, filelist=[], target_dir=None,
+                       credentials=None, idempotency_key=None):
+        """Download files from a storage backend.  See :func:`download_files`"""
+        # use the same POST URL as DELETE and PUT
+        url = self.api_url + "request"
+
+        data = {"name" : name,
+                "request_type" : "GET",
+                "migration_id" : batch_id,
+                "target_path" : target_dir,
+                "credentials" : credentials}
+        # Only add filelist if non-empty
+        if filelist != []:
+            data["filelist"] = filelist
+        # do the request (POST)
+        return self._submit(
+            url, _json_body(data), idempotency_key, name, "GET",
+            batch_id=batch_id
+        )
+
+    def download_batches(self, name, batch_ids, filelist=[], target_dir=None,
+                         credentials=None, max_workers=4,
+                         idempotency_key=None):
+        """Download several batches from their storage backends.  See
+           :func:`download_batches`"""
+        batch_ids = [int(b) for b in batch_ids]
+        storage_credentials = _storage_credentials(credentials)
+        def download_batch(b):
+            batch_id = batch_ids[b]
+            key = part_idempotency_key(idempotency_key, b)
+            try:
+                data = self.submitted_request(name, key)
+                if data is not None:
+                    return data
+                response = self.get_batch(name, batch_id=batch_id)
+                if response.status_code != 200:
+                    return _batch_data(response, batch_id)
+                storage = response.json()["storage"]
+                response = self.download_files(
+                    name, batch_id=batch_id, filelist=filelist,
+                    target_dir=target_dir,
+                    credentials=storage_credentials(storage),
+                    idempotency_key=key
+                )
+            except Exception as e:
+                # the request may have been created, it can be reconciled
+                # with the idempotency key
+                return {"migration_id" : batch_id, "error" : str(e),
+                        "idempotency_key" : key}
+            return _batch_data(response, batch_id)
+        # look up the batches, and submit the requests, concurrently over a
+        # bounded thread pool, which shares the pooled connections
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(download_batch, range(len(batch_ids))))
+
+    def _submit(self, url, body, idempotency_key, name, request_type,
+                workspace=None, label=None, batch_id=None):
+        """Submit a request (POST) with an idempotency key, recording it in
+           the journal before it is sent and the id of the request the server
+           created after"""
+        if idempotency_key is None:
+            idempotency_key = new_idempotency_key()
+        new_key = False
+        if self.journal is not None:
+            new_key = self.journal.add(
+                idempotency_key, name, request_type, workspace=workspace,
+                label=label, batch_id=batch_id
+            )
+        response = self._send(
+            "POST", url, data=body,
+            headers={IDEMPOTENCY_HEADER : idempotency_key}
+        )
+        self._journal_response(idempotency_key, new_key, response)
+        return response
+
+    def _journal_response(self, idempotency_key, new_key, response):
+        """Record the response to a submitted request in the journal"""
+        if self.journal is None:
+            return
+        if response.status_code == 200:
+            try:
+                request_id = response.json()["request_id"]
+            except (ValueError, KeyError):
+                return
+            self.journal.complete(idempotency_key, request_id)
+        elif response.status_code < 500 and new_key:
+            # the server refused the request, so it was not created.  (If the
+            # key was resubmitted then the refusal may be because the first
+            # submission was created, so the entry is kept.)
+            self.journal.remove(idempotency_key)
+
+    def submitted_request(self, name, idempotency_key):
+        """Find the request already submitted with an idempotency key, if
+           any.  See :func:`submitted_request`"""
+        entry = self._submitted_entry(idempotency_key)
+        if entry is None:
+            return None
+        if entry.request_id is not None:
+            response = self.get_request(name, req_id=entry.request_id)
+            data = _request_data(response, entry.request_id)
+        else:
+            data = self._reconcile_response(
+                entry, self.get_request(name, workspace=entry.workspace)
+            )
+        return _submitted_data(data, entry)
+
+    def _submitted_entry(self, idempotency_key):
+        """The journal entry for an idempotency key, or None if there is no
+           key, journal or entry"""
+        if idempotency_key is None or self.journal is None:
+            return None
+        return self.journal.get(idempotency_key)
+
+    def reconcile_request(self, name, idempotency_key):
+        """Find the request submitted with an idempotency key.  See
+           :func:`reconcile_request`"""
+        entry = self._journal_entry(idempotency_key)
+        if entry.request_id is not None:
+            response = self.get_request(name, req_id=entry.request_id)
+            return _request_data(response, entry.request_id)
+        response = self.get_request(name, workspace=entry.workspace)
+        return self._reconcile_response(entry, response)
+
+    def _journal_entry(self, idempotency_key):
+        """Get the journal entry for an idempotency key"""
+        if self.journal is None:
+            raise Exception("The client does not have a journal")
+        entry = self.journal.get(idempotency_key)
+        if entry is None:
+            raise Exception(
+                "Idempotency key {} is not in the journal".format(
+                    idempotency_key
+                )
+            )
+        return entry
+
+    def _reconcile_response(self, entry, response):
+        """Match the request for a pending journal entry in the list of the
+           user's requests, recording it in the journal if it is found"""
+        if response.status_code != 200:
+            raise JdmaResponseError(response)
+        # the requests already journaled against other keys cannot match
+        known_ids = set(e.request_id for e in self.journal.entries(entry.user))
+        data = _match_request(response.json()["requests"], entry, known_ids)
+        if data is not None:
+            self.journal.complete(entry.key, data["request_id"])
+        return data
+
+    def modify_batch(self, name, batch_id=None, label=None):
+        """Modify the details of a batch.  See :func:`modify_batch`"""
+        # PUT URL for migration
+        url = self.api_url + "migration/?name=" + self.user
+        if batch_id:
+            url += "&migration_id=" + str(batch_id)
+        data = {}
+        if label:
+            data["label"] = label
+        # do the request (PUT)
+        return self._send("PUT", url, data=json.dumps(data))
+
+
+# size above which the body of a request is spooled to a temporary file,
+# rather than held in memory
+SPOOL_SIZE = 8 * 1024 * 1024
+
+def _json_body(data):
+    """Serialise the data for a request as JSON, writing the filelist one path
+       at a time, so that the whole JSON document is never built as a single
+       string.  The filelist can be any iterable, e.g. a generator from
+       :func:`jdma_common.iter_filelist`.  Large bodies are spooled to a
+       temporary file, which is returned, otherwise the body is returned as
+       bytes."""
+    body = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    body.write(b"{")
+    sep = b""
+    for key, value in data.items():
+        body.write(sep + json.dumps(key).encode("utf-8") + b": ")
+        sep = b", "
+        if key == "filelist" and value is not None:
+            body.write(b"[")
+            fsep = b""
+            for f in value:
+                body.write(fsep + json.dumps(f).encode("utf-8"))
+                fsep = b", "
+            body.write(b"]")
+        else:
+            body.write(json.dumps(value).encode("utf-8"))
+    body.write(b"}")
+    if body.tell() <= SPOOL_SIZE:
+        body.seek(0)
+        content = body.read()
+        body.close()
+        return content
+    body.seek(0)
+    return body
+
+# the Content-Encodings that request bodies can be compressed with
+COMPRESSIONS = (None, "gzip", "zstd")
+# size, in bytes, above which request bodies are compressed
+COMPRESS_THRESHOLD = 1024 * 1024
+# size of the blocks that request bodies are compressed in
+COMPRESS_BLOCK_SIZE = 1024 * 1024
+
+def _body_size(data):
+    """Size, in bytes, of the body of a request"""
+    if data is None:
+        return 0
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    if isinstance(data, bytes):
+        return len(data)
+    # a file - find its size from the current position
+    pos = data.tell()
+    data.seek(0, 2)
+    size = data.tell() - pos
+    data.seek(pos)
+    return size
+
+
+def _compress_body(data, compression, threshold, headers=None):
+    """Compress the body of a request with the Content-Encoding
+       **compression**, if it is larger than **threshold** bytes.  The body is
+       compressed a block at a time, into a spooled temporary file, so that a
+       large body is never held in memory twice.  Returns the (possibly
+       compressed) body and the headers to send with it, added to
+       **headers**."""
+    if (compression is None or data is None or
+            _body_size(data) <= threshold):
+        return data, headers
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    if isinstance(data, bytes):
+        blocks = (data[i:i+COMPRESS_BLOCK_SIZE]
+                  for i in range(0, len(data), COMPRESS_BLOCK_SIZE))
+    else:
+        blocks = iter(lambda: data.read(COMPRESS_BLOCK_SIZE), b"")
+    body = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    try:
+        if compression == "zstd":
+            compressor = zstandard.ZstdCompressor().compressobj()
+            for block in blocks:
+                body.write(compressor.compress(block))
+            body.write(compressor.flush())
+        else:
+            # level 6 is much faster than the default (9) for a similar size
+            with gzip.GzipFile(fileobj=body, mode="wb", compresslevel=6,
+                               mtime=0) as gz:
+                for block in blocks:
+                    gz.write(block)
+    finally:
+        if hasattr(data, "close"):
+            data.close()
+    body.seek(0)
+    headers = dict(headers or {})
+    headers["Content-Encoding"] = compression
+    return body, headers
+
+
+# the HTTP header the idempotency key of a request is sent in
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+# the leeway, in seconds, allowed between the clocks of the client and server
+# when matching a journaled request to the requests on the server
+CLOCK_LEEWAY = 300.0
+
+def new_idempotency_key():
+    """Create a new, random, idempotency key to submit a request with
+
+       :rtype: string
+    """
+    return str(uuid.uuid4())
+
+
+def part_idempotency_key(idempotency_key, p):
+    """The idempotency key that part **p** (counting from 0) of an upload
+       split by :func:`upload_files_split`, or batch **p** of
+       :func:`download_batches`, is submitted with
+
+       :rtype: string
+    """
+    if idempotency_key is None:
+        return None
+    return "{}.part{:03d}".format(idempotency_key, p + 1)
+
+
+def parse_server_date(date):
+    """The earliest and latest times, in seconds since the epoch, that a date
+       returned by the server, e.g. the **date** of a request or the
+       **registered_date** of a batch, could be.  If the date has no timezone
+       then it could be in UTC or the local time.
+
+       :param string date: (`required`) the date, in ISO 8601 format.
+
+       :return: A tuple of (**earliest**, **latest**) times, or `None` if the date is empty or cannot be parsed.
+    """
+    if not date:
+        return None
+    try:
+        dt = datetime.datetime.fromisoformat(date.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is not None:
+        t = dt.timestamp()
+        return t, t
+    utc = calendar.timegm(dt.timetuple())
+    local = time.mktime(dt.timetuple())
+    return min(utc, local), max(utc, local)
+
+
+def _match_request(requests_data, entry, known_ids):
+    """Find the request that was created for a journal entry.  A request
+       matches if the server returned the idempotency key of the entry, or if
+       it has the same type, workspace, label and batch id, was created after
+       the entry was submitted and is not already journaled.  If several match
+       then the latest is returned."""
+    match = None
+    for r in requests_data:
+        if r.get("idempotency_key") == entry.key:
+            return r
+        if r["request_id"] in known_ids:
+            continue
+        try:
+            if get_request_type(r["request_type"]) != entry.request_type:
+                continue
+        except (IndexError, TypeError):
+            continue
+        if entry.workspace is not None and r.get("workspace") != entry.workspace:
+            continue
+        if entry.label is not None and r.get("label") != entry.label:
+            continue
+        if (entry.batch_id is not None and
+                r.get("migration_id") != entry.batch_id):
+            continue
+        request_time = parse_server_date(r.get("date"))
+        if (request_time is None or
+                request_time[1] < entry.submitted - CLOCK_LEEWAY):
+            continue
+        if match is None or r["request_id"] > match["request_id"]:
+            match = r
+    return match
+
+
+def _request_data(response, req_id):
+    """Get the request information from the response to a get_request call
+       for a single request id, or a Dictionary describing the error"""
+    try:
+        data = response.json()
+    except ValueError:
+        data = {"error": "HTTP status code {}".format(response.status_code)}
+    if response.status_code != 200 and "error" not in data:
+        data["error"] = "HTTP status code {}".format(response.status_code)
+    if response.status_code != 200:
+        data["status_code"] = response.status_code
+    data["request_id"] = req_id
+    return data
+
+
+def _call_error_data(error, req_id):
+    """A Dictionary describing a call for a request that failed without a
+       response, e.g. with a connection error or an open circuit breaker"""
+    return {"request_id" : req_id,
+            "error" : str(error) or error.__class__.__name__,
+            "status_code" : None}
+
+
+def _batch_data(response, batch_id):
+    """Get the request information from the response to a download_files
+       call for a batch, or a Dictionary describing the error"""
+    try:
+        data = response.json()
+    except ValueError:
+        data = {}
+    if response.status_code != 200 and "error" not in data:
+        data["error"] = "HTTP status code {}".format(response.status_code)
+    data["migration_id"] = batch_id
+    return data
+
+
+def _part_data(response, label, idempotency_key):
+    """Get the request information from the response to an upload_files call
+       for a part of a split upload, or a Dictionary describing the error"""
+    try:
+        data = response.json()
+    except ValueError:
+        data = {}
+    if response.status_code != 200:
+        if "error" not in data:
+            data["error"] = "HTTP status code {}".format(response.status_code)
+        data["idempotency_key"] = idempotency_key
+    data.setdefault("label", label)
+    return data
+
+
+def _submitted_data(data, entry):
+    """Mark the information about a request found in the journal as already
+       submitted, or return None if the request was not created"""
+    if data is None:
+        return None
+    if "error" in data:
+        # the request was created, but can no longer be looked up, e.g. it
+        # has finished and been removed
+        data = {"request_id" : entry.request_id}
+    data["already_submitted"] = True
+    data["idempotency_key"] = entry.key
+    for k, v in (("migration_id", entry.batch_id),
+                 ("workspace", entry.workspace), ("label", entry.label)):
+        if v is not None:
+            data.setdefault(k, v)
+    return data
+
+
+def _storage_credentials(credentials):
+    """Get a function which returns the credentials for a storage backend.
+       The credentials are either a Dictionary, keyed by the storage backend,
+       or a function of the storage backend, which is called once for each
+       storage backend"""
+    if credentials is None:
+        return lambda storage: None
+    if not callable(credentials):
+        return credentials.get
+    cache = {}
+    lock = threading.Lock()
+    def lookup(storage):
+        with lock:
+            if storage not in cache:
+                cache[storage] = credentials(storage)
+            return cache[storage]
+    return lookup
+
+
+def _filter_requests(response, req_ids):
+    """Filter the response to a get_request call for all requests so that it
+       contains just the requests in req_ids, in the same order"""
+    if response.status_code != 200:
+        return [_request_data(response, r) for r in req_ids]
+    requests_by_id = {}
+    for r in response.json()["requests"]:
+        requests_by_id[r["request_id"]] = r
+    data = []
+    for r in req_ids:
+        if r in requests_by_id:
+            data.append(requests_by_id[r])
+        else:
+            data.append({"request_id" : r, "error" : REQUEST_NOT_FOUND})
+    return data
+
+
+def _request_finished(data):
+    """Has the request reached a terminal stage, or could it not be found?
+       A server error (5xx), a connection error or an open circuit breaker
+       is not terminal: the request is polled again."""
+    if "stage" in data:
+        return data["stage"] in REQUEST_TERMINAL_STAGES
+    if data.get("error") == REQUEST_NOT_FOUND:
+        return True
+    # a 404, or another client error, will not change by polling again
+    status_code = data.get("status_code")
+    return status_code is not None and status_code < 500
+
+
+def _next_poll_interval(interval, progress, poll_interval, max_poll_interval):
+    """Exponential backoff of the polling interval, which is reset when any
+       of the requests being polled changes stage"""
+    if progress:
+        return poll_interval
+    return min(interval * 2, max_poll_interval)
+
+
+def _jitter(interval, jitter=0.2):
+    """Add random jitter to a polling interval, so that many clients do not
+       poll the server in lock step"""
+    return interval * random.uniform(1.0 - jitter, 1.0 + jitter)
+
+
+def _wait_results(req_ids, results, stages):
+    """Form the list of results of wait_for_requests, in the order of
+       req_ids, marking the requests that did not finish"""
+    data = []
+    for r in req_ids:
+        if r in results:
+            data.append(results[r])
+        else:
+            data.append({"request_id" : r,
+                         "stage" : stages.get(r),
+                         "error" : "Timed out waiting for request"})
+    return data
+
+
+# the default client, used by all of the module level functions below
+_default_client = None
+
+def get_default_client():
+    """Get the default client, creating it on the first call from the global
+       ``settings`` and the ``http`` settings in ``~/.jdma.json`` (see
+       :func:`jdma_common.read_http_settings`).  All of the module level
+       functions in jdma_lib are thin wrappers around this client, and so share
+       the same pooled connections.
+
+       :rtype: JdmaClient
+    """
+    global _default_client
+    if _default_client is None:
+        _default_client = JdmaClient(
+            journal=RequestJournal(),
+            circuit_breaker_path=default_circuit_breaker_path(),
+            **read_http_settings()
+        )
+    return _default_client
+
+
+def set_default_client(client):
+    """Replace the default client used by the module level functions, for
+       example to use a client with a larger connection pool.
+
+       :param JdmaClient client: (`required`) the client to use
+    """
+    global _default_client
+    _default_client = client
 
 ##### User functions - interact with HTTP API to manipulate users         ######
 
@@ -42,15 +1171,9 @@ def create_user(name, email=None, workspace="default"):
 
        :rtype: `requests.Response <http://docs.python-requests.org/en/master/api/#requests.Response>`_
        """
-    # create the credentials file - this function will check whether it exists
-    create_credentials_file(name, workspace)
-    url = settings.JDMA_API_URL + "user"
-    data = {"name" : name}
-    if email is not None:
-        data["email"] = email
-    ### Send the HTTP request (POST) to initialise a user.###
-    response = requests.post(url, data=json.dumps(data), verify=settings.VERIFY)
-    return response
+    return get_default_client().create_user(
+        name=name, email=email, workspace=workspace
+    )
 
 
 def update_user(name, email=None, notify=None):
@@ -78,16 +1201,9 @@ def update_user(name, email=None, notify=None):
 
        :rtype: `requests.Response <http://docs.python-requests.org/en/master/api/#requests.Response>`_
     """
-    ### Send the HTTP request (PUT) to update the email address of the user by
-    ### sending a PUT request.###
-    url = settings.JDMA_API_URL + "user?name=" + name
-    data = {"name" : name}
-    if email is not None:
-        data["email"] = email
-    if notify is not None:
-        data["notify"] = notify
-    response = requests.put(url, data=json.dumps(data), verify=settings.VERIFY)
-    return response
+    return get_default_client().update_user(
+        name=name, email=email, notify=notify
+    )
 
 
 def info_user(name):
@@ -115,10 +1231,7 @@ def info_user(name):
 
        :rtype: `requests.Response <http://docs.python-requests.org/en/master/api/#requests.Response>`_
     """
-    ###Send the HTTP request (GET) to return information about the user###
-    url = settings.JDMA_API_URL + "user?name=" + name
-    response = requests.get(url, verify=settings.VERIFY)
-    return response
+    return get_default_client().info_user(name=name)
 
 
 ##### Request functions - interact with HTTP API to manipulate requests   ######
@@ -155,16 +1268,67 @@ def get_request(name, req_id=None, workspace=None, ffilter=None):
 
        :rtype: `requests.Response <http://docs.python-requests.org/en/master/api/#requests.Response>`_
     """
-    url = settings.JDMA_API_URL + "request?name=" + name
-    if req_id != None:
-        url += "&request_id=" + str(req_id)
-    if workspace != None:
-        url += "&workspace=" + workspace
-    if ffilter != None:
-        url += "&filter=" + ffilter
-    # send the request
-    response = requests.get(url, verify=settings.VERIFY)
-    return response
+    return get_default_client().get_request(
+        name=name, req_id=req_id, workspace=workspace, ffilter=ffilter
+    )
+
+
+def get_requests(name, req_ids, workspace=None, ffilter=None, max_workers=8,
+                 single_call=None):
+    """Get the details of many requests in one concurrent sweep.
+
+       The requests are either fetched concurrently, with one call per request
+       id over a bounded pool of threads which share the pooled connections,
+       or, when a workspace-wide view is wanted, with a single call listing all
+       of the requests, which are then filtered on the client side.
+
+       :param string name: (`required`) name of the user.
+       :param list[`integer`] req_ids: (`required`) the request ids to get the details of.
+       :param string workspace: (`optional`) workspace to list the requests for.
+       :param string ffilter: (`optional`) filter the results on `user` name or `workspace`
+       :param integer max_workers: (`optional`) maximum number of concurrent calls.
+       :param bool single_call: (`optional`) use a single call listing all of the requests, rather than one call per request id.  If `none` then a single call is used if a `workspace` is supplied or `ffilter` is `workspace`.
+
+       :return: A list of Dictionaries, in the same order as **req_ids**, each containing the information about a request, with the same keys as the **json()** of :func:`get_request`.  If a request could not be found, or the call failed, the Dictionary contains the **request_id** and an **error** key and, if the call failed, the **status_code** of the response (`None` for a connection error or an open circuit breaker).
+
+       :rtype: `List`
+    """
+    return get_default_client().get_requests(
+        name=name, req_ids=req_ids, workspace=workspace, ffilter=ffilter,
+        max_workers=max_workers, single_call=single_call
+    )
+
+
+def wait_for_requests(name, req_ids, timeout=None, poll_interval=2.0,
+                      max_poll_interval=300.0, callback=None):
+    """Wait for one or more requests to reach a terminal stage: one of
+       `PUT_COMPLETED`, `GET_COMPLETED`, `DELETE_COMPLETED`, `FAILED` or
+       `FAILED_COMPLETED`.
+
+       The requests are polled, concurrently and over the pooled connections
+       of the default client, with an exponential backoff (and random jitter)
+       between polls.  The backoff is reset whenever one of the requests moves
+       to a new stage.  A poll of a request that fails with a server error
+       (5xx), a connection error or an open circuit breaker is retried at the
+       next poll, until the **timeout**, whereas a request that cannot be
+       found (404) is finished, with an error.
+
+       :param string name: (`required`) name of the user.
+       :param list[`integer`] req_ids: (`required`) the request ids to wait for.
+       :param float timeout: (`optional`) maximum time to wait, in seconds.  If `none` then wait until all of the requests have finished.
+       :param float poll_interval: (`optional`) initial time, in seconds, between polls.
+       :param float max_poll_interval: (`optional`) maximum time, in seconds, between polls.
+       :param callable callback: (`optional`) function called, with the Dictionary of request information, as soon as each request finishes.
+
+       :return: A list of Dictionaries, in the same order as **req_ids**, each containing the information about a request, with the same keys as the **json()** of :func:`get_request`.  If the request could not be found, or did not finish before the timeout, the Dictionary contains an **error** key.
+
+       :rtype: `List`
+    """
+    return get_default_client().wait_for_requests(
+        name=name, req_ids=req_ids, timeout=timeout,
+        poll_interval=poll_interval, max_poll_interval=max_poll_interval,
+        callback=callback
+    )
 
 
 def get_batch(name, batch_id=None, workspace=None, label=None, ffilter=None):
@@ -196,18 +1360,10 @@ def get_batch(name, batch_id=None, workspace=None, label=None, ffilter=None):
 
        :rtype: `requests.Response <http://docs.python-requests.org/en/master/api/#requests.Response>`_
     """
-    # send the HTTP request
-    url = settings.JDMA_API_URL + "migration?name=" + name
-    if batch_id != None:
-        url += "&migration_id=" + str(batch_id)
-    if workspace != None:
-        url += "&workspace=" + workspace
-    if label != None:
-        url += "&label=" + label
-    if ffilter != None:
-        url += "&filter=" + ffilter
-    response = requests.get(url, verify=settings.VERIFY)
-    return response
+    return get_default_client().get_batch(
+        name=name, batch_id=batch_id, workspace=workspace, label=label,
+        ffilter=ffilter
+    )
 
 
 def get_storage():
@@ -227,12 +1383,11 @@ def get_storage():
 
        :rtype: `requests.Response <http://docs.python-requests.org/en/master/api/#requests.Response>`_
     """
-    url = settings.JDMA_API_URL + "list_backends"
-    response = requests.get(url, verify=settings.VERIFY)
-    return response
+    return get_default_client().get_storage()
 
 
-def get_files(name, batch_id=None, workspace=None, limit=0, digest=0, ffilter=None):
+def get_files(name, batch_id=None, workspace=None, limit=0, digest=0,
+              ffilter=None, stream=False):
     """Get a list of files that belong to a batch.
 
        :param string name: (`required`) name of the user to get files for.
@@ -240,6 +1395,7 @@ def get_files(name, batch_id=None, workspace=None, limit=0, digest=0, ffilter=No
        :param string workspace: (`optional`) workspace to list files for.  If `none` then list files for all of the users' workspaces.
        :param integer limit: (`optional`) limit the number of files returned.
        :param integer digest: (`optional`) output the digest (checksum) for each file.
+       :param bool stream: (`optional`) stream the response, rather than reading it all in one go.  Use :func:`iter_file_records` to parse the files as they arrive.
 
        :return: A HTTP Response object. The two most important elements of this object are:
 
@@ -274,25 +1430,14 @@ def get_files(name, batch_id=None, workspace=None, limit=0, digest=0, ffilter=No
 
        :rtype: `requests.Response <http://docs.python-requests.org/en/master/api/#requests.Response>`_
     """
-
-    url = settings.JDMA_API_URL + "file?name=" + settings.USER
-    if batch_id is not None:
-        url += "&migration_id=" + str(batch_id)
-    if workspace is not None:
-        url += "&workspace=" + workspace
-    if ffilter != None:
-        url += "&filter=" + ffilter
-
-    # add the limit (the number of files output)
-    url += "&limit=" + str(limit)
-    # add whether to list the digest or not
-    url += "&digest="+ str(digest)
-    # do the request (POST)
-    response = requests.get(url, verify=settings.VERIFY)
-    return response
+    return get_default_client().get_files(
+        name=name, batch_id=batch_id, workspace=workspace, limit=limit,
+        digest=digest, ffilter=ffilter, stream=stream
+    )
 
 
-def get_archives(name, batch_id=None, workspace=None, limit=0, digest=0, ffilter=None):
+def get_archives(name, batch_id=None, workspace=None, limit=0, digest=0,
+                 ffilter=None, stream=False):
     """Get a list of archives that are in a batch.
 
        :param string name: (`required`) name of the user to get archives for.
@@ -300,6 +1445,7 @@ def get_archives(name, batch_id=None, workspace=None, limit=0, digest=0, ffilter
        :param string workspace: (`optional`) workspace to list archives for.  If `none` then list archives for all of the users' workspaces.
        :param integer limit: (`optional`) limit the number of archives returned.
        :param integer digest: (`optional`) output the digest (checksum) for each archive.
+       :param bool stream: (`optional`) stream the response, rather than reading it all in one go.  Use :func:`iter_archive_records` to parse the archives as they arrive.
 
        :return: A HTTP Response object. The two most important elementsof this object are:
 
@@ -327,26 +1473,307 @@ def get_archives(name, batch_id=None, workspace=None, limit=0, digest=0, ffilter
 
        :rtype: `requests.Response <http://docs.python-requests.org/en/master/api/#requests.Response>`_
     """
-    url = settings.JDMA_API_URL + "archive?name=" + settings.USER
-    if batch_id:
-        url += "&migration_id=" + str(batch_id)
-    if workspace:
-        url += "&workspace=" + workspace
-    if ffilter != None:
-        url += "&filter=" + ffilter
+    return get_default_client().get_archives(
+        name=name, batch_id=batch_id, workspace=workspace, limit=limit,
+        digest=digest, ffilter=ffilter, stream=stream
+    )
+
+
+def iter_files(name, batch_id=None, workspace=None, limit=0, digest=0,
+               ffilter=None, page_size=1000, resume_token=None, retries=3):
+    """Iterate lazily over the files in a batch, or all of the user's files.
+       The listing is streamed from the server, and the files are fetched in
+       pages as the iterator is consumed, so that only one page is held in
+       memory.  Failed pages are retried, and the listing can be resumed,
+       after it was interrupted, from its **resume_token**, e.g.:
+
+       .. code-block:: python
+
+           listing = iter_files(name, batch_id=12, page_size=10000)
+           for page in listing.pages():
+               process(page)
+               save(listing.resume_token)
+
+       :param string name: (`required`) name of the user to get files for.
+       :param integer batch_id: (`optional`) batch id to list files for.  If `none` then get all of the users' files.
+       :param string workspace: (`optional`) workspace to list files for.  If `none` then list files for all of the users' workspaces.
+       :param integer limit: (`optional`) limit the number of files returned.
+       :param integer digest: (`optional`) output the digest (checksum) for each file.
+       :param string ffilter: (`optional`) filter the results on `user` name or `workspace`
+       :param integer page_size: (`optional`) number of files in each page.
+       :param string resume_token: (`optional`) the **resume_token** of a previous iterator, to continue the listing from.
+       :param integer retries: (`optional`) number of times to retry a failed page.
+
+       :return: An iterable of tuples of (**batch**, **archive**, **file**) Dictionaries, as yielded by :func:`iter_file_records`.  Iterate over **pages()** to get the files a page at a time.  A **JdmaResponseError** is raised if the server returns an error.
+
+       :rtype: ListingIterator
+    """
+    return get_default_client().iter_files(
+        name=name, batch_id=batch_id, workspace=workspace, limit=limit,
+        digest=digest, ffilter=ffilter, page_size=page_size,
+        resume_token=resume_token, retries=retries
+    )
+
+
+def iter_archives(name, batch_id=None, workspace=None, limit=0, digest=0,
+                  ffilter=None, page_size=1000, resume_token=None, retries=3):
+    """Iterate lazily over the archives in a batch, or all of the user's
+       archives, in pages.  See :func:`iter_files`.
+
+       :return: An iterable of tuples of (**batch**, **archive**) Dictionaries, as yielded by :func:`iter_archive_records`.
+
+       :rtype: ListingIterator
+    """
+    return get_default_client().iter_archives(
+        name=name, batch_id=batch_id, workspace=workspace, limit=limit,
+        digest=digest, ffilter=ffilter, page_size=page_size,
+        resume_token=resume_token, retries=retries
+    )
+
 
-    # add the limit (the number of files output)
-    url += "&limit=" + str(limit)
-    # add whether to list the digest or not
-    url += "&digest=" + str(digest)
-    # do the request (POST)
-    response = requests.get(url, verify=settings.VERIFY)
+def iter_file_records(response):
+    """Iterate over the files in the response to a :func:`get_files` call,
+       without building the whole listing in memory.  If the response was
+       streamed (``stream=True``) and the ijson library is installed then the
+       files are parsed, and yielded, as they arrive from the server.
+       Otherwise the listing is parsed in one go.
 
-    return response
+       The keys of the batch (`migration_id`, `user`, etc.) and archive
+       (`archive_id`, `size`, etc.) are those that precede the list of
+       archives, or files, in the response.
+
+       :param response: (`required`) the response from :func:`get_files`.
+
+       :return: A generator of tuples of (**batch**, **archive**, **file**) Dictionaries, with the keys described in :func:`get_files`.  The **batch** and **archive** Dictionaries do not contain the **archives** and **files** lists, and are the same objects for all the files in the same batch and archive.
+
+       :rtype: `Generator`
+    """
+    return _iter_records(response, files=True)
+
+
+def iter_archive_records(response):
+    """Iterate over the archives in the response to a :func:`get_archives`
+       call.  As with :func:`iter_file_records`, the archives are parsed as
+       they arrive if the response was streamed and ijson is installed.
+
+       :param response: (`required`) the response from :func:`get_archives`.
+
+       :return: A generator of tuples of (**batch**, **archive**) Dictionaries, with the keys described in :func:`get_archives`.
+
+       :rtype: `Generator`
+    """
+    return _iter_records(response, files=False)
+
+
+def _iter_records(response, files):
+    """Iterate over the records (archives or files) in a listing"""
+    try:
+        if ijson is not None and getattr(response, "raw", None) is not None:
+            # decompress the raw stream if the server compressed the response
+            response.raw.decode_content = True
+            records = _parse_records(response.raw, files)
+        else:
+            records = _walk_records(response.json(), files)
+        for record in records:
+            yield record
+    finally:
+        # return the connection to the pool
+        response.close()
+
+
+def _walk_records(data, files):
+    """Walk the records of a listing that has already been parsed"""
+    for m in data["migrations"]:
+        migration = dict((k, v) for k, v in m.items() if k != "archives")
+        for a in m["archives"]:
+            archive = dict((k, v) for k, v in a.items() if k != "files")
+            if files:
+                for f in a["files"]:
+                    yield migration, archive, f
+            else:
+                yield migration, archive
+
+
+class _ListingBuilder(object):
+    """Builds the records of a listing from the events of the ijson parser,
+       holding only the current batch, archive and file.  The state is kept
+       between calls of **records**, so that the events of a listing can be
+       passed a chunk at a time, e.g. from an asynchronous stream."""
+    MIGRATION = "migrations.item"
+    ARCHIVE = "migrations.item.archives.item"
+    FILE = "migrations.item.archives.item.files.item"
+
+    def __init__(self, files):
+        self.files = files
+        self.migration = self.archive = self.record = None
+
+    def records(self, events):
+        """Generator of the records completed by the (**prefix**, **event**,
+           **value**) events"""
+        MIGRATION, ARCHIVE, FILE = self.MIGRATION, self.ARCHIVE, self.FILE
+        files = self.files
+        migration, archive, record = self.migration, self.archive, self.record
+        try:
+            for prefix, event, value in events:
+                if event == "start_map":
+                    if prefix == MIGRATION:
+                        migration = {}
+                    elif prefix == ARCHIVE:
+                        archive = {}
+                    elif prefix == FILE:
+                        record = {}
+                elif event == "end_map":
+                    if prefix == FILE and files:
+                        yield migration, archive, record
+                    elif prefix == ARCHIVE and not files:
+                        yield migration, archive
+                elif event in ("string", "number", "boolean", "null"):
+                    # split the prefix into the parent and the key
+                    parent, _, key = prefix.rpartition(".")
+                    if parent == FILE:
+                        record[key] = value
+                    elif parent == ARCHIVE:
+                        archive[key] = value
+                    elif parent == MIGRATION:
+                        migration[key] = value
+        finally:
+            self.migration = migration
+            self.archive = archive
+            self.record = record
+
+
+def _parse_records(fh, files):
+    """Incrementally parse the records of a listing from a file-like object,
+       using the ijson event stream, so that only the current batch, archive
+       and file are held in memory"""
+    return _ListingBuilder(files).records(ijson.parse(fh, use_float=True))
+
+
+class JdmaResponseError(Exception):
+    """Raised when the JDMA server returns an error (a HTTP status code other
+       than 200 OK) to a call whose result is not a response, for example when
+       iterating over a listing.  The response is kept in **response**."""
+    def __init__(self, response):
+        self.response = response
+        Exception.__init__(self, "HTTP status code {}".format(
+            response.status_code
+        ))
+
+
+class ListingIterator(object):
+    """Lazily iterate over the records (files or archives) of a listing, in
+       pages of **page_size** records, as returned by :func:`iter_files` and
+       :func:`iter_archives`.
+
+       The JDMA server does not support fetching a listing in pages, so the
+       listing is streamed and chunked into pages on the client side.  The
+       request for the listing is retried by the session of the client, as
+       for any other call.  If the stream is then cut off part way through
+       the listing, it is requested again, up to **retries** times, and the
+       records that have already been yielded are skipped.  The position in
+       the listing is available, at any time, as the **resume_token**, which
+       can be passed to a new iterator to continue the listing after it was
+       interrupted.
+    """
+    def __init__(self, client, name, batch_id=None, workspace=None, limit=0,
+                 digest=0, ffilter=None, files=True, page_size=1000,
+                 resume_token=None, retries=3):
+        self.client = client
+        self.name = name
+        self.batch_id = batch_id
+        self.workspace = workspace
+        self.limit = limit
+        self.digest = digest
+        self.ffilter = ffilter
+        self.files = files
+        self.page_size = page_size
+        self.retries = retries
+        if resume_token is None:
+            self.position = 0
+        else:
+            self.position = int(resume_token)
+
+    @property
+    def resume_token(self):
+        """Token to resume the listing from the record after the last one
+           that was yielded"""
+        return str(self.position)
+
+    def _get_listing(self):
+        """Send the (streamed) request for the listing"""
+        if self.files:
+            get_listing = self.client.get_files
+        else:
+            get_listing = self.client.get_archives
+        response = get_listing(
+            self.name, batch_id=self.batch_id, workspace=self.workspace,
+            limit=self.limit, digest=self.digest, ffilter=self.ffilter,
+            stream=True
+        )
+        if response.status_code != 200:
+            raise JdmaResponseError(response)
+        return _iter_records(response, self.files)
+
+    def _iter_records(self):
+        """Iterate over the records from the current position, requesting the
+           listing again if the stream is cut off.  The records already
+           yielded, including those in a page that has not been completed,
+           are skipped when the listing is requested again."""
+        streamed = self.position
+        attempt = 0
+        while True:
+            # errors making the request have already been retried by the
+            # session, so they are raised
+            records = self._get_listing()
+            skip = streamed
+            try:
+                for record in records:
+                    if skip > 0:
+                        skip -= 1
+                        continue
+                    streamed += 1
+                    yield record
+                return
+            except STREAM_ERRORS:
+                if attempt >= self.retries:
+                    raise
+            finally:
+                records.close()
+            attempt += 1
+            time.sleep(_jitter(
+                self.client.backoff_factor * 2**(attempt - 1)
+            ))
+
+    def pages(self):
+        """Generator of pages of records.  Each page is a list of up to
+           **page_size** records."""
+        page = []
+        records = self._iter_records()
+        try:
+            for record in records:
+                page.append(record)
+                if len(page) == self.page_size:
+                    self.position += len(page)
+                    yield page
+                    page = []
+            if len(page) > 0:
+                self.position += len(page)
+                yield page
+        finally:
+            records.close()
+
+    def __iter__(self):
+        records = self._iter_records()
+        try:
+            for record in records:
+                self.position += 1
+                yield record
+        finally:
+            records.close()
 
 
 def upload_files(name, workspace=None, filelist=[], label=None, request_type=None,
-                 storage=None, credentials=None):
+                 storage=None, credentials=None, idempotency_key=None):
     """Put a list of files to a storage backend.
 
        :param string name: (`required`) name of the user to get archives for.
@@ -356,6 +1783,7 @@ def upload_files(name, workspace=None, filelist=[], label=None, request_type=Non
        :param string request_type: (`optional`) request type for putting files to storage.  Can be either `PUT`, which is non-destructive, or `MIGRATE` which will delete the source files after a successful upload.
        :param string storage: (`optional`) the storage backend to put the files to.  e.g. `objectstore` or `elastictape`.
        :param Dictionary[`string`] credentials: (`optional`) value:key pairs of credentials required by backend and groupworkspace.
+       :param string idempotency_key: (`optional`) the idempotency key to submit the request with, e.g. from :func:`new_idempotency_key`.  If the call fails, e.g. it times out, submitting the request again with the same key lets :func:`reconcile_request` find out whether the first submission was created.  If `none` then a new key is used.
 
        :return: A HTTP Response object. The two most important elements of this object are:
 
@@ -396,29 +1824,89 @@ def upload_files(name, workspace=None, filelist=[], label=None, request_type=Non
 
        :rtype: `requests.Response <http://docs.python-requests.org/en/master/api/#requests.Response>`_
     """
-    # build the URL
-    url = settings.JDMA_API_URL + "request"
+    return get_default_client().upload_files(
+        name=name, workspace=workspace, filelist=filelist, label=label,
+        request_type=request_type, storage=storage, credentials=credentials,
+        idempotency_key=idempotency_key
+    )
+
 
-    # set the data
-    data = {"name" : name,
-            "workspace" : workspace,
-            "filelist" : filelist,
-            "label" : label,
-            "request_type" : request_type,
-            "storage" : storage,
-            "credentials" : credentials}
+def partition_filelist(files, max_batch_size=None, max_files_per_batch=None):
+    """Partition a list of files into parts, each with a total size of no more
+       than **max_batch_size** bytes and no more than **max_files_per_batch**
+       files.  The files are bin-packed by size, largest first, into the part
+       with the most space remaining, so that the parts are of similar size.
+       A file larger than **max_batch_size** is put in a part on its own.
 
-    # do the request (POST)
-    response = requests.post(url, data=json.dumps(data), verify=settings.VERIFY)
-    return response
+       :param list[`tuple`] files: (`required`) list of (**path**, **size**, ...) tuples, e.g. the **files** of a :func:`jdma_scan.scan_paths` result.
+       :param integer max_batch_size: (`optional`) maximum total size of the files in a part, in bytes.
+       :param integer max_files_per_batch: (`optional`) maximum number of files in a part.
 
+       :return: A list of parts, each of which is a sorted list of paths.
 
-def delete_batch(name, batch_id=None, storage=None, credentials=None):
+       :rtype: `List`
+    """
+    if max_batch_size is None:
+        max_batch_size = float("inf")
+    parts = []
+    # heap of (-remaining size, part index) of the parts that are not full
+    heap = []
+    for f in sorted(files, key=lambda f: f[1], reverse=True):
+        path, size = f[0], f[1]
+        if heap and -heap[0][0] >= size:
+            remaining, p = heapq.heappop(heap)
+            remaining += size
+        else:
+            # no part has enough space remaining - start a new part
+            p = len(parts)
+            parts.append([])
+            remaining = size - max_batch_size
+        parts[p].append(path)
+        if max_files_per_batch is None or len(parts[p]) < max_files_per_batch:
+            heapq.heappush(heap, (remaining, p))
+    for part in parts:
+        part.sort()
+    return parts
+
+
+def upload_files_split(name, workspace=None, files=[], label=None,
+                       request_type=None, storage=None, credentials=None,
+                       max_batch_size=None, max_files_per_batch=None,
+                       max_workers=4, idempotency_key=None):
+    """Put a list of files to a storage backend, split into several batches,
+       which are submitted concurrently.  The files are partitioned with
+       :func:`partition_filelist` and each batch is given the label
+       ``label.partNNN``, so that the batches can be tracked as a group.
+
+       :param string name: (`required`) name of the user to put files for.
+       :param list[`tuple`] files: (`required`) list of (**path**, **size**, ...) tuples of the files to put to storage.  Absolute paths must be used.
+       :param integer max_batch_size: (`optional`) maximum total size of the files in a batch, in bytes.
+       :param integer max_files_per_batch: (`optional`) maximum number of files in a batch.
+       :param integer max_workers: (`optional`) maximum number of batches to submit concurrently.
+       :param string idempotency_key: (`optional`) the idempotency key to submit the batches with.  Each batch is submitted with the key ``idempotency_key.partNNN``.  If the upload is repeated with the same key, only the batches whose requests were not created are submitted again, see :func:`submitted_request`.
+
+       The other parameters are the same as for :func:`upload_files`.
+
+       :return: A list of Dictionaries, one for each batch, in order of the part number, each containing the information about the request for the batch, with the same keys as the **json()** of :func:`upload_files`.  If the request failed, the Dictionary contains an **error** key and the **idempotency_key** of the batch.  If the request had already been submitted, the Dictionary contains the information from :func:`get_request` and **already_submitted** is `True`.
+
+       :rtype: `List`
+    """
+    return get_default_client().upload_files_split(
+        name=name, workspace=workspace, files=files, label=label,
+        request_type=request_type, storage=storage, credentials=credentials,
+        max_batch_size=max_batch_size, max_files_per_batch=max_files_per_batch,
+        max_workers=max_workers, idempotency_key=idempotency_key
+    )
+
+
+def delete_batch(name, batch_id=None, storage=None, credentials=None,
+                 idempotency_key=None):
     """Delete a single batch from a storage backend.
 
        :param string name: (`required`) name of the user to get archives for.
        :param integer batch_id: (`optional`) unique id of the batch
        :param Dictionary[`string`] credentials: (`optional`) value:key pairs of credentials required by backend and groupworkspace.
+       :param string idempotency_key: (`optional`) the idempotency key to submit the request with, e.g. from :func:`new_idempotency_key`.  If the call fails, e.g. it times out, submitting the request again with the same key lets :func:`reconcile_request` find out whether the first submission was created.  If `none` then a new key is used.
 
        :return: A HTTP Response object. The two most important elements of this object are:
 
@@ -446,22 +1934,14 @@ def delete_batch(name, batch_id=None, storage=None, credentials=None):
 
        :rtype: `requests.Response <http://docs.python-requests.org/en/master/api/#requests.Response>`_
     """
-    # use the same POST URL as GET and PUT
-    url = settings.JDMA_API_URL + "request"
-    # set the user and request type data
-    data = {"name" : name,
-            "request_type" : "DELETE",
-            "migration_id" : batch_id,
-            "storage" : storage,
-            "credentials" : credentials}
-    # do the request (POST)
-    response = requests.post(url, data=json.dumps(data), verify=settings.VERIFY)
-
-    return response
+    return get_default_client().delete_batch(
+        name=name, batch_id=batch_id, storage=storage,
+        credentials=credentials, idempotency_key=idempotency_key
+    )
 
 
 def download_files(name, batch_id=None, filelist=[], target_dir=None,
-                   credentials=None):
+                   credentials=None, idempotency_key=None):
     """Download files from a storage backend.
 
        :param string name: (`required`) name of the user to get archives for.
@@ -469,6 +1949,7 @@ def download_files(name, batch_id=None, filelist=[], target_dir=None,
        :param list[`string`] filelist: (`optional`) list of files to put to storage.  Absolute paths must be used.
        :param string target_dir: (`optional`) path to download the files to.
        :param Dictionary[`string`] credentials: (`optional`) value:key pairs of credentials required by backend and groupworkspace.
+       :param string idempotency_key: (`optional`) the idempotency key to submit the request with, e.g. from :func:`new_idempotency_key`.  If the call fails, e.g. it times out, submitting the request again with the same key lets :func:`reconcile_request` find out whether the first submission was created.  If `none` then a new key is used.
 
        :return: A HTTP Response object. The two most important elements of this object are:
 
@@ -509,21 +1990,81 @@ def download_files(name, batch_id=None, filelist=[], target_dir=None,
 
        :rtype: `requests.Response <http://docs.python-requests.org/en/master/api/#requests.Response>`_
     """
-    # use the same POST URL as DELETE and PUT
-    url = settings.JDMA_API_URL + "request"
+    return get_default_client().download_files(
+        name=name, batch_id=batch_id, filelist=filelist,
+        target_dir=target_dir, credentials=credentials,
+        idempotency_key=idempotency_key
+    )
+
+
+def download_batches(name, batch_ids, filelist=[], target_dir=None,
+                     credentials=None, max_workers=4, idempotency_key=None):
+    """Download several batches from their storage backends, e.g. to restore a
+       whole project.  The batches are looked up, to find their storage
+       backends, and the GET requests submitted, concurrently, with at most
+       **max_workers** batches in progress at once.
+
+       :param string name: (`required`) name of the user.
+       :param list[`integer`] batch_ids: (`required`) the ids of the batches to download.
+       :param list[`string`] filelist: (`optional`) list of files to download from each batch.  If empty then all of the files are downloaded.
+       :param string target_dir: (`optional`) path to download the files to.
+       :param credentials: (`optional`) the credentials for the storage backends: either a Dictionary, keyed by the name of the storage backend, or a function that takes the name of the storage backend and returns its credentials.  The function is called once for each storage backend.
+       :param integer max_workers: (`optional`) maximum number of batches to look up and submit at once.
+       :param string idempotency_key: (`optional`) the key to submit the requests with.  The request for each batch is submitted with the key of its part, see :func:`part_idempotency_key`, in the order of **batch_ids**.  If the download is repeated with the same key, only the batches whose requests were not created are submitted again, see :func:`submitted_request`.
+
+       :return: A list of Dictionaries, in the same order as **batch_ids**, each containing the information about the GET request for a batch, with the same keys as the **json()** of :func:`download_files`, and the **migration_id**.  If the batch could not be found, or the request failed, the Dictionary contains an **error** key.  If the request had already been submitted, the Dictionary contains the information from :func:`get_request` and **already_submitted** is `True`.
+
+       :rtype: `List`
+    """
+    return get_default_client().download_batches(
+        name=name, batch_ids=batch_ids, filelist=filelist,
+        target_dir=target_dir, credentials=credentials,
+        max_workers=max_workers, idempotency_key=idempotency_key
+    )
 
-    data = {"name" : name,
-            "request_type" : "GET",
-            "migration_id" : batch_id,
-            "target_path" : target_dir,
-            "credentials" : credentials}
-    # Only add filelist if non-empty
-    if filelist != []:
-        data["filelist"] = filelist
-    # do the request (POST)
-    response = requests.post(url, data=json.dumps(data), verify=settings.VERIFY)
 
-    return response
+def reconcile_request(name, idempotency_key):
+    """Find the request that was submitted with an idempotency key, e.g.
+       after the call to :func:`upload_files`, :func:`download_files` or
+       :func:`delete_batch` failed and it is not known whether the server
+       created the request.  The key is looked up in the journal of the client
+       and, if the id of the request is not known, the user's requests on the
+       server are searched for the request with the same key or, if the server
+       does not return the keys, the same type, workspace, label and batch id,
+       created after the request was submitted.
+
+       If no request is found then it is safe to submit the request again,
+       with the same key.
+
+       :param string name: (`required`) name of the user the request was submitted for.
+       :param string idempotency_key: (`required`) the idempotency key the request was submitted with.
+
+       :return: A Dictionary containing the information about the request, with the same keys as the **json()** of :func:`get_request`, or `None` if the request was not created.  An **Exception** is raised if the key is not in the journal and a **JdmaResponseError** if the server returns an error.
+
+       :rtype: `Dictionary`
+    """
+    return get_default_client().reconcile_request(
+        name=name, idempotency_key=idempotency_key
+    )
+
+
+def submitted_request(name, idempotency_key):
+    """Find the request already submitted with an idempotency key, so that a
+       call that is repeated with the same key, e.g. to retry a failed
+       :func:`upload_files_split` or :func:`download_batches`, only submits
+       the requests that were not created.  Unlike :func:`reconcile_request`,
+       a key that is not in the journal is not an error.
+
+       :param string name: (`required`) name of the user the request was submitted for.
+       :param string idempotency_key: (`required`) the idempotency key the request was submitted with.
+
+       :return: A Dictionary containing the information about the request, as for :func:`reconcile_request`, with **already_submitted** set to `True` and the **idempotency_key**, or `None` if the key is not in the journal or the request was not created.  A **JdmaResponseError** is raised if the server returns an error.
+
+       :rtype: `Dictionary`
+    """
+    return get_default_client().submitted_request(
+        name=name, idempotency_key=idempotency_key
+    )
 
 
 def modify_batch(name, batch_id=None, label=None):
@@ -553,13 +2094,6 @@ def modify_batch(name, batch_id=None, label=None):
 
        :rtype: `requests.Response <http://docs.python-requests.org/en/master/api/#requests.Response>`_
     """
-    # PUT URL for migration
-    url = settings.JDMA_API_URL + "migration/?name=" + settings.USER
-    if batch_id:
-        url += "&migration_id=" + str(batch_id)
-    data = {}
-    if label:
-        data["label"] = label
-    # do the request (PUT)
-    response = requests.put(url, data=json.dumps(data), verify=settings.VERIFY)
-    return response
+    return get_default_client().modify_batch(
+        name=name, batch_id=batch_id, label=label
+    )
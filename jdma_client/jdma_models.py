@@ -0,0 +1,344 @@
+"""
+Typed results for the routines in jdma_lib.
+
+The routines in jdma_lib return the ``requests.Response`` from the JDMA HTTP
+API, whose **json()** is a Dictionary keyed by strings.  The functions here
+parse a response, or the records of a listing, into compact objects with
+``__slots__`` (Request, Batch, Archive, File and Storage), with the request
+types and stages as enums.  They are generators, so the objects are only built
+as they are iterated over, and the raw response is still available to the
+caller, e.g.:
+
+    response = jdma_lib.get_request(name)
+    for request in jdma_models.requests(response):
+        if request.stage == RequestStage.PUT_COMPLETED:
+            ...
+
+A **JdmaResponseError** is raised if the response is an error.
+
+"""
+
+from enum import IntEnum
+
+from jdma_client.jdma_common import REQUEST_TYPES, REQUEST_STAGES, BATCH_STAGES
+
+##### Enums for the request types and stages, and the batch stages         #####
+
+RequestType = IntEnum(
+    "RequestType", [(t, i) for i, t in enumerate(REQUEST_TYPES)]
+)
+RequestStage = IntEnum(
+    "RequestStage", [(s, i) for i, s in sorted(REQUEST_STAGES.items())]
+)
+BatchStage = IntEnum(
+    "BatchStage", [(s, i) for i, s in sorted(BATCH_STAGES.items())]
+)
+
+# the enum members, indexed by number, as calling the enum is slow
+_REQUEST_TYPES = dict((int(t), t) for t in RequestType)
+_REQUEST_STAGES = dict((int(s), s) for s in RequestStage)
+_BATCH_STAGES = dict((int(s), s) for s in BatchStage)
+
+##### The models                                                           #####
+
+class Request(object):
+    """A migration request: a PUT, GET, MIGRATE or DELETE of a batch.
+
+       - **request_id** (`integer`): the unique request id
+       - **user** (`string`): the name of the user that the request belongs to
+       - **request_type** (`RequestType`): PUT, GET, MIGRATE or DELETE
+       - **batch_id** (`integer`): the batch id that the request refers to
+       - **workspace** (`string`): the workspace that the batch belongs to
+       - **label** (`string`): the label of the batch
+       - **storage** (`string`): the storage system the batch resides on
+       - **date** (`string`): the time and date the request was made
+       - **stage** (`RequestStage`): the stage of the request
+       - **failure_reason** (`string`): why the request failed, if stage is FAILED
+    """
+    __slots__ = ("request_id", "user", "request_type", "batch_id",
+                 "workspace", "label", "storage", "date", "stage",
+                 "failure_reason")
+
+    def __init__(self, request_id, user=None, request_type=None,
+                 batch_id=None, workspace=None, label=None, storage=None,
+                 date=None, stage=None, failure_reason=None):
+        self.request_id = request_id
+        self.user = user
+        self.request_type = request_type
+        self.batch_id = batch_id
+        self.workspace = workspace
+        self.label = label
+        self.storage = storage
+        self.date = date
+        self.stage = stage
+        self.failure_reason = failure_reason
+
+    @classmethod
+    def from_json(cls, data):
+        """Build a Request from a Dictionary returned by the HTTP API"""
+        return cls(
+            data["request_id"],
+            data.get("user"),
+            _REQUEST_TYPES.get(data.get("request_type")),
+            data.get("migration_id"),
+            data.get("workspace"),
+            data.get("label"),
+            data.get("storage"),
+            data.get("date"),
+            _REQUEST_STAGES.get(data.get("stage")),
+            data.get("failure_reason")
+        )
+
+    @property
+    def finished(self):
+        """Has the request finished, either successfully or not?"""
+        return self.stage in (
+            RequestStage.PUT_COMPLETED, RequestStage.GET_COMPLETED,
+            RequestStage.DELETE_COMPLETED, RequestStage.FAILED,
+            RequestStage.FAILED_COMPLETED
+        )
+
+    @property
+    def failed(self):
+        """Has the request failed?"""
+        return self.stage in (
+            RequestStage.FAILED, RequestStage.FAILED_COMPLETED
+        )
+
+    def __repr__(self):
+        return "Request({}, {}, stage={})".format(
+            self.request_id, _name(self.request_type), _name(self.stage)
+        )
+
+
+class Batch(object):
+    """A batch (migration) of files.
+
+       - **batch_id** (`integer`): the batch id
+       - **user** (`string`): the name of the user that the batch belongs to
+       - **workspace** (`string`): the workspace the batch belongs to
+       - **label** (`string`): the label of the batch
+       - **storage** (`string`): the external storage the batch is on
+       - **external_id** (`string`): the unique id of the batch on the external storage
+       - **registered_date** (`string`): the date the batch was uploaded
+       - **stage** (`BatchStage`): the stage of the batch
+       - **failure_reason** (`string`): why the batch failed, if stage is FAILED
+    """
+    __slots__ = ("batch_id", "user", "workspace", "label", "storage",
+                 "external_id", "registered_date", "stage", "failure_reason")
+
+    def __init__(self, batch_id, user=None, workspace=None, label=None,
+                 storage=None, external_id=None, registered_date=None,
+                 stage=None, failure_reason=None):
+        self.batch_id = batch_id
+        self.user = user
+        self.workspace = workspace
+        self.label = label
+        self.storage = storage
+        self.external_id = external_id
+        self.registered_date = registered_date
+        self.stage = stage
+        self.failure_reason = failure_reason
+
+    @classmethod
+    def from_json(cls, data):
+        """Build a Batch from a Dictionary returned by the HTTP API"""
+        return cls(
+            data["migration_id"],
+            data.get("user"),
+            data.get("workspace"),
+            data.get("label"),
+            data.get("storage"),
+            data.get("external_id"),
+            data.get("registered_date"),
+            _BATCH_STAGES.get(data.get("stage")),
+            data.get("failure_reason")
+        )
+
+    def __repr__(self):
+        return "Batch({}, {!r}, stage={})".format(
+            self.batch_id, self.label, _name(self.stage)
+        )
+
+
+class Archive(object):
+    """An archive in a batch.
+
+       - **archive_id** (`string`): the id of the archive
+       - **size** (`integer`): the size of the archive, in bytes
+       - **digest** (`string`): the digest of the archive, if requested
+       - **digest_format** (`string`): the format of the digest, e.g. SHA256
+       - **batch** (`Batch`): the batch the archive is in
+    """
+    __slots__ = ("archive_id", "size", "digest", "digest_format", "batch")
+
+    def __init__(self, archive_id, size=None, digest=None, digest_format=None,
+                 batch=None):
+        self.archive_id = archive_id
+        self.size = size
+        self.digest = digest
+        self.digest_format = digest_format
+        self.batch = batch
+
+    @classmethod
+    def from_json(cls, data, batch=None):
+        """Build an Archive from a Dictionary returned by the HTTP API"""
+        return cls(
+            data["archive_id"],
+            data.get("size"),
+            data.get("digest"),
+            data.get("digest_format"),
+            batch
+        )
+
+    def __repr__(self):
+        return "Archive({!r}, size={})".format(self.archive_id, self.size)
+
+
+class File(object):
+    """A file in an archive.  The files in the same archive share the same
+       Archive, and the archives in the same batch share the same Batch.
+
+       - **path** (`string`): the original path of the file
+       - **size** (`integer`): the size of the file, in bytes
+       - **digest** (`string`): the digest of the file, if requested
+       - **digest_format** (`string`): the format of the digest, e.g. SHA256
+       - **archive** (`Archive`): the archive the file is in
+    """
+    __slots__ = ("path", "size", "digest", "digest_format", "archive")
+
+    def __init__(self, path, size=None, digest=None, digest_format=None,
+                 archive=None):
+        self.path = path
+        self.size = size
+        self.digest = digest
+        self.digest_format = digest_format
+        self.archive = archive
+
+    @classmethod
+    def from_json(cls, data, archive=None):
+        """Build a File from a Dictionary returned by the HTTP API"""
+        return cls(
+            data["path"],
+            data.get("size"),
+            data.get("digest"),
+            data.get("digest_format"),
+            archive
+        )
+
+    @property
+    def batch(self):
+        """The batch the file is in"""
+        if self.archive is None:
+            return None
+        return self.archive.batch
+
+    def __repr__(self):
+        return "File({!r}, size={})".format(self.path, self.size)
+
+
+class Storage(object):
+    """A storage backend.
+
+       - **storage_id** (`string`): the id of the storage backend
+       - **name** (`string`): the name of the storage backend, e.g. elastictape
+    """
+    __slots__ = ("storage_id", "name")
+
+    def __init__(self, storage_id, name):
+        self.storage_id = storage_id
+        self.name = name
+
+    def __repr__(self):
+        return "Storage({!r}, {!r})".format(self.storage_id, self.name)
+
+
+def _name(value):
+    """The name of an enum member, or the value if it is not a member"""
+    return getattr(value, "name", value)
+
+##### Parse layer - build the models from the responses                    #####
+
+def _json(response):
+    """The JSON of a response, raising a JdmaResponseError for an error"""
+    if response.status_code != 200:
+        # imported here so that the models can be used without requests
+        from jdma_client.jdma_lib import JdmaResponseError
+        raise JdmaResponseError(response)
+    return response.json()
+
+
+def requests(response):
+    """Iterate over the requests in the response from
+       :func:`jdma_lib.get_request`, for either a single request or a list.
+
+       :return: An iterable of Requests.
+    """
+    data = _json(response)
+    if "requests" in data:
+        for r in data["requests"]:
+            yield Request.from_json(r)
+    else:
+        yield Request.from_json(data)
+
+
+def batches(response):
+    """Iterate over the batches in the response from
+       :func:`jdma_lib.get_batch`, for either a single batch or a list.
+
+       :return: An iterable of Batches.
+    """
+    data = _json(response)
+    if "migrations" in data:
+        for b in data["migrations"]:
+            yield Batch.from_json(b)
+    else:
+        yield Batch.from_json(data)
+
+
+def files(records):
+    """Iterate over the files in a listing, as they are parsed.  The records
+       can be from :func:`jdma_lib.iter_files`,
+       :func:`jdma_cache.cached_iter_files` or, for a response from
+       :func:`jdma_lib.get_files`, :func:`jdma_lib.iter_file_records`.
+
+       :return: An iterable of Files.
+    """
+    migration = archive_data = None
+    batch = archive = None
+    for m, a, f in records:
+        # the records for the same batch and archive share the same
+        # Dictionaries, so each Batch and Archive is only built once
+        if m is not migration:
+            migration = m
+            batch = Batch.from_json(m)
+        if a is not archive_data:
+            archive_data = a
+            archive = Archive.from_json(a, batch)
+        yield File.from_json(f, archive)
+
+
+def archives(records):
+    """Iterate over the archives in a listing, as they are parsed.  The
+       records can be from :func:`jdma_lib.iter_archives`,
+       :func:`jdma_cache.cached_iter_archives` or, for a response from
+       :func:`jdma_lib.get_archives`, :func:`jdma_lib.iter_archive_records`.
+
+       :return: An iterable of Archives.
+    """
+    migration = batch = None
+    for m, a in records:
+        if m is not migration:
+            migration = m
+            batch = Batch.from_json(m)
+        yield Archive.from_json(a, batch)
+
+
+def storage(response):
+    """Iterate over the storage backends in the response from
+       :func:`jdma_lib.get_storage`.
+
+       :return: An iterable of Storage.
+    """
+    for storage_id, name in _json(response).items():
+        yield Storage(storage_id, name)
@@ -0,0 +1,221 @@
+"""
+Client-side scanning of the directories and files to be uploaded to the JDMA.
+
+The directory trees are walked in parallel, with a pool of threads each
+scanning one directory at a time with ``os.scandir``.  On parallel file
+systems (e.g. Lustre or GPFS) the latency of each directory listing is high,
+so scanning many directories at once is much faster than a serial walk.
+
+Filelists are validated before they are submitted in the same way, with the
+paths in the filelist checked (``os.stat``) by a pool of threads, a chunk of
+paths at a time.
+
+"""
+
+import os
+import stat
+import errno
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# default number of threads to scan directories with
+DEFAULT_SCAN_WORKERS = 16
+# number of paths in a filelist that each thread validates in one go
+VALIDATE_CHUNK_SIZE = 1024
+
+
+class ScanResult(object):
+    """The result of a scan of a set of directories and files.
+
+       - **files** (`List`): a list of (**path**, **size**, **mtime**) tuples, one for each file found that can be read
+       - **n_dirs** (`integer`): the number of directories scanned
+       - **total_size** (`integer`): the total size of the files, in bytes
+       - **errors** (`List`): a list of (**path**, **error**) tuples, one for each file or directory that could not be read
+    """
+    def __init__(self):
+        self.files = []
+        self.n_dirs = 0
+        self.total_size = 0
+        self.errors = []
+
+    def add_file(self, path, size, mtime):
+        self.files.append((path, size, mtime))
+        self.total_size += size
+
+    @property
+    def paths(self):
+        """The paths of all of the files found"""
+        return [f[0] for f in self.files]
+
+
+def _scan_file(path, st):
+    """Check a file found by the scan, returning an error if it cannot be
+       read"""
+    if stat.S_ISREG(st.st_mode) and not os.access(path, os.R_OK):
+        return "Permission denied"
+    return None
+
+
+def _scan_dir(path):
+    """Scan a single directory.  Returns the files, the sub-directories and
+       the errors found"""
+    files = []
+    subdirs = []
+    errors = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                    error = _scan_file(entry.path, st)
+                    if error is not None:
+                        # the server could not read it either
+                        errors.append((entry.path, error))
+                        continue
+                    files.append((entry.path, st.st_size, st.st_mtime))
+                except OSError as e:
+                    errors.append((entry.path, e.strerror))
+    except OSError as e:
+        errors.append((path, e.strerror))
+    return files, subdirs, errors
+
+
+def scan_paths(paths, max_workers=DEFAULT_SCAN_WORKERS):
+    """Scan a list of directories and files, walking the directory trees in
+       parallel, and collect the path, size and modification time of every
+       file, along with any files or directories that cannot be read, which
+       are not in the files found.  Symbolic links in the **paths** are
+       followed, e.g. to scan a link to a directory, but the symbolic links
+       found in the directories are not.
+
+       :param list[`string`] paths: (`required`) the directories and files to scan.  Directories are scanned recursively.
+       :param integer max_workers: (`optional`) number of threads to scan directories with.
+
+       :return: The files found, their total size and the errors.
+
+       :rtype: ScanResult
+    """
+    result = ScanResult()
+    dirs = []
+    for path in paths:
+        # follow a link given as a path, so that a link to a directory is
+        # scanned as the directory, as it is put by migrate_or_put
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            result.errors.append((path, e.strerror))
+            continue
+        if stat.S_ISDIR(st.st_mode):
+            dirs.append(path)
+        else:
+            error = _scan_file(path, st)
+            if error is not None:
+                result.errors.append((path, error))
+                continue
+            result.add_file(path, st.st_size, st.st_mtime)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = set(executor.submit(_scan_dir, d) for d in dirs)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs, errors = future.result()
+                result.n_dirs += 1
+                for f in files:
+                    result.add_file(*f)
+                result.errors.extend(errors)
+                # scan the sub-directories as soon as they are found
+                for d in subdirs:
+                    pending.add(executor.submit(_scan_dir, d))
+    return result
+
+
+def _validate_path(path):
+    """Validate a single path in a filelist.  Returns the status of the path
+       (following symbolic links) and the error, if any"""
+    if not os.path.isabs(path):
+        return None, "Not an absolute path"
+    try:
+        st = os.stat(path)
+    except OSError as e:
+        if e.errno == errno.ENOENT and os.path.lexists(path):
+            return None, "Broken symbolic link"
+        if e.errno == errno.ELOOP:
+            return None, "Symbolic link loop"
+        return None, e.strerror
+    if stat.S_ISDIR(st.st_mode):
+        if not os.access(path, os.R_OK | os.X_OK):
+            return st, "Permission denied"
+        return st, None
+    return st, _scan_file(path, st)
+
+
+def _validate_chunk(paths):
+    """Validate a chunk of the paths in a filelist"""
+    return [(path,) + _validate_path(path) for path in paths]
+
+
+def _chunks(paths, size):
+    """Split an iterable of paths into lists of (at most) size paths"""
+    chunk = []
+    for path in paths:
+        chunk.append(path)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _add_checked(result, checked):
+    """Add the paths checked by _validate_chunk to the result"""
+    for path, st, error in checked:
+        if error is not None:
+            result.errors.append((path, error))
+            continue
+        if stat.S_ISDIR(st.st_mode):
+            result.n_dirs += 1
+        else:
+            result.add_file(path, st.st_size, st.st_mtime)
+
+
+def validate_paths(paths, max_workers=DEFAULT_SCAN_WORKERS):
+    """Validate the paths in a filelist before it is submitted, checking, in
+       parallel, that each path is absolute, exists, can be read and is not a
+       broken symbolic link or a symbolic link loop, and that no path is in
+       the filelist more than once.  Directories in the filelist are checked,
+       but not scanned.
+
+       :param list[`string`] paths: (`required`) the paths in the filelist.  Any iterable can be used, e.g. a :class:`jdma_common.Filelist`, and it is only iterated over once.
+       :param integer max_workers: (`optional`) number of threads to check the paths with.
+
+       :return: The files found, their total size and the invalid paths, in **errors**.
+
+       :rtype: ScanResult
+    """
+    result = ScanResult()
+    seen = set()
+
+    def unique_paths():
+        for path in paths:
+            if path in seen:
+                result.errors.append((path, "Duplicate path"))
+            else:
+                seen.add(path)
+                yield path
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # the paths are read, and checked, a chunk at a time, with a bounded
+        # number of chunks in flight, so that a filelist read from disk is
+        # never held in memory
+        pending = deque()
+        for chunk in _chunks(unique_paths(), VALIDATE_CHUNK_SIZE):
+            pending.append(executor.submit(_validate_chunk, chunk))
+            if len(pending) > 2 * max_workers:
+                _add_checked(result, pending.popleft().result())
+        while pending:
+            _add_checked(result, pending.popleft().result())
+    return result
@@ -0,0 +1,101 @@
+"""
+Selection of a subset of the files in a batch, to retrieve with a GET, by
+matching the paths in the listing of the batch against include and exclude
+patterns.
+
+The patterns are glob patterns, as for :func:`jdma_cache.find_files`, or
+regular expressions.  All of the include patterns are compiled into a single
+regular expression, as are all of the exclude patterns, so that each path in
+the listing is matched once for each, however many patterns there are.  The
+listing is streamed from the JDMA server (or the local cache) and matched as
+it is parsed.
+
+"""
+
+import re
+import fnmatch
+
+from jdma_client.jdma_lib import iter_files
+
+
+class Selection(object):
+    """The files selected from a batch.
+
+       - **paths** (`List`): the paths of the files selected
+       - **n_files** (`integer`): the number of files in the batch
+       - **total_size** (`integer`): the total size of the files selected, in bytes
+       - **archives** (`Set`): the ids of the archives that contain the files selected
+    """
+    def __init__(self):
+        self.paths = []
+        self.n_files = 0
+        self.total_size = 0
+        self.archives = set()
+
+
+def compile_patterns(patterns, regex=False):
+    """Compile a list of patterns into a single function that matches a path
+       against any of them.
+
+       :param list[`string`] patterns: (`required`) the glob patterns or, if **regex** is `True`, regular expressions.  A glob pattern that is not an absolute path, e.g. ``*.nc`` or ``tmp/*``, matches the end of the paths.
+       :param bool regex: (`optional`) the patterns are regular expressions, which are searched for in the paths.
+
+       :raises re.error: if a pattern is not a valid regular expression.
+
+       :return: A function of a path, which returns a match object if the path matches any of the patterns, or `None` if there are no patterns.
+    """
+    if not patterns:
+        return None
+    if regex:
+        return re.compile(
+            "|".join("(?:{})".format(p) for p in patterns)
+        ).search
+    translated = []
+    for p in patterns:
+        if not p.startswith("/") and not p.startswith("*"):
+            p = "*/" + p
+        translated.append(fnmatch.translate(p))
+    return re.compile("|".join(translated)).match
+
+
+def select_files(name, batch_id, include=None, exclude=None, regex=False):
+    """Select the files in a batch whose paths match any of the include
+       patterns, and none of the exclude patterns.  The filelist of the
+       selection can be passed to :func:`jdma_lib.download_files`.
+
+       :param string name: (`required`) name of the user.
+       :param integer batch_id: (`required`) the batch id to select the files from.
+       :param list[`string`] include: (`optional`) the patterns of the files to select.  If `none` then all the files are selected, except those matching **exclude**.
+       :param list[`string`] exclude: (`optional`) the patterns of the files not to select.
+       :param bool regex: (`optional`) the patterns are regular expressions, rather than glob patterns.  See :func:`compile_patterns`.
+
+       :raises JdmaResponseError: if the server returned an error.
+
+       :return: The files selected.
+       :rtype: Selection
+    """
+    records = iter_files(name=name, batch_id=batch_id)
+    return select_file_records(records, include, exclude, regex)
+
+
+def select_file_records(records, include=None, exclude=None, regex=False):
+    """Select the files in the (**batch**, **archive**, **file**) records of a
+       listing, from :func:`jdma_lib.iter_files` or
+       :func:`jdma_cache.cached_iter_files`.  See :func:`select_files`.
+
+       :rtype: Selection
+    """
+    include = compile_patterns(include, regex)
+    exclude = compile_patterns(exclude, regex)
+    selection = Selection()
+    for m, a, f in records:
+        selection.n_files += 1
+        path = f["path"]
+        if include is not None and not include(path):
+            continue
+        if exclude is not None and exclude(path):
+            continue
+        selection.paths.append(path)
+        selection.total_size += f.get("size") or 0
+        selection.archives.add(a.get("archive_id"))
+    return selection
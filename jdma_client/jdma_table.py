@@ -0,0 +1,88 @@
+"""
+Buffered rendering of the tables (listings) output by the jdma command line
+tool.
+
+Rows are formatted with formats that are built once per table, collected in a
+buffer and written to the output in chunks, rather than with several writes
+per row.  Colour (ANSI escape codes) is only output when the output is a
+terminal, so that listings piped to ``less``, ``grep`` or a file are plain
+text.
+
+"""
+
+import sys
+
+from jdma_client.jdma_common import bcolors
+
+# number of rows to collect before writing them to the output
+ROWS_PER_WRITE = 4096
+
+##### Colours - the bcolors, or empty strings if colour is off             #####
+
+class NoColours:
+    MAGENTA = ''
+    BLUE = ''
+    GREEN = ''
+    YELLOW = ''
+    RED = ''
+    BOLD = ''
+    UNDERLINE = ''
+    INVERT = ''
+    ENDC = ''
+
+
+def use_colour(out=None):
+    """Should colour be output?  Only if the output is a terminal."""
+    if out is None:
+        out = sys.stdout
+    try:
+        return out.isatty()
+    except (AttributeError, ValueError):
+        return False
+
+##### Table writer                                                         #####
+
+class TableWriter(object):
+    """Collects the rows of a table and writes them to the output in chunks.
+
+       The colours to use are available as the **colours** attribute, which is
+       either :class:`jdma_common.bcolors` or :class:`NoColours`.
+
+       :param file out: (`optional`) the file to write to.  If `none` then ``sys.stdout`` is used.
+       :param bool colour: (`optional`) output colour.  If `none` then colour is only output if **out** is a terminal.
+       :param integer rows_per_write: (`optional`) the number of rows to collect before writing them to **out**.
+    """
+    def __init__(self, out=None, colour=None, rows_per_write=ROWS_PER_WRITE):
+        if out is None:
+            out = sys.stdout
+        if colour is None:
+            colour = use_colour(out)
+        self.out = out
+        if colour:
+            self.colours = bcolors
+        else:
+            self.colours = NoColours
+        self.rows_per_write = rows_per_write
+        self.rows = []
+
+    def write(self, row):
+        """Add a (formatted) row, or part of a row, to the buffer"""
+        self.rows.append(row)
+        if len(self.rows) >= self.rows_per_write:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows to the output"""
+        if self.rows:
+            self.out.write("".join(self.rows))
+            self.rows = []
+        self.out.flush()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,267 @@
+"""
+Client-side verification of the files retrieved from the JDMA, against the
+digests (checksums) of the files recorded by the JDMA when they were uploaded.
+
+The files are hashed in parallel, in a pool of processes, so that the
+throughput scales with the number of cores and the bandwidth of the file
+system.  Each process reads its files in chunks, into a reused buffer, and
+memory maps the files larger than **MMAP_THRESHOLD**, so that they are hashed
+straight from the page cache.  The files are sent to the processes in chunks
+of **VERIFY_CHUNK_FILES**, so that the cost of sending the work to, and the
+results from, the processes is small compared to hashing even small files.
+
+"""
+
+import os
+import mmap
+import zlib
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from jdma_client.jdma_lib import iter_files
+
+# size of the chunks that files are read, and hashed, in
+HASH_CHUNK_SIZE = 1024*1024
+# files larger than this are memory mapped, rather than read
+MMAP_THRESHOLD = 64*1024*1024
+# number of files sent to a process to verify in one go
+VERIFY_CHUNK_FILES = 64
+
+# the status of a verified file
+VERIFIED = "VERIFIED"
+MISSING = "MISSING"
+CORRUPT = "CORRUPT"
+UNREADABLE = "UNREADABLE"
+UNCHECKED = "UNCHECKED"
+
+
+class VerifyResult(object):
+    """The result of verifying the files retrieved from a batch.
+
+       - **n_files** (`integer`): the number of files checked
+       - **n_verified** (`integer`): the number of files whose digest matches
+       - **total_size** (`integer`): the total size of the files hashed, in bytes
+       - **missing** (`List`): a list of the (restored) paths of the files that do not exist
+       - **corrupt** (`List`): a list of (**path**, **reason**) tuples, one for each file whose size or digest does not match
+       - **errors** (`List`): a list of (**path**, **error**) tuples, one for each file that could not be read
+       - **unchecked** (`List`): a list of (**path**, **reason**) tuples, one for each file without a digest, or with a digest format that is not supported
+    """
+    def __init__(self):
+        self.n_files = 0
+        self.n_verified = 0
+        self.total_size = 0
+        self.missing = []
+        self.corrupt = []
+        self.errors = []
+        self.unchecked = []
+
+    @property
+    def ok(self):
+        """Were the files verified?  None of the files can be missing, corrupt
+           or unreadable, and at least one file must have been verified, so
+           that a batch without digests, whose files are all unchecked, is
+           not reported as verified."""
+        return (len(self.missing) == 0 and len(self.corrupt) == 0 and
+                len(self.errors) == 0 and self.n_verified > 0)
+
+    def add(self, path, status, detail, size):
+        self.n_files += 1
+        self.total_size += size
+        if status == VERIFIED:
+            self.n_verified += 1
+        elif status == MISSING:
+            self.missing.append(path)
+        elif status == CORRUPT:
+            self.corrupt.append((path, detail))
+        elif status == UNREADABLE:
+            self.errors.append((path, detail))
+        else:
+            self.unchecked.append((path, detail))
+
+##### Hashing                                                              #####
+
+class _Adler32(object):
+    """hashlib-like interface to zlib.adler32"""
+    def __init__(self):
+        self.value = 1
+
+    def update(self, data):
+        self.value = zlib.adler32(data, self.value)
+
+    def hexdigest(self):
+        return "{:08x}".format(self.value)
+
+
+def _new_hash(digest_format):
+    """Create a hash object for a digest format, e.g. SHA256 or SHA-256.
+       Returns `None` if the format is not supported."""
+    algorithm = digest_format.lower().replace("-", "").replace("_", "")
+    if algorithm == "adler32":
+        return _Adler32()
+    try:
+        return hashlib.new(algorithm)
+    except ValueError:
+        return None
+
+
+def file_digest(path, digest_format="SHA256"):
+    """Calculate the digest of a file, as a hexadecimal string.  Files larger
+       than **MMAP_THRESHOLD** are memory mapped, smaller files are read in
+       chunks of **HASH_CHUNK_SIZE**.
+
+       :param string path: (`required`) path of the file.
+       :param string digest_format: (`optional`) the algorithm of the digest, as reported by :func:`jdma_lib.get_files`, e.g. SHA256.
+
+       :raises ValueError: if the digest format is not supported.
+       :raises OSError: if the file cannot be read.
+
+       :return: The digest of the file.
+       :rtype: string
+    """
+    h = _new_hash(digest_format)
+    if h is None:
+        raise ValueError("Unsupported digest format " + digest_format)
+    with open(path, "rb") as fh:
+        size = os.fstat(fh.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mm, "madvise"):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                view = memoryview(mm)
+                try:
+                    for offset in range(0, size, HASH_CHUNK_SIZE):
+                        h.update(view[offset:offset+HASH_CHUNK_SIZE])
+                finally:
+                    view.release()
+        else:
+            buffer = bytearray(HASH_CHUNK_SIZE)
+            view = memoryview(buffer)
+            n = fh.readinto(buffer)
+            while n:
+                h.update(view[:n])
+                n = fh.readinto(buffer)
+    return h.hexdigest()
+
+
+def _verify_file(local_path, size, digest, digest_format):
+    """Verify a single file.  Returns the status, the reason for the status
+       and the number of bytes hashed"""
+    try:
+        st = os.stat(local_path)
+    except FileNotFoundError:
+        return MISSING, "", 0
+    except OSError as e:
+        return UNREADABLE, e.strerror, 0
+    if size is not None and st.st_size != size:
+        return CORRUPT, "size {} != {}".format(st.st_size, size), 0
+    if not digest or not digest_format:
+        return UNCHECKED, "no digest", 0
+    try:
+        local_digest = file_digest(local_path, digest_format)
+    except ValueError:
+        return UNCHECKED, "unsupported digest format " + digest_format, 0
+    except OSError as e:
+        return UNREADABLE, e.strerror, 0
+    if local_digest.lower() != digest.lower():
+        return CORRUPT, "{} digest mismatch".format(digest_format), st.st_size
+    return VERIFIED, "", st.st_size
+
+
+def _verify_chunk(files):
+    """Verify a chunk of files, in a worker process"""
+    return [
+        (local_path,) + _verify_file(local_path, size, digest, digest_format)
+        for local_path, size, digest, digest_format in files
+    ]
+
+##### Library functions                                                    #####
+
+def restored_path(path, target_dir=None, common_path=None):
+    """Get the path that a file in a batch is restored to.  If no target
+       directory was given to the GET then the file is restored to its original
+       path.  Otherwise it is restored to the target directory, relative to
+       the common path of the files in the batch.
+
+       :return: The restored path of the file.
+       :rtype: string
+    """
+    if not target_dir:
+        return path
+    if common_path:
+        path = os.path.relpath(path, common_path)
+    return os.path.join(target_dir, path.lstrip(os.sep))
+
+
+def verify_files(name, batch_id, target_dir=None, max_workers=None):
+    """Verify the files retrieved from a batch against the digests of the
+       files recorded by the JDMA, by hashing them in parallel.
+
+       :param string name: (`required`) name of the user.
+       :param integer batch_id: (`required`) the batch id the files were retrieved from.
+       :param string target_dir: (`optional`) the target directory the files were retrieved to.  If `none` then the files are checked at their original paths.
+       :param integer max_workers: (`optional`) number of processes to hash the files with.  If `none` then the number of CPUs is used.
+
+       :raises JdmaResponseError: if the server returned an error.
+
+       :return: The numbers of files verified, missing, corrupt, etc.
+       :rtype: VerifyResult
+    """
+    records = iter_files(name=name, batch_id=batch_id, digest=1)
+    return verify_file_records(records, target_dir, max_workers)
+
+
+def verify_file_records(records, target_dir=None, max_workers=None):
+    """Verify the files in the (**batch**, **archive**, **file**) records of a
+       listing, from :func:`jdma_lib.iter_files` or
+       :func:`jdma_cache.cached_iter_files` with `digest=1`.  See
+       :func:`verify_files`.
+
+       :rtype: VerifyResult
+    """
+    files = [
+        (f["path"], f.get("size"), f.get("digest"), f.get("digest_format"))
+        for m, a, f in records
+    ]
+    common_path = None
+    if target_dir and files:
+        common_path = os.path.commonpath(
+            [os.path.dirname(f[0]) for f in files]
+        )
+    files = [
+        (restored_path(f[0], target_dir, common_path),) + f[1:]
+        for f in files
+    ]
+    return verify_paths(files, max_workers)
+
+
+def verify_paths(files, max_workers=None):
+    """Verify a list of local files against their expected sizes and
+       digests, by hashing them in parallel.
+
+       :param list[`tuple`] files: (`required`) list of (**path**, **size**, **digest**, **digest_format**) tuples.
+       :param integer max_workers: (`optional`) number of processes to hash the files with.  If `none` then the number of CPUs is used.
+
+       :rtype: VerifyResult
+    """
+    result = VerifyResult()
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    chunks = (
+        files[i:i+VERIFY_CHUNK_FILES]
+        for i in range(0, len(files), VERIFY_CHUNK_FILES)
+    )
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # keep two chunks per process in flight, so that the processes are
+        # always busy without all of the files being queued at once
+        pending = set()
+        for chunk in chunks:
+            pending.add(executor.submit(_verify_chunk, chunk))
+            if len(pending) >= 2 * max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for r in future.result():
+                        result.add(*r)
+        for future in pending:
+            for r in future.result():
+                result.add(*r)
+    return result
@@ -19,6 +19,12 @@ setup(
                       'pyasn1',
                       'ldap3'
     ],
+    extras_require={
+        'aio': ['aiohttp'],
+        'stream': ['ijson'],
+        'zstd': ['zstandard'],
+        'export': ['pyarrow'],
+    },
     include_package_data=True,
     license='BSD License',  # example license
     description='A command line client to access the joint-storage data migration app on JASMIN.',
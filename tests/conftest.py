@@ -0,0 +1,240 @@
+"""
+Fixtures for the tests: a local stub of the JDMA HTTP API, which can be made
+to fail in the ways a real server, or the network, fails, and clients that
+talk to it.
+"""
+
+import os
+import gzip
+import json
+import socket
+import datetime
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# jdma_common reads the user name from the environment when it is imported
+os.environ.setdefault("USER", "test")
+
+from jdma_client.jdma_lib import JdmaClient
+from jdma_client.jdma_journal import RequestJournal
+from jdma_client.jdma_common import REQUEST_TYPES
+
+
+class Reply(object):
+    """The reply of the stub server to a request.  If **truncate** is set
+       then only that many bytes of the body are sent before the connection
+       is closed, and if **reset** is set the connection is closed without
+       sending a response."""
+    def __init__(self, status=200, body=None, truncate=None, reset=False,
+                 headers=None):
+        if body is None:
+            body = {}
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode("utf-8")
+        self.status = status
+        self.body = body
+        self.truncate = truncate
+        self.reset = reset
+        self.headers = headers or {}
+
+
+class StubRequest(object):
+    """A request received by the stub server"""
+    def __init__(self, method, path, headers, body):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        body = self.body
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        return json.loads(body.decode("utf-8"))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def _handle(self):
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            body = self._read_chunked()
+        else:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        request = StubRequest(self.command, self.path, self.headers, body)
+        stub = self.server.stub
+        with stub.lock:
+            stub.requests.append(request)
+        reply = stub.respond(request)
+        if reply.reset:
+            self.connection.shutdown(socket.SHUT_RDWR)
+            self.close_connection = True
+            return
+        self.send_response(reply.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(reply.body)))
+        for k, v in reply.headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        if reply.truncate is None:
+            self.wfile.write(reply.body)
+        else:
+            self.wfile.write(reply.body[:reply.truncate])
+            self.wfile.flush()
+            self.connection.shutdown(socket.SHUT_RDWR)
+            self.close_connection = True
+
+    def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().split(b";")[0], 16)
+            if size == 0:
+                self.rfile.readline()
+                return b"".join(chunks)
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+
+    do_GET = _handle
+    do_PUT = _handle
+    do_POST = _handle
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(object):
+    """A stub of the JDMA HTTP API.  Each request is passed to **respond**,
+       which returns a Reply, and recorded in **requests**."""
+    def __init__(self):
+        self.requests = []
+        self.lock = threading.Lock()
+        self.respond = lambda request: Reply(404, {"error" : "not found"})
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}/api/v1/".format(self.server.server_port)
+
+    def requests_to(self, endpoint, method=None):
+        """The requests received for an endpoint, e.g. "request" """
+        return [
+            r for r in self.requests
+            if r.path.split("?")[0].endswith("/" + endpoint) and
+            (method is None or r.method == method)
+        ]
+
+
+def listing(n_files, files_per_archive=10, batch_id=1):
+    """The body of a files listing of a batch with n_files files"""
+    archives = []
+    for i in range(0, n_files, files_per_archive):
+        archives.append({
+            "archive_id" : "{}/archive_{:04d}".format(batch_id, i),
+            "size" : 0,
+            "files" : [
+                {"path" : "/data/file_{:06d}.nc".format(j), "size" : j}
+                for j in range(i, min(i + files_per_archive, n_files))
+            ]
+        })
+    return {"migrations" : [{
+        "migration_id" : batch_id, "user" : "test", "workspace" : "ws",
+        "label" : "batch", "stage" : 2, "archives" : archives
+    }]}
+
+
+class FakeJdma(object):
+    """A stateful fake of the JDMA server's request and migration endpoints,
+       for use as the **respond** of the StubServer.  The POSTs for which
+       **fail(body)** returns a Reply are not created, and those for which
+       **drop_after_create(body)** is True are created before the connection
+       is dropped.  Like the real server, the idempotency keys are ignored."""
+    def __init__(self, storage="elastictape"):
+        self.storage = storage
+        self.created = {}
+        self.posts = []
+        self.fail = lambda body: None
+        self.drop_after_create = lambda body: False
+
+    def __call__(self, request):
+        url = urlparse(request.path)
+        query = dict((k, v[0]) for k, v in parse_qs(url.query).items())
+        endpoint = url.path.rstrip("/").split("/")[-1]
+        if endpoint == "migration":
+            batch_id = int(query["migration_id"])
+            return Reply(200, {
+                "migration_id" : batch_id, "user" : "test",
+                "workspace" : "ws", "label" : "batch{}".format(batch_id),
+                "storage" : self.storage, "stage" : 2,
+                "registered_date" : "2020-01-01T00:00:00"
+            })
+        if endpoint == "request" and request.method == "GET":
+            if "request_id" in query:
+                req_id = int(query["request_id"])
+                if req_id not in self.created:
+                    return Reply(404, {"error" : "no request"})
+                return Reply(200, self.created[req_id])
+            return Reply(200, {"requests" : list(self.created.values())})
+        if endpoint == "request" and request.method == "POST":
+            body = request.json()
+            self.posts.append(body)
+            reply = self.fail(body)
+            if reply is not None:
+                return reply
+            data = self._create(body)
+            if self.drop_after_create(body):
+                return Reply(reset=True)
+            return Reply(200, data)
+        return Reply(404, {"error" : "not found"})
+
+    def _create(self, body):
+        req_id = len(self.created) + 1
+        batch_id = body.get("migration_id") or 100 + req_id
+        data = {
+            "request_id" : req_id, "user" : "test",
+            "request_type" : REQUEST_TYPES.index(body["request_type"]),
+            "migration_id" : batch_id, "batch_id" : batch_id,
+            "workspace" : body.get("workspace") or "ws",
+            "label" : body.get("label") or "batch{}".format(batch_id),
+            "storage" : body.get("storage") or self.storage,
+            "date" : datetime.datetime.utcnow().isoformat(), "stage" : 0
+        }
+        self.created[req_id] = data
+        return data
+
+
+@pytest.fixture
+def fake(stub):
+    fake = FakeJdma()
+    stub.respond = fake
+    return fake
+
+
+@pytest.fixture
+def stub():
+    server = StubServer()
+    server.thread.start()
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = RequestJournal(str(tmp_path / "journal.db"))
+    yield journal
+    journal.close()
+
+
+@pytest.fixture
+def client(stub, journal):
+    client = JdmaClient(
+        api_url=stub.url, user="test", retries=2, backoff_factor=0,
+        journal=journal
+    )
+    yield client
+    client.close()
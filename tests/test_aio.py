@@ -0,0 +1,52 @@
+"""Tests of the asyncio client"""
+
+import asyncio
+import threading
+
+import pytest
+
+from jdma_client.aio import AsyncJdmaClient
+
+from conftest import Reply
+
+
+def test_sync_with_is_refused(stub):
+    client = AsyncJdmaClient(api_url=stub.url, user="test")
+    with pytest.raises(TypeError, match="async with"):
+        with client:
+            pass
+
+
+def test_blocking_io_is_not_run_in_the_event_loop(stub, fake, journal,
+                                                  tmp_path):
+    # record the threads that the journal and the circuit breaker are used in
+    threads = set()
+    def in_thread(function):
+        def wrapper(*args, **kwargs):
+            threads.add(threading.current_thread())
+            return function(*args, **kwargs)
+        return wrapper
+    for method in ("add", "complete", "remove", "get", "entries"):
+        setattr(journal, method, in_thread(getattr(journal, method)))
+    async def upload():
+        async with AsyncJdmaClient(
+            api_url=stub.url, user="test", journal=journal,
+            circuit_breaker_path=str(tmp_path / "breaker.json")
+        ) as client:
+            for method in ("_read_states", "_save"):
+                setattr(client.circuit_breaker, method, in_thread(
+                    getattr(client.circuit_breaker, method)
+                ))
+            response = await client.upload_files(
+                "test", workspace="ws", filelist=["/data/a"],
+                request_type="PUT", storage="elastictape",
+                idempotency_key="key"
+            )
+            assert response.status_code == 200
+            data = await client.submitted_request("test", "key")
+            assert data["already_submitted"]
+            return threading.current_thread()
+    loop_thread = asyncio.run(upload())
+    assert len(threads) > 0
+    assert loop_thread not in threads
+    assert journal.get("key").request_id == 1
@@ -0,0 +1,267 @@
+"""Tests of the local cache of the listings of batches"""
+
+import sqlite3
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+from jdma_client import jdma_cache
+from jdma_client.jdma_cache import ListingCache, sync_index, find_files
+
+from conftest import Reply, listing
+
+
+def file_records(n_files, batch_id=1):
+    """The (batch, archive, file) records of a listing, as iter_files yields
+       them"""
+    migration = listing(n_files, batch_id=batch_id)["migrations"][0]
+    archives = migration.pop("archives")
+    for a in archives:
+        for f in a.pop("files"):
+            yield migration, a, f
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ListingCache(str(tmp_path / "cache.sqlite"))
+    yield cache
+    cache.close()
+
+
+def put(cache, records, batch_id=1, date="2020-01-01"):
+    return list(cache.put("test", batch_id, "files", 0, 2, date, records))
+
+
+def test_put_and_get(cache):
+    records = put(cache, file_records(25))
+    assert len(records) == 25
+    cached = list(cache.get("test", 1, "files", 0, 2, "2020-01-01"))
+    assert cached == records
+    # the records of the same archive share the same Dictionaries
+    assert cached[0][1] is cached[9][1]
+    assert cached[0][1] is not cached[10][1]
+    assert cache.batch_ids("test") == {1}
+    assert [f["path"] for m, a, f in cache.find("test", "*_00002?.nc")] == [
+        "/data/file_{:06d}.nc".format(i) for i in range(20, 25)
+    ]
+
+
+def test_changed_batch_is_invalidated(cache):
+    put(cache, file_records(5))
+    assert cache.get("test", 1, "files", 0, 2, "2020-01-02") is None
+    assert cache.batch_ids("test") == set()
+
+
+def test_put_replaces_listing(cache):
+    put(cache, file_records(5))
+    put(cache, file_records(3))
+    assert len(list(cache.get("test", 1, "files", 0, 2, "2020-01-01"))) == 3
+
+
+def test_failed_put_is_discarded(cache):
+    def failing(n_files):
+        for i, record in enumerate(file_records(n_files)):
+            if i == 15:
+                raise ValueError("stream cut")
+            yield record
+    put(cache, file_records(5))
+    with pytest.raises(ValueError):
+        put(cache, failing(20), batch_id=2)
+    assert cache.batch_ids("test") == {1}
+    assert cache.conn.execute(
+        "SELECT COUNT(*) FROM files WHERE batch_id=2"
+    ).fetchone() == (0,)
+    # the temporary tables are dropped
+    assert cache.conn.execute(
+        "SELECT COUNT(*) FROM temp.sqlite_master"
+    ).fetchone() == (0,)
+
+
+def test_cache_is_not_locked_while_streaming(cache, monkeypatch):
+    monkeypatch.setattr("jdma_client.jdma_cache.WRITE_CHUNK_SIZE", 10)
+    streaming = cache.put("test", 1, "files", 0, 2, "2020-01-01",
+                          file_records(100))
+    for i in range(50):
+        next(streaming)
+    # another process can read and write the cache, without waiting
+    other = ListingCache(cache.path)
+    other.conn = sqlite3.connect(cache.path, timeout=0)
+    put(other, file_records(5, batch_id=2), batch_id=2)
+    assert other.batch_ids("test") == {2}
+    # the listing is only stored once it has been iterated over
+    assert cache.get("test", 1, "files", 0, 2, "2020-01-01") is None
+    assert len(list(streaming)) == 50
+    assert other.batch_ids("test") == {1, 2}
+    assert len(list(other.get("test", 1, "files", 0, 2, "2020-01-01"))) == 100
+    other.close()
+
+
+def find(cache, pattern, **kwargs):
+    return [f["path"] for m, a, f in find_files(
+        "test", pattern, cache=cache, **kwargs
+    )]
+
+
+def test_find_suffix(cache):
+    put(cache, file_records(200))
+    put(cache, file_records(20, batch_id=2), batch_id=2)
+    found = list(find_files("test", "file_000012.nc", cache=cache))
+    assert sorted(m["migration_id"] for m, a, f in found) == [1, 2]
+    assert [f["path"] for m, a, f in found] == ["/data/file_000012.nc"] * 2
+    assert sorted(find(cache, "*1?9.nc")) == [
+        "/data/file_{:06d}.nc".format(i) for i in range(109, 200, 10)
+    ]
+    assert find(cache, "[0-9]*.nc") == []
+    assert len(find(cache, "/data/file_00001*")) == 20
+    assert len(find(cache, "*", limit=15)) == 15
+    assert len(find(cache, "file_0000[0-1]?.nc", limit=25)) == 25
+    assert find(cache, r"file_00019[89]\.nc$", regex=True) == [
+        "/data/file_000198.nc", "/data/file_000199.nc"
+    ]
+
+
+def test_find_uses_indexes(cache):
+    put(cache, file_records(20))
+    plans = []
+    execute = cache.conn.execute
+
+    class Connection(object):
+        def __getattr__(self, name):
+            return getattr(cache.conn_, name)
+
+        def execute(self, query, values=()):
+            if query.startswith("SELECT files.batch_id"):
+                plans.append(" ".join(row[-1] for row in execute(
+                    "EXPLAIN QUERY PLAN " + query, values
+                )))
+            return execute(query, values)
+
+    cache.conn_, cache.conn = cache.conn, Connection()
+    try:
+        find(cache, "tas.nc")
+        find(cache, "/data/run1/*")
+    finally:
+        cache.conn = cache.conn_
+    assert "USING INDEX files_rpath" in plans[0]
+    assert "USING INDEX files_path" in plans[1]
+
+
+def test_find_digest_listing(cache):
+    put(cache, file_records(5))
+    list(cache.put("test", 1, "files", 1, 2, "2020-01-01", file_records(5)))
+    list(cache.put("test", 2, "files", 1, 2, "2020-01-01",
+                   file_records(5, batch_id=2)))
+    # a file cached with and without its digest is only found once
+    found = list(find_files("test", "file_000001.nc", cache=cache))
+    assert sorted(m["migration_id"] for m, a, f in found) == [1, 2]
+
+
+def test_old_cache_is_migrated(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ListingCache(path)
+    put(cache, file_records(30))
+    # the files table of a cache written before the paths were reversed
+    cache.conn.executescript("""
+        DROP INDEX files_rpath;
+        CREATE TABLE old_files AS SELECT user, batch_id, digest, seq,
+            archive_idx, path, file FROM files;
+        DROP TABLE files;
+        ALTER TABLE old_files RENAME TO files;
+    """)
+    cache.close()
+    with ListingCache(path) as cache:
+        assert find(cache, "file_00002?.nc") == [
+            "/data/file_{:06d}.nc".format(i) for i in range(20, 30)
+        ]
+        put(cache, file_records(5), batch_id=2)
+        assert len(find(cache, "file_000001.nc")) == 2
+
+
+##### Index of the files in all of the batches                             #####
+
+class IndexServer(object):
+    """Serve the list of batches, and the files listing of each batch"""
+    def __init__(self, stub):
+        self.batches = {}
+        self.n_files = {}
+        self.failing = set()
+        stub.respond = self
+
+    def __call__(self, request):
+        url = urlparse(request.path)
+        query = dict((k, v[0]) for k, v in parse_qs(url.query).items())
+        endpoint = url.path.rstrip("/").split("/")[-1]
+        if endpoint == "migration":
+            return Reply(200, {"migrations" : [
+                {"migration_id" : batch_id, "stage" : stage,
+                 "registered_date" : date}
+                for batch_id, (stage, date) in sorted(self.batches.items())
+            ]})
+        if endpoint == "file":
+            batch_id = int(query["migration_id"])
+            if batch_id in self.failing:
+                return Reply(403, {"error" : "forbidden"})
+            return Reply(200, listing(self.n_files[batch_id], batch_id=batch_id))
+        return Reply(404, {"error" : "not found"})
+
+    def add(self, batch_id, n_files, stage=2, date="2020-01-01"):
+        self.batches[batch_id] = (stage, date)
+        self.n_files[batch_id] = n_files
+
+
+def test_sync_index(stub, client, cache):
+    server = IndexServer(stub)
+    server.add(1, 25)
+    server.add(2, 5)
+    result = sync_index("test", cache=cache, client=client)
+    assert (result.n_batches, result.n_synced, result.n_files,
+            result.n_removed) == (2, 2, 30, 0)
+    assert len(find(cache, "file_000003.nc")) == 2
+    # only the batches that have changed are synced again
+    n_requests = len(stub.requests_to("file"))
+    server.add(1, 30, date="2020-01-02")
+    result = sync_index("test", cache=cache, client=client)
+    assert (result.n_synced, result.n_files) == (1, 30)
+    assert len(stub.requests_to("file")) == n_requests + 1
+    assert len(find(cache, "file_00002?.nc")) == 10
+    # the deleted batches are removed from the index
+    server.add(2, 5, stage=jdma_cache.DELETED_BATCH_STAGE)
+    result = sync_index("test", cache=cache, client=client)
+    assert (result.n_batches, result.n_synced, result.n_removed) == (1, 0, 1)
+    assert len(find(cache, "file_000003.nc")) == 1
+    server.batches.pop(1)
+    result = sync_index("test", cache=cache, client=client)
+    assert (result.n_batches, result.n_removed) == (0, 1)
+    assert find(cache, "*") == []
+
+
+def test_sync_index_errors(stub, client, cache):
+    server = IndexServer(stub)
+    server.add(1, 5)
+    server.add(2, 5)
+    server.failing.add(2)
+    result = sync_index("test", cache=cache, client=client)
+    assert (result.n_batches, result.n_synced) == (1, 1)
+    assert [(b, r.status_code) for b, r in result.errors] == [(2, 403)]
+    server.failing.clear()
+    result = sync_index("test", cache=cache, client=client)
+    assert (result.n_batches, result.n_synced, result.errors) == (2, 1, [])
+
+
+def test_default_cache_is_closed(stub, client, tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    closed = []
+    close = ListingCache.close
+
+    def record_close(cache):
+        closed.append(cache.path)
+        close(cache)
+
+    monkeypatch.setattr(ListingCache, "close", record_close)
+    server = IndexServer(stub)
+    server.add(1, 5)
+    sync_index("test", client=client)
+    assert closed == [jdma_cache.default_cache_path()]
+    found = find_files("test", "file_000001.nc")
+    assert len(list(found)) == 1
+    assert len(closed) == 2
@@ -0,0 +1,31 @@
+"""Tests of the (opt-in) compression of large request bodies"""
+
+from jdma_client.jdma_lib import JdmaClient, COMPRESS_THRESHOLD
+
+
+FILES = ["/data/file_{:08d}.nc".format(i)
+         for i in range(COMPRESS_THRESHOLD // 20)]
+
+
+def put(stub, **kwargs):
+    client = JdmaClient(api_url=stub.url, user="test", retries=0, **kwargs)
+    try:
+        client.upload_files("test", workspace="ws", filelist=FILES,
+                            request_type="PUT", storage="elastictape")
+    finally:
+        client.close()
+    return stub.requests_to("request", "POST")[-1]
+
+
+def test_not_compressed_by_default(stub, fake):
+    request = put(stub)
+    assert "Content-Encoding" not in request.headers
+    assert len(request.body) > COMPRESS_THRESHOLD
+    assert request.json()["filelist"] == FILES
+
+
+def test_gzip_compression(stub, fake):
+    request = put(stub, compression="gzip")
+    assert request.headers["Content-Encoding"] == "gzip"
+    assert len(request.body) < COMPRESS_THRESHOLD
+    assert request.json()["filelist"] == FILES
@@ -0,0 +1,107 @@
+"""Tests of the comparison of local files against a previous batch, for
+incremental uploads"""
+
+import hashlib
+
+from jdma_client.jdma_delta import FileIndex, compare_files
+from jdma_client.jdma_lib import parse_server_date
+
+SINCE = 1000000.0
+
+
+def record(path, size, digest=None, digest_format=None):
+    return ({"migration_id" : 1}, {"archive_id" : "1/archive"},
+            {"path" : path, "size" : size, "digest" : digest,
+             "digest_format" : digest_format})
+
+
+def test_file_index():
+    digest = hashlib.sha256(b"abc").hexdigest()
+    index = FileIndex([
+        record("/data/a", 3, digest, "SHA256"),
+        record("/data/b", 4, "not hex", "SHA256"),
+        record("/data/c", 5),
+    ])
+    assert len(index) == 3
+    assert index.get("/data/a") == (3, bytes.fromhex(digest), "SHA256")
+    assert index.get("/data/b") == (4, None, "SHA256")
+    assert index.get("/data/c") == (5, None, None)
+    assert index.get("/data/d") is None
+
+
+def test_compare_files():
+    index = FileIndex([
+        record("/data/same", 10),
+        record("/data/resized", 10),
+        record("/data/modified", 10),
+    ])
+    result = compare_files([
+        ("/data/new", 1, SINCE - 10),
+        ("/data/same", 10, SINCE - 10),
+        ("/data/resized", 11, SINCE - 10),
+        ("/data/modified", 10, SINCE + 10),
+    ], index, since=SINCE)
+    assert result.n_new == 1
+    assert result.n_changed == 2
+    assert result.n_unchanged == 1
+    assert result.paths == ["/data/new", "/data/resized", "/data/modified"]
+    assert result.total_size == 1 + 11 + 10
+
+
+def test_compare_files_without_since():
+    # without the time the batch was registered only the sizes are compared
+    index = FileIndex([record("/data/a", 10), record("/data/b", 10)])
+    result = compare_files([
+        ("/data/a", 10, SINCE + 10),
+        ("/data/b", 12, SINCE + 10),
+    ], index)
+    assert result.paths == ["/data/b"]
+    assert (result.n_new, result.n_changed, result.n_unchanged) == (0, 1, 1)
+
+
+def test_compare_files_hash(tmp_path):
+    files = []
+    records = []
+    for name, uploaded, now in (("same", b"abc", b"abc"),
+                                ("changed", b"abc", b"abd")):
+        path = str(tmp_path / name)
+        with open(path, "wb") as fh:
+            fh.write(now)
+        files.append((path, len(now), SINCE + 10))
+        records.append(record(path, len(uploaded),
+                              hashlib.sha256(uploaded).hexdigest(), "SHA256"))
+    # modified after the batch was registered, but without a digest
+    nodigest = str(tmp_path / "nodigest")
+    with open(nodigest, "wb") as fh:
+        fh.write(b"abc")
+    files.append((nodigest, 3, SINCE + 10))
+    records.append(record(nodigest, 3))
+    # in the batch and not modified since, so not hashed
+    files.append((str(tmp_path / "old"), 3, SINCE - 10))
+    records.append(record(str(tmp_path / "old"), 3, "00", "SHA256"))
+    # in the batch with a digest, but deleted after the scan
+    deleted = str(tmp_path / "deleted")
+    files.append((deleted, 3, SINCE + 10))
+    records.append(record(deleted, 3, hashlib.sha256(b"abc").hexdigest(),
+                          "SHA256"))
+
+    result = compare_files(files, FileIndex(records), since=SINCE,
+                           hash_files=True, max_workers=1)
+    assert sorted(result.paths) == sorted([
+        str(tmp_path / "changed"), nodigest, deleted
+    ])
+    assert result.n_changed == 3
+    assert result.n_unchanged == 2
+    assert result.n_new == 0
+
+
+def test_parse_server_date():
+    assert parse_server_date("1970-01-12T13:46:40Z") == (SINCE, SINCE)
+    assert parse_server_date("1970-01-12T14:46:40+01:00") == (SINCE, SINCE)
+    # without a timezone the date could be in UTC or the local time
+    earliest, latest = parse_server_date("1970-01-12T13:46:40")
+    assert earliest <= SINCE <= latest
+    assert latest - earliest <= 14 * 3600
+    assert parse_server_date("") is None
+    assert parse_server_date(None) is None
+    assert parse_server_date("yesterday") is None
@@ -0,0 +1,213 @@
+"""Tests of the reading and validation of filelists"""
+
+import argparse
+import gc
+import gzip
+import json
+import os
+import warnings
+
+import pytest
+
+from jdma_client import jdma, jdma_common, jdma_scan
+from jdma_client.jdma_common import Filelist, iter_filelist, read_filelist
+
+PATHS = ["/data/run1/tas.nc", "/data/run1/pr.nc", "/data/run2/tas.nc"]
+
+
+def write_filelist(tmp_path, paths, name="filelist.txt"):
+    filelist = tmp_path / name
+    filelist.write_text("\n".join(paths) + "\n")
+    return str(filelist)
+
+
+def write_bytes(tmp_path, data, name="filelist.txt"):
+    filelist = tmp_path / name
+    filelist.write_bytes(data)
+    return str(filelist)
+
+
+def test_newline_delimited(tmp_path):
+    filelist = write_bytes(tmp_path, "\n".join(PATHS).encode("utf-8"))
+    assert list(iter_filelist(filelist)) == PATHS
+
+
+def test_nul_delimited(tmp_path):
+    # e.g. the output of find -print0, where the paths may contain newlines
+    paths = PATHS + ["/data/run2/new\nline.nc"]
+    filelist = write_bytes(
+        tmp_path, b"\0".join(p.encode("utf-8") for p in paths) + b"\0"
+    )
+    assert list(iter_filelist(filelist)) == paths
+
+
+def test_explicit_delimiter(tmp_path):
+    filelist = write_bytes(tmp_path, ",".join(PATHS).encode("utf-8"))
+    assert list(iter_filelist(filelist, delimiter=",")) == PATHS
+
+
+@pytest.mark.parametrize("delimiter", [b"\n", b"\0"])
+def test_gzip(tmp_path, delimiter):
+    data = delimiter.join(p.encode("utf-8") for p in PATHS)
+    filelist = write_bytes(tmp_path, gzip.compress(data), "filelist.txt.gz")
+    assert list(iter_filelist(filelist)) == PATHS
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_files_are_closed(tmp_path, compress):
+    data = "\n".join(PATHS).encode("utf-8")
+    if compress:
+        data = gzip.compress(data)
+    filelist = write_bytes(tmp_path, data)
+    # a file that is not closed raises a ResourceWarning when it is deleted
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        assert list(iter_filelist(filelist)) == PATHS
+        gc.collect()
+    assert [w for w in caught if w.category is ResourceWarning] == []
+
+
+def test_normalised(tmp_path):
+    data = (
+        "/data/run1/./tas.nc\r\n"
+        "\n"
+        "   \n"
+        "/data//run1/pr.nc\r\n"
+        "/data/run2/../run2/tas.nc\n"
+        "/data/run1/tas.nc\n"
+    ).encode("utf-8")
+    filelist = write_bytes(tmp_path, data)
+    assert list(iter_filelist(filelist)) == PATHS
+    assert list(iter_filelist(filelist, unique=False)) == PATHS + [PATHS[0]]
+
+
+def test_undecodable_paths(tmp_path):
+    path = b"/data/caf\xe9.nc"
+    filelist = write_bytes(tmp_path, path + b"\n")
+    assert [os.fsencode(p) for p in iter_filelist(filelist)] == [path]
+
+
+@pytest.mark.parametrize("delimiter", [b"\n", b"\0"])
+def test_paths_split_across_blocks(tmp_path, monkeypatch, delimiter):
+    # the delimiter is found in the first block, but most of the paths are
+    # split across two blocks
+    monkeypatch.setattr(jdma_common, "FILELIST_BLOCK_SIZE", 24)
+    paths = [
+        "/data/{}/file_{}.nc".format("x" * (i % 7 + 1), i) for i in range(50)
+    ]
+    data = delimiter.join(p.encode("utf-8") for p in paths)
+    filelist = write_bytes(tmp_path, data)
+    assert list(iter_filelist(filelist)) == paths
+    filelist = write_bytes(tmp_path, gzip.compress(data), "filelist.txt.gz")
+    assert list(iter_filelist(filelist)) == paths
+
+
+def test_empty_filelist(tmp_path):
+    filelist = write_bytes(tmp_path, b"\n\n")
+    assert list(iter_filelist(filelist)) == []
+    with pytest.raises(Exception, match="has no files"):
+        read_filelist(filelist)
+
+
+def test_filelist_is_read_each_time(tmp_path):
+    filelist = write_bytes(tmp_path, "\n".join(PATHS).encode("utf-8"))
+    paths = Filelist(filelist)
+    assert list(paths) == PATHS
+    assert list(paths) == PATHS
+
+
+def test_validate_paths_is_streamed(tmp_path, monkeypatch):
+    monkeypatch.setattr(jdma_scan, "VALIDATE_CHUNK_SIZE", 2)
+    read = []
+
+    def paths():
+        for i in range(40):
+            read.append(i)
+            yield str(tmp_path / "missing_{}".format(i))
+
+    checked = []
+    validate_chunk = jdma_scan._validate_chunk
+
+    def record(chunk):
+        # the number of paths read from the filelist when a chunk is checked
+        checked.append(len(read))
+        return validate_chunk(chunk)
+
+    monkeypatch.setattr(jdma_scan, "_validate_chunk", record)
+    result = jdma_scan.validate_paths(paths(), max_workers=1)
+    assert len(result.errors) == 40
+    # the paths are checked as they are read, not once all of them are read
+    assert checked[0] < 40
+
+
+def test_read_filelist_duplicates(tmp_path):
+    a, b = str(tmp_path / "a"), str(tmp_path / "b")
+    filelist = write_filelist(tmp_path, [a, b, a])
+    assert read_filelist(filelist) == [a, b]
+    assert read_filelist(filelist, unique=False) == [a, b, a]
+    assert list(iter_filelist(filelist, unique=False)) == [a, b, a]
+
+
+def put_args(filelist, **kwargs):
+    args = dict(
+        arg=filelist, json=True, workspace="gws", label="", storage="",
+        dry_run=True, scan=False, send_filelist=False, since_batch="",
+        max_batch_size="", max_files_per_batch=""
+    )
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+def test_migrate_or_put_reports_duplicates(tmp_path, capsys):
+    data = tmp_path / "data"
+    data.mkdir()
+    (data / "a.nc").write_text("a")
+    (data / "b.nc").write_text("b")
+    a, b = str(data / "a.nc"), str(data / "b.nc")
+    # the second a.nc is a duplicate once the path is normalised
+    filelist = write_filelist(tmp_path, [a, b, str(data / "." / "a.nc")])
+    with pytest.raises(SystemExit) as e:
+        jdma.migrate_or_put(put_args(filelist), "PUT")
+    assert e.value.code == 1
+    output = json.loads(capsys.readouterr().out)
+    assert output["invalid"] == [{"path" : a, "error" : "Duplicate path"}]
+
+
+def test_migrate_or_put_valid_filelist(tmp_path, capsys):
+    data = tmp_path / "data"
+    data.mkdir()
+    (data / "a.nc").write_text("a")
+    (data / "b.nc").write_text("bb")
+    filelist = write_filelist(
+        tmp_path, [str(data / "a.nc"), "", str(data / "b.nc")]
+    )
+    jdma.migrate_or_put(put_args(filelist), "PUT")
+    output = json.loads(capsys.readouterr().out)
+    assert output["files"] == 2
+    assert output["size"] == 3
+    assert output["errors"] == []
+
+
+def test_migrate_or_put_streams_filelist(tmp_path, capsys, monkeypatch):
+    data = tmp_path / "data"
+    data.mkdir()
+    paths = [str(data / "{}.nc".format(i)) for i in range(3)]
+    for p in paths:
+        with open(p, "w") as fh:
+            fh.write("x")
+    filelist = write_bytes(
+        tmp_path, gzip.compress(b"\0".join(p.encode() for p in paths)),
+        "filelist.gz"
+    )
+    # the filelist is not read into a list
+    monkeypatch.setattr(jdma, "read_filelist", None)
+    jdma.migrate_or_put(put_args(filelist, scan=True), "PUT")
+    output = capsys.readouterr().out.splitlines()
+    assert json.loads(output[-1])["files"] == 3
+
+
+def test_migrate_or_put_empty_filelist(tmp_path, capsys):
+    filelist = write_bytes(tmp_path, b"\n")
+    with pytest.raises(SystemExit) as e:
+        jdma.migrate_or_put(put_args(filelist), "PUT")
+    assert e.value.code == 1
@@ -0,0 +1,111 @@
+"""Tests that repeating a split upload, or a download of several batches,
+   with the same idempotency key only submits the requests not yet created"""
+
+import asyncio
+
+from conftest import Reply
+from jdma_client.jdma_lib import part_idempotency_key
+
+
+FILES = [("/data/file_{:03d}.nc".format(i), 100) for i in range(30)]
+
+
+def upload(client, key):
+    return client.upload_files_split(
+        "test", workspace="ws", files=FILES, label="run", request_type="PUT",
+        storage="elastictape", max_files_per_batch=10, idempotency_key=key
+    )
+
+
+def test_split_upload_resubmits_failed_parts(client, fake):
+    # the second part is refused by the server, the third is created but the
+    # connection is dropped before the reply
+    fake.fail = lambda body: (
+        Reply(503, {"error" : "busy"}) if body["label"] == "run.part002"
+        else None
+    )
+    fake.drop_after_create = lambda body: body["label"] == "run.part003"
+    results = upload(client, "K")
+    assert len(fake.posts) == 3
+    assert "error" not in results[0]
+    assert results[1]["error"] == "busy"
+    assert results[1]["idempotency_key"] == "K.part002"
+    assert "error" in results[2]
+    # the successful part is not discarded because another one failed
+    assert results[0]["request_id"] in fake.created
+
+    fake.fail = lambda body: None
+    fake.drop_after_create = lambda body: False
+    results = upload(client, "K")
+    # only the refused part is submitted again, the dropped part is found
+    # on the server
+    assert [b["label"] for b in fake.posts[3:]] == ["run.part002"]
+    assert [r.get("already_submitted", False) for r in results] == [
+        True, False, True
+    ]
+    assert sorted(r["request_id"] for r in results) == [1, 2, 3]
+    assert len(fake.created) == 3
+
+
+def test_split_upload_first_part_failed(client, fake):
+    fake.fail = lambda body: (
+        Reply(503, {"error" : "busy"}) if body["label"] == "run.part001"
+        else None
+    )
+    upload(client, "K")
+    fake.fail = lambda body: None
+    upload(client, "K")
+    # the parts that succeeded are not submitted again
+    assert [b["label"] for b in fake.posts[3:]] == ["run.part001"]
+    assert len(fake.created) == 3
+
+
+def test_download_batches_resubmits_failed_batches(client, fake):
+    fake.drop_after_create = lambda body: False
+    fake.fail = lambda body: (
+        Reply(reset=True) if body["migration_id"] == 12 else None
+    )
+    results = client.download_batches(
+        "test", [11, 12, 13], credentials={"elastictape" : {}},
+        idempotency_key="G"
+    )
+    assert [r["migration_id"] for r in results] == [11, 12, 13]
+    assert "error" in results[1]
+    assert results[1]["idempotency_key"] == part_idempotency_key("G", 1)
+    assert len(fake.posts) == 3
+
+    fake.fail = lambda body: None
+    results = client.download_batches(
+        "test", [11, 12, 13], credentials={"elastictape" : {}},
+        idempotency_key="G"
+    )
+    assert [b["migration_id"] for b in fake.posts[3:]] == [12]
+    assert [r.get("already_submitted", False) for r in results] == [
+        True, False, True
+    ]
+    assert len(fake.created) == 3
+
+
+def test_without_key_always_submits(client, fake):
+    upload(client, None)
+    upload(client, None)
+    assert len(fake.created) == 6
+
+
+def test_async_split_upload_resubmits_failed_parts(stub, fake, journal):
+    from jdma_client.aio import AsyncJdmaClient
+    fake.fail = lambda body: (
+        Reply(503, {"error" : "busy"}) if body["label"] == "run.part002"
+        else None
+    )
+    async def run():
+        async with AsyncJdmaClient(
+            api_url=stub.url, user="test", retries=0, journal=journal
+        ) as client:
+            return await upload(client, "A")
+    results = asyncio.run(run())
+    assert "error" in results[1] and "error" not in results[0]
+    fake.fail = lambda body: None
+    results = asyncio.run(run())
+    assert [b["label"] for b in fake.posts[3:]] == ["run.part002"]
+    assert len(fake.created) == 3
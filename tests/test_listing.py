@@ -0,0 +1,148 @@
+"""Tests of the lazy, resumable iteration over listings (ListingIterator)"""
+
+import json
+import asyncio
+
+import pytest
+
+from jdma_client import jdma_lib
+from jdma_client.jdma_lib import JdmaResponseError
+from conftest import Reply, listing
+
+
+def files_route(body, truncate_at=None, fail_first=1):
+    """Serve a files listing, truncating the first fail_first responses just
+       before the file truncate_at"""
+    data = json.dumps(body).encode("utf-8")
+    if truncate_at is not None:
+        offset = data.index("file_{:06d}".format(truncate_at).encode("utf-8"))
+    calls = []
+    def respond(request):
+        calls.append(request)
+        if truncate_at is not None and len(calls) <= fail_first:
+            return Reply(200, data, truncate=offset)
+        return Reply(200, data)
+    return respond
+
+
+@pytest.fixture(params=["ijson", "json"])
+def parser(request, monkeypatch):
+    """Run the test with the streaming (ijson) and the in-memory parser"""
+    if request.param == "json":
+        monkeypatch.setattr(jdma_lib, "ijson", None)
+    return request.param
+
+
+def paths(records):
+    return [f["path"] for m, a, f in records]
+
+
+# large enough that records are parsed from the stream before it is cut off
+N_FILES = 20000
+
+
+def test_pages_resume_mid_page(stub, client, parser):
+    # the stream is cut off part way through the second page
+    stub.respond = files_route(listing(N_FILES), truncate_at=15000)
+    it = client.iter_files("test", batch_id=1, page_size=10000)
+    pages = list(it.pages())
+    found = [p for page in pages for p in paths(page)]
+    assert found == [m["path"] for m in _files(N_FILES)]
+    assert [len(page) for page in pages] == [10000, 10000]
+    assert it.resume_token == str(N_FILES)
+    assert len(stub.requests_to("file")) == 2
+
+
+def test_iter_resume_mid_stream(stub, client, parser):
+    stub.respond = files_route(listing(250), truncate_at=37, fail_first=2)
+    found = paths(client.iter_files("test", batch_id=1))
+    assert found == [m["path"] for m in _files(250)]
+    assert len(stub.requests_to("file")) == 3
+
+
+def test_truncated_stream_retries_exhausted(stub, client):
+    stub.respond = files_route(
+        listing(N_FILES), truncate_at=12000, fail_first=10
+    )
+    it = client.iter_files("test", batch_id=1, page_size=5000, retries=1)
+    found = []
+    with pytest.raises(jdma_lib.STREAM_ERRORS):
+        for page in it.pages():
+            found.extend(paths(page))
+    # the pages yielded before the failure are not repeated, and the resume
+    # token continues after them
+    assert len(found) == 10000
+    assert it.resume_token == "10000"
+    assert len(stub.requests_to("file")) == 2
+    stub.respond = files_route(listing(N_FILES))
+    rest = paths(client.iter_files(
+        "test", batch_id=1, resume_token=it.resume_token
+    ))
+    assert found + rest == [m["path"] for m in _files(N_FILES)]
+
+
+def test_request_errors_retried_once(stub, client):
+    # the session retries the 503s, the iterator does not retry them again
+    stub.respond = lambda request: Reply(503, {"error" : "unavailable"})
+    with pytest.raises(JdmaResponseError):
+        list(client.iter_files("test", batch_id=1))
+    assert len(stub.requests_to("file")) == client.retries + 1
+
+
+@pytest.fixture(params=["ijson", "json"])
+def aio_parser(request, monkeypatch):
+    """Run the test with the streamed (ijson) and the in-memory listings of
+       the AsyncJdmaClient"""
+    from jdma_client import aio
+    if request.param == "json":
+        monkeypatch.setattr(aio, "ijson", None)
+    return request.param
+
+
+def collect(stub, resume_token=None, retries=3, found=None):
+    """Collect the files from the async iter_files into found"""
+    from jdma_client.aio import AsyncJdmaClient
+    if found is None:
+        found = []
+    async def iterate():
+        async with AsyncJdmaClient(api_url=stub.url, user="test", retries=0,
+                                   backoff_factor=0) as client:
+            async for r in client.iter_files(
+                "test", batch_id=1, resume_token=resume_token,
+                retries=retries
+            ):
+                found.append(r)
+    asyncio.run(iterate())
+    return paths(found)
+
+
+def test_async_iter_files(stub, aio_parser):
+    stub.respond = files_route(listing(25))
+    assert collect(stub) == [m["path"] for m in _files(25)]
+    assert collect(stub, "20") == [m["path"] for m in _files(25)[20:]]
+
+
+def test_async_iter_resume_mid_stream(stub):
+    stub.respond = files_route(
+        listing(N_FILES), truncate_at=15000, fail_first=2
+    )
+    assert collect(stub) == [m["path"] for m in _files(N_FILES)]
+    assert len(stub.requests_to("file")) == 3
+
+
+def test_async_iter_is_streamed(stub):
+    from jdma_client import aio
+    stub.respond = files_route(
+        listing(N_FILES), truncate_at=12000, fail_first=10
+    )
+    found = []
+    with pytest.raises(aio.STREAM_ERRORS):
+        collect(stub, retries=1, found=found)
+    # the records before the cut off were yielded, once, before the error
+    assert paths(found) == [m["path"] for m in _files(12000)]
+    assert len(stub.requests_to("file")) == 2
+
+
+def _files(n):
+    return [f for a in listing(n)["migrations"][0]["archives"]
+            for f in a["files"]]
@@ -0,0 +1,150 @@
+"""Tests of the typed models parsed from the responses and listings"""
+
+import pytest
+
+from jdma_client import jdma_models
+from jdma_client.jdma_lib import JdmaResponseError
+from jdma_client.jdma_models import RequestType, RequestStage, BatchStage
+
+from conftest import Reply, listing
+
+
+class Response(object):
+    """The parts of a requests.Response that the models use"""
+    def __init__(self, data, status_code=200):
+        self.data = data
+        self.status_code = status_code
+
+    def json(self):
+        return self.data
+
+
+REQUEST = {
+    "request_id" : 7, "user" : "test", "request_type" : 2,
+    "migration_id" : 3, "workspace" : "ws", "label" : "run1",
+    "storage" : "elastictape", "date" : "2020-01-01T00:00:00", "stage" : 4
+}
+
+
+def test_requests():
+    request, = jdma_models.requests(Response(REQUEST))
+    assert request.request_id == 7
+    assert request.request_type is RequestType.MIGRATE
+    assert request.batch_id == 3
+    assert request.stage is RequestStage.PUTTING
+    assert not request.finished and not request.failed
+    assert repr(request) == "Request(7, MIGRATE, stage=PUTTING)"
+    data = {"requests" : [
+        dict(REQUEST, request_id=8, stage=9),
+        dict(REQUEST, request_id=9, stage=1000, failure_reason="no space"),
+        # an unknown stage is kept as None, rather than failing
+        dict(REQUEST, request_id=10, stage=12345),
+    ]}
+    completed, failed, unknown = jdma_models.requests(Response(data))
+    assert completed.finished and not completed.failed
+    assert failed.finished and failed.failed
+    assert failed.failure_reason == "no space"
+    assert unknown.stage is None and not unknown.finished
+
+
+def test_batches():
+    data = {"migrations" : [
+        {"migration_id" : 1, "label" : "run1", "stage" : 2},
+        {"migration_id" : 2, "label" : "run2", "stage" : 5,
+         "registered_date" : "2020-01-01T00:00:00"},
+    ]}
+    batches = list(jdma_models.batches(Response(data)))
+    assert [b.batch_id for b in batches] == [1, 2]
+    assert [b.stage for b in batches] == [
+        BatchStage.ON_STORAGE, BatchStage.DELETED
+    ]
+    assert batches[1].registered_date == "2020-01-01T00:00:00"
+    assert repr(batches[0]) == "Batch(1, 'run1', stage=ON_STORAGE)"
+    batch, = jdma_models.batches(Response(data["migrations"][0]))
+    assert batch.label == "run1"
+
+
+def test_storage():
+    response = Response({"et" : "elastictape", "os" : "objectstore"})
+    assert sorted(
+        (s.storage_id, s.name) for s in jdma_models.storage(response)
+    ) == [("et", "elastictape"), ("os", "objectstore")]
+
+
+@pytest.mark.parametrize("parse", [
+    jdma_models.requests, jdma_models.batches, jdma_models.storage
+])
+def test_error_response(parse):
+    response = Response({"error" : "not found"}, status_code=404)
+    # the response is only parsed when it is iterated over
+    parsed = parse(response)
+    with pytest.raises(JdmaResponseError) as e:
+        next(parsed)
+    assert e.value.response is response
+
+
+def file_records(n_files, batch_ids=(1,)):
+    """The (batch, archive, file) records of the listings of batches, which
+       share their Dictionaries, as iter_files yields them"""
+    for batch_id in batch_ids:
+        migration = listing(n_files, batch_id=batch_id)["migrations"][0]
+        archives = migration.pop("archives")
+        for a in archives:
+            for f in a.pop("files"):
+                yield migration, a, f
+
+
+def test_files_share_batches_and_archives():
+    files = list(jdma_models.files(file_records(25, batch_ids=(1, 2))))
+    assert len(files) == 50
+    assert files[3].path == "/data/file_000003.nc"
+    assert files[3].size == 3
+    # the files in the same archive share the same Archive, and the archives
+    # in the same batch share the same Batch
+    assert files[0].archive is files[9].archive
+    assert files[0].archive is not files[10].archive
+    assert len(set(id(f.archive) for f in files)) == 6
+    assert files[0].batch is files[24].batch
+    assert files[0].batch is not files[25].batch
+    assert [files[0].batch.batch_id, files[25].batch.batch_id] == [1, 2]
+    assert files[10].archive.archive_id == "1/archive_0010"
+    assert files[10].archive.batch is files[10].batch
+
+
+def test_files_are_parsed_lazily():
+    def records():
+        yield from file_records(5)
+        raise ValueError("stream cut")
+    files = jdma_models.files(records())
+    assert [f.path for i, f in zip(range(5), files)] == [
+        "/data/file_{:06d}.nc".format(i) for i in range(5)
+    ]
+    with pytest.raises(ValueError):
+        next(files)
+    assert jdma_models.File("/data/x.nc").batch is None
+
+
+def test_archives():
+    records = []
+    for batch_id in (1, 2):
+        migration = listing(25, batch_id=batch_id)["migrations"][0]
+        records.extend((migration, a) for a in migration["archives"])
+    archives = list(jdma_models.archives(records))
+    assert [a.archive_id for a in archives[:3]] == [
+        "1/archive_0000", "1/archive_0010", "1/archive_0020"
+    ]
+    assert archives[0].batch is archives[2].batch
+    assert archives[2].batch is not archives[3].batch
+    assert archives[3].batch.batch_id == 2
+
+
+def test_files_from_a_listing(stub, client):
+    stub.respond = lambda request: Reply(200, listing(30))
+    files = list(jdma_models.files(client.iter_files("test", batch_id=1)))
+    assert [f.path for f in files] == [
+        "/data/file_{:06d}.nc".format(i) for i in range(30)
+    ]
+    assert files[0].batch is files[29].batch
+    assert files[0].batch.stage is BatchStage.ON_STORAGE
+    assert files[0].batch.label == "batch"
+    assert files[29].archive.archive_id == "1/archive_0020"
@@ -0,0 +1,113 @@
+"""Tests of the partitioning of the files of an upload into several batches"""
+
+import math
+import random
+
+import pytest
+
+from jdma_client.jdma_lib import partition_filelist
+
+
+def make_files(sizes):
+    return [("/data/file_{:04d}.nc".format(i), size)
+            for i, size in enumerate(sizes)]
+
+
+def check_parts(parts, files, max_batch_size=None, max_files_per_batch=None):
+    """Every file is in exactly one part, and every part is within the
+       limits, unless it is a single file larger than max_batch_size"""
+    sizes = dict(files)
+    assert sorted(p for part in parts for p in part) == sorted(sizes)
+    for part in parts:
+        assert part == sorted(part)
+        assert len(part) > 0
+        if max_files_per_batch is not None:
+            assert len(part) <= max_files_per_batch
+        if max_batch_size is not None and len(part) > 1:
+            assert sum(sizes[p] for p in part) <= max_batch_size
+
+
+def test_no_limits():
+    files = make_files(range(20))
+    assert partition_filelist(files) == [sorted(f[0] for f in files)]
+    assert partition_filelist([]) == []
+    assert partition_filelist([], 100, 10) == []
+
+
+def test_max_batch_size():
+    rng = random.Random(1)
+    files = make_files(rng.randint(1, 100) for i in range(500))
+    total = sum(f[1] for f in files)
+    parts = partition_filelist(files, max_batch_size=1000)
+    check_parts(parts, files, max_batch_size=1000)
+    # the files are packed, largest first, and a new part is only started
+    # when no part has space for a file, so all of the parts but one are
+    # full to within the size of the largest file
+    assert len(parts) <= math.ceil(total / 1000) + 1
+    sizes = dict(files)
+    totals = [sum(sizes[p] for p in part) for part in parts]
+    assert len([t for t in totals if t <= 1000 - 100]) <= 1
+
+
+def test_file_larger_than_max_batch_size():
+    files = make_files([50, 5000, 30, 20, 1000, 40])
+    parts = partition_filelist(files, max_batch_size=100)
+    check_parts(parts, files, max_batch_size=100)
+    # each file larger than the limit is in a part on its own, and no other
+    # file is added to its part
+    assert ["/data/file_0001.nc"] in parts
+    assert ["/data/file_0004.nc"] in parts
+    assert len(parts) == 4
+
+
+def test_single_file_larger_than_max_batch_size():
+    files = make_files([5000])
+    assert partition_filelist(files, max_batch_size=100) == [
+        ["/data/file_0000.nc"]
+    ]
+
+
+@pytest.mark.parametrize("n_files, max_files", [
+    (30, 10), (31, 10), (9, 10), (10, 1)
+])
+def test_max_files_per_batch(n_files, max_files):
+    files = make_files([100] * n_files)
+    parts = partition_filelist(files, max_files_per_batch=max_files)
+    check_parts(parts, files, max_files_per_batch=max_files)
+    assert len(parts) == math.ceil(n_files / max_files)
+
+
+def test_both_limits():
+    # many small files are limited by the number of files, a few large files
+    # by their size
+    files = make_files([1] * 100 + [400] * 5 + [900, 2000])
+    parts = partition_filelist(
+        files, max_batch_size=1000, max_files_per_batch=20
+    )
+    check_parts(parts, files, max_batch_size=1000, max_files_per_batch=20)
+    assert ["/data/file_0106.nc"] in parts
+    rng = random.Random(2)
+    files = make_files(rng.randint(0, 300) for i in range(1000))
+    for max_size, max_files in [(1000, 5), (1000, 50), (10000, 5)]:
+        parts = partition_filelist(files, max_size, max_files)
+        check_parts(parts, files, max_size, max_files)
+
+
+def test_upload_files_split(client, fake):
+    files = make_files([600, 300, 200, 200, 100, 100, 50])
+    results = client.upload_files_split(
+        "test", workspace="ws", files=files, label="run", request_type="PUT",
+        storage="elastictape", max_batch_size=700, max_files_per_batch=3
+    )
+    parts = partition_filelist(files, 700, 3)
+    # each part is submitted as a batch, labelled with its part number
+    assert len(results) == len(parts) == len(fake.posts)
+    assert [r["label"] for r in results] == [
+        "run.part{:03d}".format(p + 1) for p in range(len(parts))
+    ]
+    posted = dict((b["label"], b["filelist"]) for b in fake.posts)
+    for p, part in enumerate(parts):
+        assert posted["run.part{:03d}".format(p + 1)] == part
+    assert sorted(r["request_id"] for r in results) == list(
+        range(1, len(parts) + 1)
+    )
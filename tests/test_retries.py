@@ -0,0 +1,124 @@
+"""Tests of the retries and the circuit breaker, against a flaky stub server"""
+
+import time
+
+import pytest
+import requests
+
+from conftest import Reply
+from jdma_client.jdma_lib import JdmaClient, JdmaCircuitOpenError
+
+
+def flaky(*replies):
+    """Reply with each of the replies in turn, then with 200 OK"""
+    replies = list(replies)
+    def respond(request):
+        if replies:
+            return replies.pop(0)
+        return Reply(200, {"requests" : []})
+    return respond
+
+
+def make_client(stub, **kwargs):
+    kwargs.setdefault("retries", 2)
+    kwargs.setdefault("backoff_factor", 0)
+    return JdmaClient(api_url=stub.url, user="test", **kwargs)
+
+
+def test_retry_5xx(stub):
+    stub.respond = flaky(Reply(503), Reply(502))
+    with make_client(stub) as client:
+        assert client.get_request("test").status_code == 200
+    assert len(stub.requests) == 3
+
+
+def test_retry_connection_reset(stub):
+    stub.respond = flaky(Reply(reset=True))
+    with make_client(stub) as client:
+        assert client.get_request("test").status_code == 200
+    assert len(stub.requests) == 2
+
+
+def test_retries_exhausted(stub):
+    stub.respond = lambda request: Reply(503)
+    with make_client(stub, circuit_breaker_failures=None) as client:
+        assert client.get_request("test").status_code == 503
+    assert len(stub.requests) == 3
+
+
+def test_post_not_retried_after_reset(stub):
+    # the server may have acted on the POST, so it is not sent again
+    stub.respond = flaky(Reply(reset=True))
+    with make_client(stub) as client:
+        with pytest.raises(requests.exceptions.ConnectionError):
+            client.download_files("test", batch_id=1)
+    assert len(stub.requests) == 1
+
+
+def test_circuit_breaker_opens(stub):
+    stub.respond = lambda request: Reply(500)
+    with make_client(stub, retries=0, circuit_breaker_failures=2) as client:
+        client.get_request("test")
+        client.get_request("test")
+        with pytest.raises(JdmaCircuitOpenError):
+            client.get_request("test")
+    # the server was not called once the breaker opened
+    assert len(stub.requests) == 2
+
+
+def test_circuit_breaker_half_open(stub):
+    stub.respond = flaky(Reply(500), Reply(500), Reply(500))
+    with make_client(stub, retries=0, circuit_breaker_failures=2,
+                     circuit_breaker_reset=0.2) as client:
+        client.get_request("test")
+        client.get_request("test")
+        with pytest.raises(JdmaCircuitOpenError):
+            client.get_request("test")
+        time.sleep(0.3)
+        # half open: one call is let through, and fails, so the breaker
+        # opens again
+        assert client.get_request("test").status_code == 500
+        with pytest.raises(JdmaCircuitOpenError):
+            client.get_request("test")
+        time.sleep(0.3)
+        # the call let through succeeds, so the breaker closes
+        assert client.get_request("test").status_code == 200
+        assert client.get_request("test").status_code == 200
+    assert len(stub.requests) == 5
+
+
+def test_circuit_breaker_shared_by_processes(stub, tmp_path):
+    # each client stands in for a separate jdma process
+    path = str(tmp_path / "circuit_breaker.json")
+    stub.respond = lambda request: Reply(500)
+    for i in range(2):
+        with make_client(stub, retries=0, circuit_breaker_failures=2,
+                         circuit_breaker_path=path) as client:
+            client.get_request("test")
+    with make_client(stub, retries=0, circuit_breaker_failures=2,
+                     circuit_breaker_path=path) as client:
+        with pytest.raises(JdmaCircuitOpenError):
+            client.get_request("test")
+    assert len(stub.requests) == 2
+    # a client for another server is not affected
+    other = JdmaClient(api_url=stub.url + "other/", user="test", retries=0,
+                       circuit_breaker_failures=2, circuit_breaker_path=path)
+    with other:
+        other.get_request("test")
+
+
+def test_circuit_breaker_closed_by_other_process(stub, tmp_path):
+    path = str(tmp_path / "circuit_breaker.json")
+    stub.respond = flaky(Reply(500))
+    with make_client(stub, retries=0, circuit_breaker_failures=2,
+                     circuit_breaker_path=path) as first:
+        first.get_request("test")
+        # another process succeeds, resetting the count of failures
+        with make_client(stub, retries=0, circuit_breaker_failures=2,
+                         circuit_breaker_path=path) as second:
+            second.get_request("test")
+        stub.respond = lambda request: Reply(500)
+        first.get_request("test")
+        assert first.get_request("test").status_code == 500
+        with pytest.raises(JdmaCircuitOpenError):
+            first.get_request("test")
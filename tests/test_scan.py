@@ -0,0 +1,155 @@
+"""Tests of the scanning of directories and the validation of filelists"""
+
+import os
+
+import pytest
+
+from jdma_client import jdma_scan
+from jdma_client.jdma_scan import scan_paths, validate_paths
+
+# root can read anything, so the permission errors cannot be tested as root
+as_root = hasattr(os, "geteuid") and os.geteuid() == 0
+
+
+def write(path, size=0):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as fh:
+        fh.write(b"x" * size)
+    return path
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """A directory tree of 3 levels, with 2 files in each directory"""
+    root = str(tmp_path / "data")
+    files = []
+    for d in ("", "a", "a/b", "c"):
+        for i in range(2):
+            files.append(write(os.path.join(root, d, "file_{}".format(i)),
+                               size=i + 1))
+    return root, files
+
+
+def test_scan_paths(tree):
+    root, files = tree
+    result = scan_paths([root], max_workers=4)
+    assert sorted(result.paths) == sorted(files)
+    # the root, a, a/b and c
+    assert result.n_dirs == 4
+    assert result.total_size == 4 * (1 + 2)
+    assert result.errors == []
+
+
+def test_scan_paths_files_and_missing(tree, tmp_path):
+    root, files = tree
+    missing = str(tmp_path / "missing")
+    result = scan_paths([files[0], missing])
+    assert result.paths == [files[0]]
+    assert result.n_dirs == 0
+    assert result.errors == [(missing, "No such file or directory")]
+
+
+def test_scan_paths_follows_links_in_paths(tree, tmp_path):
+    root, files = tree
+    link = str(tmp_path / "link")
+    os.symlink(os.path.join(root, "a"), link)
+    result = scan_paths([link])
+    assert sorted(result.paths) == sorted(
+        os.path.join(link, f)
+        for f in ("file_0", "file_1", "b/file_0", "b/file_1")
+    )
+    assert result.n_dirs == 2
+
+
+def test_scan_paths_does_not_follow_directory_links(tree, tmp_path):
+    root, files = tree
+    os.symlink(root, os.path.join(root, "a", "loop"))
+    result = scan_paths([root])
+    # the link is listed as a file, and the tree is not scanned again
+    assert len(result.paths) == len(files) + 1
+    assert result.n_dirs == 4
+
+
+@pytest.mark.skipif(as_root, reason="root can read any file")
+def test_scan_paths_unreadable(tree):
+    root, files = tree
+    os.chmod(files[0], 0)
+    os.chmod(os.path.join(root, "c"), 0)
+    try:
+        result = scan_paths([root])
+    finally:
+        os.chmod(files[0], 0o644)
+        os.chmod(os.path.join(root, "c"), 0o755)
+    assert sorted(result.errors) == sorted([
+        (files[0], "Permission denied"),
+        (os.path.join(root, "c"), "Permission denied"),
+    ])
+    # the unreadable file is not sent to the server
+    assert files[0] not in result.paths
+    assert len(result.paths) == len(files) - 3
+
+
+def test_validate_paths(tree):
+    root, files = tree
+    result = validate_paths(files + [root])
+    assert result.errors == []
+    assert sorted(result.paths) == sorted(files)
+    assert result.n_dirs == 1
+    assert result.total_size == 4 * (1 + 2)
+
+
+def test_validate_paths_errors(tree, tmp_path):
+    root, files = tree
+    broken = str(tmp_path / "broken")
+    os.symlink(str(tmp_path / "nowhere"), broken)
+    loop = str(tmp_path / "loop")
+    os.symlink(loop, loop)
+    missing = str(tmp_path / "missing")
+    relative = os.path.relpath(files[1])
+    result = validate_paths(
+        [files[0], broken, loop, missing, relative, files[0]]
+    )
+    assert sorted(result.errors) == sorted([
+        (files[0], "Duplicate path"),
+        (broken, "Broken symbolic link"),
+        (loop, "Symbolic link loop"),
+        (missing, "No such file or directory"),
+        (relative, "Not an absolute path"),
+    ])
+    # the duplicated file is still valid, once
+    assert result.paths == [files[0]]
+
+
+def test_validate_paths_follows_links(tree, tmp_path):
+    root, files = tree
+    link = str(tmp_path / "link")
+    os.symlink(files[1], link)
+    result = validate_paths([link])
+    assert result.errors == []
+    assert result.files[0][:2] == (link, 2)
+
+
+def test_validate_paths_in_chunks(tree, monkeypatch):
+    root, files = tree
+    monkeypatch.setattr(jdma_scan, "VALIDATE_CHUNK_SIZE", 3)
+    missing = [os.path.join(root, "missing_{}".format(i)) for i in range(4)]
+    result = validate_paths(files + missing, max_workers=2)
+    assert sorted(result.paths) == sorted(files)
+    assert sorted(p for p, e in result.errors) == sorted(missing)
+
+
+@pytest.mark.skipif(as_root, reason="root can read any file")
+def test_validate_paths_unreadable(tree):
+    root, files = tree
+    directory = os.path.join(root, "c")
+    os.chmod(files[0], 0)
+    os.chmod(directory, 0o600)
+    try:
+        result = validate_paths([files[0], directory])
+    finally:
+        os.chmod(files[0], 0o644)
+        os.chmod(directory, 0o755)
+    assert sorted(result.errors) == sorted([
+        (files[0], "Permission denied"),
+        (directory, "Permission denied"),
+    ])
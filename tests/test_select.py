@@ -0,0 +1,84 @@
+"""Tests of the selection of files from a batch to retrieve"""
+
+import re
+
+import pytest
+
+from jdma_client.jdma_select import compile_patterns, select_file_records
+
+BATCH = {"migration_id" : 1}
+ARCHIVES = [{"archive_id" : "1/archive_{}".format(i)} for i in range(3)]
+FILES = [
+    (ARCHIVES[0], "/data/run1/tas.nc", 10),
+    (ARCHIVES[0], "/data/run1/pr.nc", 20),
+    (ARCHIVES[1], "/data/run1/tmp/scratch.nc", 30),
+    (ARCHIVES[1], "/data/run2/tas.nc", 40),
+    (ARCHIVES[2], "/data/run2/README", 50),
+]
+
+
+def records():
+    for a, path, size in FILES:
+        yield BATCH, a, {"path" : path, "size" : size}
+
+
+def test_no_patterns():
+    assert compile_patterns(None) is None
+    assert compile_patterns([]) is None
+    selection = select_file_records(records())
+    assert selection.paths == [f[1] for f in FILES]
+    assert selection.n_files == len(FILES)
+    assert selection.total_size == 150
+    assert selection.archives == set(a["archive_id"] for a in ARCHIVES)
+
+
+@pytest.mark.parametrize("pattern, matches", [
+    # relative patterns match the end of the path
+    ("tas.nc", ["/data/run1/tas.nc", "/data/run2/tas.nc"]),
+    ("*.nc", ["/data/run1/tas.nc", "/data/run1/pr.nc",
+              "/data/run1/tmp/scratch.nc", "/data/run2/tas.nc"]),
+    ("tmp/*", ["/data/run1/tmp/scratch.nc"]),
+    ("run2/*", ["/data/run2/tas.nc", "/data/run2/README"]),
+    # absolute patterns match the whole path
+    ("/data/run1/*.nc", ["/data/run1/tas.nc", "/data/run1/pr.nc",
+                         "/data/run1/tmp/scratch.nc"]),
+    ("/tas.nc", []),
+    # a relative pattern matches whole path components only
+    ("as.nc", []),
+])
+def test_glob_patterns(pattern, matches):
+    match = compile_patterns([pattern])
+    assert [f[1] for f in FILES if match(f[1])] == matches
+
+
+def test_regex_patterns():
+    match = compile_patterns([r"run\d/tas", r"README$"], regex=True)
+    assert [f[1] for f in FILES if match(f[1])] == [
+        "/data/run1/tas.nc", "/data/run2/tas.nc", "/data/run2/README"
+    ]
+    with pytest.raises(re.error):
+        compile_patterns(["("], regex=True)
+
+
+def test_include_and_exclude():
+    selection = select_file_records(
+        records(), include=["*.nc"], exclude=["tmp/*", "/data/run2/*"]
+    )
+    assert selection.paths == ["/data/run1/tas.nc", "/data/run1/pr.nc"]
+    assert selection.n_files == len(FILES)
+    assert selection.total_size == 30
+    assert selection.archives == {"1/archive_0"}
+
+
+def test_exclude_only():
+    selection = select_file_records(records(), exclude=["*.nc"])
+    assert selection.paths == ["/data/run2/README"]
+    assert selection.archives == {"1/archive_2"}
+
+
+def test_regex_include_and_exclude():
+    selection = select_file_records(
+        records(), include=[r"\.nc$"], exclude=["scratch", "run2"],
+        regex=True
+    )
+    assert selection.paths == ["/data/run1/tas.nc", "/data/run1/pr.nc"]
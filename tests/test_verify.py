@@ -0,0 +1,176 @@
+"""Tests of the verification of the files retrieved from a batch"""
+
+import os
+import json
+import hashlib
+import argparse
+
+import pytest
+
+from jdma_client import jdma, jdma_lib
+from jdma_client.jdma_verify import (
+    verify_files, verify_paths, restored_path, file_digest
+)
+
+from conftest import Reply
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def files_listing(files, batch_id=1):
+    """The body of a files listing of a batch, with the (path, size, digest)
+       of each file"""
+    return {"migrations" : [{
+        "migration_id" : batch_id, "user" : "test", "workspace" : "ws",
+        "label" : "batch", "stage" : 2, "archives" : [{
+            "archive_id" : "{}/archive_0000".format(batch_id), "size" : 0,
+            "files" : [
+                {"path" : path, "size" : size, "digest" : digest,
+                 "digest_format" : "SHA256" if digest else None}
+                for path, size, digest in files
+            ]
+        }]
+    }]}
+
+
+@pytest.fixture
+def default_client(client):
+    jdma_lib.set_default_client(client)
+    yield client
+    jdma_lib.set_default_client(None)
+
+
+@pytest.fixture
+def batch(tmp_path):
+    """The files uploaded in a batch, as (path, contents) tuples, written to
+       their original paths"""
+    root = tmp_path / "data"
+    files = []
+    for name in ("a.nc", "run1/b.nc", "run1/run2/c.nc"):
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = name.encode("utf-8") * 100
+        path.write_bytes(data)
+        files.append((str(path), data))
+    return files
+
+
+def serve(stub, files, digests=True):
+    listing = files_listing([
+        (path, len(data), sha256(data) if digests else None)
+        for path, data in files
+    ])
+    stub.respond = lambda request: Reply(200, listing)
+
+
+def test_verify_files(stub, default_client, batch):
+    serve(stub, batch)
+    result = verify_files("test", 1, max_workers=1)
+    assert result.ok
+    assert (result.n_files, result.n_verified) == (3, 3)
+    assert result.total_size == sum(len(data) for path, data in batch)
+
+
+def test_verify_files_failures(stub, default_client, batch):
+    serve(stub, batch)
+    os.unlink(batch[0][0])
+    with open(batch[1][0], "r+b") as fh:
+        fh.write(b"x")
+    result = verify_files("test", 1, max_workers=1)
+    assert not result.ok
+    assert result.n_verified == 1
+    assert result.missing == [batch[0][0]]
+    assert result.corrupt == [(batch[1][0], "SHA256 digest mismatch")]
+
+
+def test_verify_files_without_digests(stub, default_client, batch):
+    serve(stub, batch, digests=False)
+    result = verify_files("test", 1, max_workers=1)
+    # no file was verified, so the batch is not verified
+    assert not result.ok
+    assert result.n_verified == 0
+    assert sorted(p for p, r in result.unchecked) == sorted(
+        path for path, data in batch
+    )
+    # some files without digests are reported, but do not fail the batch
+    path, data = batch[0]
+    result = verify_paths(
+        [(path, len(data), sha256(data), "SHA256"),
+         (batch[1][0], len(batch[1][1]), None, None),
+         (batch[2][0], len(batch[2][1]), "1234", "NOTAHASH")],
+        max_workers=1
+    )
+    assert result.ok
+    assert result.unchecked == [
+        (batch[1][0], "no digest"),
+        (batch[2][0], "unsupported digest format NOTAHASH"),
+    ]
+
+
+def test_restored_path():
+    assert restored_path("/data/run1/a.nc") == "/data/run1/a.nc"
+    assert restored_path("/data/run1/a.nc", "/restore") == (
+        "/restore/data/run1/a.nc"
+    )
+    assert restored_path("/data/run1/a.nc", "/restore", "/data") == (
+        "/restore/run1/a.nc"
+    )
+
+
+def test_verify_files_in_target(stub, default_client, batch, tmp_path):
+    serve(stub, batch)
+    # the files are retrieved to the target directory, relative to the
+    # common directory of the files in the batch
+    target = tmp_path / "restore"
+    for path, data in batch:
+        restored = target / os.path.relpath(path, str(tmp_path / "data"))
+        restored.parent.mkdir(parents=True, exist_ok=True)
+        restored.write_bytes(data)
+        os.unlink(path)
+    result = verify_files("test", 1, target_dir=str(target), max_workers=1)
+    assert result.ok
+    assert result.n_verified == 3
+    assert file_digest(str(target / "run1" / "b.nc")) == sha256(batch[1][1])
+    # the original paths are not checked
+    result = verify_files("test", 1, max_workers=1)
+    assert len(result.missing) == 3
+
+
+def verify_args(batch_id, **kwargs):
+    args = dict(
+        arg=str(batch_id), target="", json=True, no_cache=True,
+        filter="user", refresh=False
+    )
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+@pytest.mark.parametrize("digests, status", [(True, None), (False, 1)])
+def test_do_verify_exit_status(stub, default_client, batch, capsys, digests,
+                               status):
+    serve(stub, batch, digests=digests)
+    if status is None:
+        jdma.do_verify(verify_args(1))
+    else:
+        with pytest.raises(SystemExit) as e:
+            jdma.do_verify(verify_args(1))
+        assert e.value.code == status
+    output = json.loads(capsys.readouterr().out)
+    assert output["files"] == 3
+    assert output["verified"] == (3 if digests else 0)
+
+
+def test_do_verify_target(stub, default_client, batch, tmp_path, capsys,
+                          monkeypatch):
+    serve(stub, batch)
+    target = tmp_path / "restore"
+    for path, data in batch:
+        restored = target / os.path.relpath(path, str(tmp_path / "data"))
+        restored.parent.mkdir(parents=True, exist_ok=True)
+        restored.write_bytes(data)
+    # --target is relative to the current directory
+    monkeypatch.chdir(str(tmp_path))
+    jdma.do_verify(verify_args(1, target="restore", json=False))
+    assert "3 of 3 files verified" in capsys.readouterr().out
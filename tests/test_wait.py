@@ -0,0 +1,99 @@
+"""Tests of waiting for requests, when polls of the server fail"""
+
+import asyncio
+
+from jdma_client.jdma_lib import JdmaClient
+from jdma_client.aio import AsyncJdmaClient
+
+from conftest import Reply
+
+PUT_COMPLETED = 9
+
+
+def request(req_id, stage):
+    return Reply(200, {"request_id" : req_id, "stage" : stage})
+
+
+def replies(stub, sequences):
+    """Reply to the polls of each request id in turn with its sequence of
+       replies, repeating the last one"""
+    polls = dict((req_id, 0) for req_id in sequences)
+    def respond(r):
+        req_id = int(r.path.split("request_id=")[1])
+        sequence = sequences[req_id]
+        reply = sequence[min(polls[req_id], len(sequence) - 1)]
+        polls[req_id] += 1
+        return reply
+    stub.respond = respond
+    return polls
+
+
+def wait(stub, req_ids, timeout=5, **kwargs):
+    client = JdmaClient(api_url=stub.url, user="test", retries=0, **kwargs)
+    finished = []
+    try:
+        data = client.wait_for_requests(
+            "test", req_ids, timeout=timeout, poll_interval=0.01,
+            max_poll_interval=0.01, callback=finished.append
+        )
+    finally:
+        client.close()
+    return data, finished
+
+
+def test_wait_through_server_errors(stub):
+    polls = replies(stub, {
+        1 : [request(1, 0), Reply(503), Reply(503), request(1, PUT_COMPLETED)],
+        2 : [Reply(404, {"error" : "no request"})],
+    })
+    data, finished = wait(stub, [1, 2])
+    assert data[0] == {"request_id" : 1, "stage" : PUT_COMPLETED}
+    assert data[1]["error"] == "no request"
+    assert data[1]["status_code"] == 404
+    assert [d["request_id"] for d in finished] == [2, 1]
+    # the request that was not found is not polled again
+    assert polls == {1 : 4, 2 : 1}
+
+
+def test_wait_through_connection_errors(stub):
+    replies(stub, {
+        1 : [Reply(reset=True), request(1, 0), Reply(reset=True),
+             request(1, PUT_COMPLETED)],
+    })
+    data, finished = wait(stub, [1])
+    assert data == [{"request_id" : 1, "stage" : PUT_COMPLETED}]
+
+
+def test_wait_through_open_circuit(stub):
+    polls = replies(stub, {
+        1 : [Reply(503), request(1, PUT_COMPLETED)],
+    })
+    data, finished = wait(stub, [1], circuit_breaker_failures=1,
+                          circuit_breaker_reset=0.1)
+    assert data == [{"request_id" : 1, "stage" : PUT_COMPLETED}]
+    # the polls while the breaker was open did not reach the server
+    assert polls[1] == 2
+
+
+def test_wait_times_out_on_server_errors(stub):
+    replies(stub, {1 : [request(1, 0), Reply(503)]})
+    data, finished = wait(stub, [1], timeout=0.2)
+    assert data == [{"request_id" : 1, "stage" : 0,
+                     "error" : "Timed out waiting for request"}]
+    assert finished == []
+
+
+def test_async_wait_through_server_errors(stub):
+    replies(stub, {
+        1 : [request(1, 0), Reply(503), Reply(reset=True),
+             request(1, PUT_COMPLETED)],
+    })
+    async def wait():
+        async with AsyncJdmaClient(api_url=stub.url, user="test",
+                                   retries=0) as client:
+            return await client.wait_for_requests(
+                "test", [1], timeout=5, poll_interval=0.01,
+                max_poll_interval=0.01
+            )
+    data = asyncio.run(wait())
+    assert data == [{"request_id" : 1, "stage" : PUT_COMPLETED}]